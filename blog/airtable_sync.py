@@ -0,0 +1,119 @@
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .due_scheduler import notify_schedule_changed
+from .models import AirtableRecord, AirtableSyncState
+
+# The publisher reads due posts from the AirtableRecord mirror instead of asking Airtable every
+# minute. The mirror is refreshed with only the records modified since the last sync (plus a
+# little overlap for clock skew), and rebuilt in full now and then to drop deleted records. Due
+# records are read from Airtable once more right before they are published, see refresh_records.
+AIRTABLE_TABLE_NAME = 'Blog Posts'
+AIRTABLE_PAGE_SIZE = 100
+MIRRORED_FIELDS = {
+    'Title': 'title',
+    'Content': 'content',
+    'Status': 'status',
+    'Publish Date': 'publish_date',
+    'WordPress Post ID': 'wordpress_post_id',
+}
+SYNC_OVERLAP = timedelta(minutes=1)
+REFRESH_BATCH_SIZE = 50  # record ids per filterByFormula, keeps the URL well under Airtable's limit
+
+
+def fetch_records(client, airtable_url, headers, limiter, params, endpoint='airtable.list'):
+    params = {**params, 'pageSize': AIRTABLE_PAGE_SIZE}
+    records = []
+    while True:
+        limiter.wait()
+        response = client.get(airtable_url, endpoint=endpoint, headers=headers, params=params)
+        response.raise_for_status()
+        page = response.json()
+        records.extend(page.get('records', []))
+        if not page.get('offset'):
+            return records
+        params['offset'] = page['offset']
+
+
+def mirror_values(fields):
+    # Airtable leaves empty fields out of the response altogether
+    values = {}
+    for airtable_name, name in MIRRORED_FIELDS.items():
+        if airtable_name not in fields:
+            continue
+        value = fields.get(airtable_name)
+        if name == 'publish_date':
+            value = parse_datetime(value) if value else None
+        elif value is None:
+            value = ''
+        values[name] = str(value) if name == 'wordpress_post_id' else value
+    return values
+
+
+def mirror_records(records):
+    """Stores whole records as Airtable returned them, e.g. from a list or create call."""
+    rows = [
+        AirtableRecord(record_id=record['id'], **mirror_values({name: record['fields'].get(name) for name in MIRRORED_FIELDS}))
+        for record in records
+    ]
+    AirtableRecord.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['record_id'],
+        update_fields=list(MIRRORED_FIELDS.values()) + ['synced_at'],
+    )
+    if rows:
+        notify_schedule_changed()
+
+
+def mirror_updates(updates):
+    """Applies the (record_id, fields) pairs we just PATCHed, leaving the other fields alone."""
+    for record_id, fields in updates:
+        AirtableRecord.objects.filter(record_id=record_id).update(synced_at=timezone.now(), **mirror_values(fields))
+
+
+def forget_records(record_ids):
+    AirtableRecord.objects.filter(record_id__in=list(record_ids)).delete()
+
+
+def refresh_records(client, airtable_url, headers, limiter, record_ids):
+    """Re-reads the given records into the mirror; the ones deleted in Airtable are dropped from it."""
+    found = []
+    for start in range(0, len(record_ids), REFRESH_BATCH_SIZE):
+        batch = record_ids[start:start + REFRESH_BATCH_SIZE]
+        formula = 'OR(' + ', '.join(f"RECORD_ID() = '{record_id}'" for record_id in batch) + ')'
+        params = {'fields[]': list(MIRRORED_FIELDS), 'filterByFormula': formula}
+        found.extend(fetch_records(client, airtable_url, headers, limiter, params, endpoint='airtable.refresh'))
+    mirror_records(found)
+    forget_records(set(record_ids) - {record['id'] for record in found})
+
+
+def sync_airtable(client, airtable_url, headers, limiter, force=False):
+    """Refreshes the mirror if it is due; returns the number of records fetched, or None if skipped."""
+    state, _ = AirtableSyncState.objects.get_or_create(table_name=AIRTABLE_TABLE_NAME)
+    now = timezone.now()
+    full_interval = timedelta(seconds=getattr(settings, 'AIRTABLE_FULL_SYNC_INTERVAL', 60 * 60 * 24))
+    full = state.full_synced_at is None or state.full_synced_at < now - full_interval
+    interval = timedelta(seconds=getattr(settings, 'AIRTABLE_SYNC_INTERVAL', 60 * 5))
+    if not (force or full) and state.synced_at and state.synced_at > now - interval:
+        return None
+
+    params = {'fields[]': list(MIRRORED_FIELDS)}
+    if not full:
+        since = (state.synced_at - SYNC_OVERLAP).astimezone(dt_timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+        params['filterByFormula'] = f"IS_AFTER(LAST_MODIFIED_TIME(), '{since}')"
+    records = fetch_records(client, airtable_url, headers, limiter, params)
+    mirror_records(records)
+    if full:
+        AirtableRecord.objects.exclude(record_id__in=[record['id'] for record in records]).delete()
+        state.full_synced_at = now
+    state.synced_at = now
+    state.save()
+    return len(records)
+
+
+def due_records(now=None):
+    return AirtableRecord.objects.filter(
+        status__in=['Scheduled', 'Publishing'], publish_date__lte=now or timezone.now()
+    ).order_by('publish_date')
@@ -4,3 +4,6 @@ class BlogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'blog'
 
+    def ready(self):
+        import blog.signals
+
@@ -2,13 +2,39 @@ from django.shortcuts import render, redirect
 from django.views.generic import View
 from blog.models import Post
 from django.contrib.auth.mixins import LoginRequiredMixin
-import google.generativeai as genai
 from decouple import config
-import requests
 import json
 from datetime import datetime
+from . import http_client
+from .airtable_sync import mirror_records
+from .grammar import fix_grammar
+from .drafts import BLOGCRAFT_DRAFTS, clear_drafts, load_drafts, push_draft
+from .jobs import enqueue_generation, sync_generation_job
+
+BLOGCRAFT_FIELDS = [
+    'topic', 'primary_keyword', 'additional_keywords',
+    'prompt_1', 'prompt_2', 'prompt_3', 'prompt_4', 'prompt_5',
+]
+
+
+def build_generate_prompt(prompt_1, primary_keyword, additional_keywords):
+    return (
+        f"{prompt_1} Ensure the article uses the primary keyword '{primary_keyword}' "
+        f"1-2 times. Include additional keywords '{additional_keywords}' naturally. "
+        f"Start the article with a markdown heading (e.g., # Article Title) for the title."
+    )
+
+
+def build_refine_prompt(prev_draft, current_prompt, primary_keyword, additional_keywords, feedback=''):
+    prompt = (
+        f"Refine this article: '{prev_draft}' based on feedback: '{current_prompt}'. "
+        f"Maintain the primary keyword '{primary_keyword}' usage and include additional keywords '{additional_keywords}' naturally. "
+        f"Ensure the article starts with a markdown heading (e.g., # Article Title) for the title."
+    )
+    if feedback:
+        prompt += f" Additional user feedback: '{feedback}'. Incorporate this feedback as well."
+    return prompt
 
-genai.configure(api_key=config('GEMINI_API_KEY'))
 
 class BlogCraftView(LoginRequiredMixin, View):
     template_name = 'blog/blogcraft.html'
@@ -16,7 +42,8 @@ class BlogCraftView(LoginRequiredMixin, View):
 
     def get(self, request, *args, **kwargs):
         print("GET: Clearing session data")
-        drafts = request.session.get('prompt_tier_drafts', [])
+        pending_job = sync_generation_job(request)
+        drafts = load_drafts(request.session, BLOGCRAFT_DRAFTS)
         current_refine_step = request.session.get('current_refine_step', 1)
         return render(request, self.template_name, {
             'topic': request.session.get('topic', ''),
@@ -32,6 +59,7 @@ class BlogCraftView(LoginRequiredMixin, View):
             'current_refine_step': current_refine_step,
             'grammar_checked': request.session.get('grammar_checked', False),
             'grammar_result': request.session.get('grammar_result', ''),
+            'pending_job': pending_job,
         })
       
     def post(self, request, *args, **kwargs):
@@ -50,7 +78,8 @@ class BlogCraftView(LoginRequiredMixin, View):
         feedback = request.POST.get('feedback', '').strip()
         action = request.POST.get('action')
         publish_date = request.POST.get('publish_date', '').strip()  # New field for scheduling
-        drafts = request.session.get('prompt_tier_drafts', [])
+        pending_job = sync_generation_job(request)
+        drafts = load_drafts(request.session, BLOGCRAFT_DRAFTS)
         current_refine_step = request.session.get('current_refine_step', 1)
         grammar_checked = request.session.get('grammar_checked', False)
         print(f"Action: {action}, Drafts before: {drafts}, Current refine step: {current_refine_step}, Grammar checked: {grammar_checked}")
@@ -68,7 +97,10 @@ class BlogCraftView(LoginRequiredMixin, View):
         print(f"Saved to session - prompts: {[prompt_1, prompt_2, prompt_3, prompt_4, prompt_5]}")
 
         # Handling actions
-        if action == 'generate':
+        if pending_job is not None:
+            request.session['error'] = "Your draft is still being generated. Please wait for it to finish."
+
+        elif action == 'generate':
             print("POST: Generate button clicked")
             drafts = []
             current_refine_step = 1
@@ -77,21 +109,9 @@ class BlogCraftView(LoginRequiredMixin, View):
             if not topic or not primary_keyword or not prompt_1:
                 request.session['error'] = "Please provide a topic, primary keyword, and at least Prompt 1."
             else:
-                prompt = (
-                    f"{prompt_1} Ensure the article uses the primary keyword '{primary_keyword}' "
-                    f"1-2 times. Include additional keywords '{additional_keywords}' naturally. "
-                    f"Start the article with a markdown heading (e.g., # Article Title) for the title."
-                )
-                model = genai.GenerativeModel('gemini-1.5-flash')
-                try:
-                    response = model.generate_content(prompt)
-                    draft_1 = response.text.strip()
-                    drafts.append({'content': draft_1})
-                    print(f"Generated draft 1: {draft_1}")
-                except Exception as e:
-                    request.session['error'] = f"Error generating content: {str(e)}"
-                    print(f"Error generating draft 1: {str(e)}")
-            request.session['prompt_tier_drafts'] = drafts
+                prompt = build_generate_prompt(prompt_1, primary_keyword, additional_keywords)
+                enqueue_generation(request, 'blogcraft', action, prompt)
+            clear_drafts(request.session, BLOGCRAFT_DRAFTS)
             request.session['current_refine_step'] = current_refine_step
             request.session['grammar_checked'] = grammar_checked
 
@@ -109,24 +129,8 @@ class BlogCraftView(LoginRequiredMixin, View):
                         request.session['error'] = f"Please provide feedback in Prompt {current_refine_step}."
                     else:
                         prev_draft = drafts[-1]['content']
-                        prompt = (
-                            f"Refine this article: '{prev_draft}' based on feedback: '{current_prompt}'. "
-                            f"Maintain the primary keyword '{primary_keyword}' usage and include additional keywords '{additional_keywords}' naturally. "
-                            f"Ensure the article starts with a markdown heading (e.g., # Article Title) for the title."
-                        )
-                        if feedback:
-                            prompt += f" Additional user feedback: '{feedback}'. Incorporate this feedback as well."
-                        model = genai.GenerativeModel('gemini-1.5-flash')
-                        try:
-                            response = model.generate_content(prompt)
-                            new_draft = response.text.strip()
-                            drafts[-1] = {'content': new_draft}
-                            print(f"Refined draft with Prompt {current_refine_step}: {new_draft}")
-                            current_refine_step += 1
-                        except Exception as e:
-                            request.session['error'] = f"Error refining content: {str(e)}"
-                            print(f"Error refining with Prompt {current_refine_step}: {str(e)}")
-            request.session['prompt_tier_drafts'] = drafts
+                        prompt = build_refine_prompt(prev_draft, current_prompt, primary_keyword, additional_keywords, feedback)
+                        enqueue_generation(request, 'blogcraft', action, prompt, step=current_refine_step)
             request.session['current_refine_step'] = current_refine_step
             
         elif action == 'check_grammar':
@@ -138,27 +142,12 @@ class BlogCraftView(LoginRequiredMixin, View):
                 if "Error" in final_draft:
                     request.session['error'] = "Cannot check grammar due to previous errors."
                 else:
-                    url = "https://api.languagetool.org/v2/check"
-                    data = {
-                        'text': final_draft,
-                        'language': 'en-US'
-                    }
                     try:
-                        response = requests.post(url, data=data)
-                        result = response.json()
-                        matches = result.get('matches', [])
-                        if matches:
-                            fixed_text = final_draft
-                            offset_shift = 0
-                            for match in matches:
-                                start = match['offset'] + offset_shift
-                                length = match['length']
-                                replacement = match['replacements'][0]['value'] if match['replacements'] else fixed_text[start:start+length]
-                                fixed_text = fixed_text[:start] + replacement + fixed_text[start+length:]
-                                offset_shift += len(replacement) - length
-                            drafts[-1] = {'content': fixed_text}
-                            request.session['grammar_result'] = f"Applied {len(matches)} grammar fixes."
-                            print(f"Applied {len(matches)} grammar fixes.")
+                        fixed_text, fixes = fix_grammar(final_draft)
+                        if fixes:
+                            push_draft(request.session, request.user, BLOGCRAFT_DRAFTS, fixed_text, replace=True)
+                            request.session['grammar_result'] = f"Applied {fixes} grammar fixes."
+                            print(f"Applied {fixes} grammar fixes.")
                         else:
                             request.session['grammar_result'] = "No grammar issues found."
                             print("No grammar issues found.")
@@ -167,7 +156,6 @@ class BlogCraftView(LoginRequiredMixin, View):
                         request.session['error'] = f"Grammar check failed: {str(e)}"
                         request.session['grammar_result'] = f"Grammar check failed: {str(e)}"
                         print(f"Error in grammar zap: {str(e)}")
-            request.session['prompt_tier_drafts'] = drafts 
             request.session['grammar_checked'] = grammar_checked
 
         elif action == 'publish':
@@ -184,26 +172,10 @@ class BlogCraftView(LoginRequiredMixin, View):
                 else:
                     # Applying grammar zap if not already done
                     if not grammar_checked:
-                        url = "https://api.languagetool.org/v2/check"
-                        data = {
-                            'text': final_draft,
-                            'language': 'en-US'
-                        }
                         try:
-                            response = requests.post(url, data=data)
-                            result = response.json()
-                            matches = result.get('matches', [])
-                            if matches:
-                                fixed_text = final_draft
-                                offset_shift = 0
-                                for match in matches:
-                                    start = match['offset'] + offset_shift
-                                    length = match['length']
-                                    replacement = match['replacements'][0]['value'] if match['replacements'] else fixed_text[start:start+length]
-                                    fixed_text = fixed_text[:start] + replacement + fixed_text[start+length:]
-                                    offset_shift += len(replacement) - length
-                                final_draft = fixed_text
-                                print(f"Applied {len(matches)} grammar fixes during publish.")
+                            final_draft, fixes = fix_grammar(final_draft)
+                            if fixes:
+                                print(f"Applied {fixes} grammar fixes during publish.")
                             else:
                                 print("No grammar issues found during publish.")
                         except Exception as e:
@@ -281,13 +253,14 @@ class BlogCraftView(LoginRequiredMixin, View):
                     }
 
                     try:
-                        response = requests.post(airtable_url, headers=headers, json=data)
+                        response = http_client.get_client().post(airtable_url, endpoint='airtable.create', headers=headers, json=data)
                         print(f"Airtable response status code: {response.status_code}")
                         print(f"Airtable response text: {response.text}")
                         if response.status_code == 200:
                             print(f"Blog scheduled in Airtable: {generated_title}")
+                            mirror_records(response.json().get('records', []))
                             # Clearing session data after successful scheduling
-                            request.session['prompt_tier_drafts'] = []
+                            clear_drafts(request.session, BLOGCRAFT_DRAFTS)
                             request.session['topic'] = ''
                             request.session['primary_keyword'] = ''
                             request.session['additional_keywords'] = ''
@@ -308,9 +281,11 @@ class BlogCraftView(LoginRequiredMixin, View):
                     except Exception as e:
                         request.session['error'] = f"Error sending to Airtable: {str(e)}"
                         print(f"Error sending to Airtable: {str(e)}")
-            request.session['prompt_tier_drafts'] = drafts
         
         request.session.modified = True
+        pending_job = pending_job or sync_generation_job(request)
+        drafts = load_drafts(request.session, BLOGCRAFT_DRAFTS)
+        current_refine_step = request.session.get('current_refine_step', 1)
         print(f"Drafts after: {drafts}, Current refine step: {current_refine_step}, Grammar checked: {grammar_checked}")
         return render(request, self.template_name, {
             'topic': topic,
@@ -326,6 +301,7 @@ class BlogCraftView(LoginRequiredMixin, View):
             'current_refine_step': current_refine_step,
             'grammar_checked': grammar_checked,
             'grammar_result': request.session.get('grammar_result', ''),
+            'pending_job': pending_job,
         })
         
         
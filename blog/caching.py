@@ -0,0 +1,246 @@
+import hashlib
+import time
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template import engines
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .models import Post
+
+# Versioned keys: writers bump the version instead of deleting entries, so readers on
+# every worker move to a fresh key at once and stale entries simply expire.
+POSTS_VERSION_KEY = 'blog:posts:version'
+LATEST_POSTS_KEY = 'blog:latest_posts:{version}'
+LATEST_POSTS_COUNT = 5
+LATEST_POSTS_TIMEOUT = 60 * 60
+
+# Page cache scopes, each one purged on its own when a post changes
+LIST_PAGES_VERSION_KEY = 'blog:pages:list:version'
+AUTHOR_PAGES_VERSION_KEY = 'blog:pages:author:{username}:version'
+POST_PAGES_VERSION_KEY = 'blog:pages:post:{pk}:version'
+# Feeds and sitemaps (blog/feeds.py): the feeds share the list and author scopes above, the
+# sitemap has one scope per shard of post ids plus one for the index
+SITEMAP_SHARD_SIZE = 50000
+SITEMAP_INDEX_VERSION_KEY = 'blog:sitemap:index:version'
+SITEMAP_SHARD_VERSION_KEY = 'blog:sitemap:{shard}:version'
+FEEDS_VERSION_KEY = 'blog:feeds:version'
+PAGE_KEY = 'blog:page:{scope}:{version}:{sidebar}:{release}:{query}'
+PAGE_CACHE_TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 60 * 15)
+PAGE_CACHE_STATS_KEY = 'blog:page_cache:{counter}'
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # Seeding with the clock keeps a re-created version ahead of any evicted one
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), None)
+        return cache.get(key)
+
+
+def get_latest_posts():
+    key = LATEST_POSTS_KEY.format(version=get_version(POSTS_VERSION_KEY))
+    latest_posts = cache.get(key)
+    if latest_posts is None:
+        latest_posts = list(
+            Post.objects.order_by('-date_posted').values('id', 'title')[:LATEST_POSTS_COUNT]
+        )
+        cache.set(key, latest_posts, LATEST_POSTS_TIMEOUT)
+    return latest_posts
+
+
+def invalidate_latest_posts():
+    bump_version(POSTS_VERSION_KEY)
+
+
+def sidebar_affected_by(post, created=False):
+    # Every cached page embeds the sidebar, so only bump it when this post is (or now belongs) in it
+    if created:
+        return True
+    latest_posts = cache.get(LATEST_POSTS_KEY.format(version=get_version(POSTS_VERSION_KEY)))
+    if latest_posts is None or len(latest_posts) < LATEST_POSTS_COUNT:
+        return True
+    if post.pk in [p['id'] for p in latest_posts]:
+        return True
+    oldest = Post.objects.filter(pk=latest_posts[-1]['id']).values_list('date_posted', flat=True).first()
+    return oldest is None or post.date_posted >= oldest
+
+
+@lru_cache(maxsize=None)
+def release_version():
+    """Part of every page and feed key (and so of their ETags), so a deploy never serves or
+    revalidates markup rendered by the previous templates."""
+    if getattr(settings, 'RELEASE_VERSION', ''):
+        return settings.RELEASE_VERSION
+    digest = hashlib.md5()
+    for directory in sorted({str(d) for engine in engines.all() for d in engine.template_dirs}):
+        for path in sorted(Path(directory).rglob('*')):
+            if path.is_file():
+                digest.update(str(path.relative_to(directory)).encode())
+                digest.update(path.read_bytes())
+    return digest.hexdigest()[:12]
+
+
+def sitemap_shard(pk):
+    return (pk - 1) // SITEMAP_SHARD_SIZE + 1
+
+
+def purge_sitemap(pks):
+    bump_version(SITEMAP_INDEX_VERSION_KEY)
+    for shard in {sitemap_shard(pk) for pk in pks}:
+        bump_version(SITEMAP_SHARD_VERSION_KEY.format(shard=shard))
+
+
+def purge_post_pages(post, created=False, deleted=False):
+    if deleted or sidebar_affected_by(post, created=created):
+        invalidate_latest_posts()
+    bump_version(LIST_PAGES_VERSION_KEY)
+    bump_version(POST_PAGES_VERSION_KEY.format(pk=post.pk))
+    if post.author_id:
+        bump_version(AUTHOR_PAGES_VERSION_KEY.format(username=post.author.username))
+    purge_sitemap([post.pk])
+
+
+def purge_created_posts(posts):
+    # bulk_create skips post_save, so callers purge once for the whole batch instead
+    if not posts:
+        return
+    invalidate_latest_posts()
+    bump_version(LIST_PAGES_VERSION_KEY)
+    author_ids = {post.author_id for post in posts if post.author_id}
+    for username in User.objects.filter(pk__in=author_ids).values_list('username', flat=True):
+        bump_version(AUTHOR_PAGES_VERSION_KEY.format(username=username))
+    purge_sitemap([post.pk for post in posts])
+
+
+def purge_author_pages(user):
+    # Usernames and avatars show next to every post of the author, on lists, post pages and feeds
+    if Post.objects.filter(author=user).exists():
+        purge_all_pages()
+
+
+def purge_all_pages():
+    # Every cached page's key includes the sidebar version, every feed's the feeds version
+    invalidate_latest_posts()
+    bump_version(FEEDS_VERSION_KEY)
+
+
+def get_page_cache_key(scope, version_key, request):
+    query = hashlib.md5(request.GET.urlencode().encode()).hexdigest()
+    return PAGE_KEY.format(
+        scope=scope,
+        version=get_version(version_key),
+        sidebar=get_version(POSTS_VERSION_KEY),
+        release=release_version(),
+        query=query,
+    )
+
+
+def is_cacheable_request(request):
+    # Only anonymous readers share pages; a pending flash message makes the page personal
+    return (
+        request.method == 'GET'
+        and not request.user.is_authenticated
+        and 'messages' not in request.COOKIES
+    )
+
+
+def incr_counter(key, delta=1):
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        pass
+
+
+def hit_rate_stats(key_format):
+    keys = {counter: key_format.format(counter=counter) for counter in ('hits', 'misses')}
+    stats = cache.get_many(list(keys.values()))
+    hits = stats.get(keys['hits'], 0)
+    misses = stats.get(keys['misses'], 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else 0.0,
+    }
+
+
+def record_page_cache(counter):
+    incr_counter(PAGE_CACHE_STATS_KEY.format(counter=counter))
+
+
+def page_cache_stats():
+    return hit_rate_stats(PAGE_CACHE_STATS_KEY)
+
+
+class AnonymousPageCacheMixin:
+    # Both are formatted with the URL kwargs, e.g. page_cache_scope = 'post:{pk}'
+    page_cache_scope = None
+    page_cache_version_key = None
+    page_cache_timeout = PAGE_CACHE_TIMEOUT
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.page_cache_scope is None or cls.page_cache_version_key is None:
+            raise TypeError(f'{cls.__name__} must set page_cache_scope and page_cache_version_key')
+
+    def get_page_cache_key(self):
+        return get_page_cache_key(
+            self.page_cache_scope.format(**self.kwargs),
+            self.page_cache_version_key.format(**self.kwargs),
+            self.request,
+        )
+
+    def dispatch(self, request, *args, **kwargs):
+        if not is_cacheable_request(request):
+            return super().dispatch(request, *args, **kwargs)
+
+        # The page cache key names every version the page depends on, so it doubles as the ETag
+        # and a revalidation with If-None-Match costs no query at all. Last-Modified is when the
+        # cached copy was built, like the feeds: the post's own updated_at doesn't move when the
+        # sidebar, the author or the release changes the page, so a miss is always rendered.
+        key = self.get_page_cache_key()
+        etag = quote_etag(hashlib.md5(key.encode()).hexdigest())
+        if request.headers.get('If-None-Match'):
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                not_modified['ETag'] = etag
+                return not_modified
+
+        cached = cache.get(key)
+        if cached is not None:
+            record_page_cache('hits')
+            content, content_type, built_at = cached
+            response = HttpResponse(content, content_type=content_type)
+            return conditional_page(request, response, etag, built_at)
+
+        record_page_cache('misses')
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+        if hasattr(response, 'render'):
+            response.render()
+        built_at = int(time.time())
+        cache.set(key, (response.content, response['Content-Type'], built_at), self.page_cache_timeout)
+        return conditional_page(request, response, etag, built_at)
+
+
+def conditional_page(request, response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return get_conditional_response(request, etag=etag, last_modified=last_modified, response=response)
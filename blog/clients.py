@@ -0,0 +1,61 @@
+import threading
+
+from decouple import config
+
+# External API clients are built on first use instead of at import time, so web workers, manage.py
+# commands and tests don't import google-generativeai or pyairtable (or need their keys) until a
+# request actually talks to Gemini or Airtable. Each client is built once per process.
+AIRTABLE_BASE_ID = "appxq6U5GJiWQ2CF5"
+AIRTABLE_TABLE_NAME = "Blog Posts"
+
+_providers = {}
+_instances = {}
+_lock = threading.Lock()
+
+
+def provider(name):
+    def register(factory):
+        _providers[name] = factory
+        return factory
+    return register
+
+
+def get(name):
+    try:
+        return _instances[name]
+    except KeyError:
+        pass
+    with _lock:
+        if name not in _instances:
+            try:
+                factory = _providers[name]
+            except KeyError:
+                raise ValueError(f"Unknown client '{name}', expected one of: {', '.join(_providers)}")
+            _instances[name] = factory()
+    return _instances[name]
+
+
+def reset(name=None):
+    """Forgets built clients (all of them, or one) so the next get() builds them again."""
+    with _lock:
+        if name is None:
+            _instances.clear()
+        else:
+            _instances.pop(name, None)
+
+
+def is_loaded(name):
+    return name in _instances
+
+
+@provider('gemini')
+def gemini():
+    import google.generativeai as genai
+    genai.configure(api_key=config('GEMINI_API_KEY'))
+    return genai
+
+
+@provider('airtable')
+def airtable():
+    from pyairtable import Table
+    return Table(config('AIRTABLE_API_KEY'), AIRTABLE_BASE_ID, AIRTABLE_TABLE_NAME)
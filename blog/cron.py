@@ -1,81 +1,170 @@
-import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 from decouple import config
-from datetime import datetime
-import pytz
+from django.utils.text import slugify
+from blog.airtable_sync import due_records, forget_records, mirror_updates, refresh_records, sync_airtable
+from blog.http_client import get_client
+from blog.ratelimit import get_rate_limiter
+
+# Airtable takes at most 10 records per batch update and 5 requests per second per base
+AIRTABLE_BATCH_SIZE = 10
+AIRTABLE_REQUESTS_PER_SECOND = 5
+# What Airtable answers when a record in the batch was deleted
+MISSING_RECORD_STATUSES = (404, 422)
+
+
+def batched(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def update_records(client, airtable_url, headers, limiter, updates):
+    """Writes (record_id, fields) pairs back in batches; returns the ids of the records saved."""
+    saved = []
+    for batch in batched(updates, AIRTABLE_BATCH_SIZE):
+        data = {
+            'records': [{'id': record_id, 'fields': fields} for record_id, fields in batch],
+            'typecast': True,  # lets the "Publishing" status option be created on first use
+        }
+        try:
+            limiter.wait()
+            response = client.patch(airtable_url, endpoint='airtable.update', headers=headers, json=data)
+            if response.status_code in MISSING_RECORD_STATUSES:
+                if len(batch) > 1:
+                    # One deleted record fails its whole batch, so the others are written one by one
+                    for update in batch:
+                        saved += update_records(client, airtable_url, headers, limiter, [update])
+                    continue
+                forget_records([batch[0][0]])
+                print(f"Airtable record {batch[0][0]} no longer exists, dropped it from the mirror.")
+                continue
+            response.raise_for_status()
+            mirror_updates(batch)
+            saved += [record_id for record_id, _ in batch]
+        except Exception as e:
+            print(f"Error updating Airtable records {[record_id for record_id, _ in batch]}: {str(e)}")
+    return saved
+
+
+def wordpress_slug(record):
+    # The Airtable record id makes the slug unique to the record, so a crashed run can find the
+    # post it created even when another record has the same title (or one that slugifies to '')
+    base = slugify(record['fields'].get('Title', ''))
+    record_id = record['id'].lower()
+    return f"{base}-{record_id}" if base else record_id
+
+
+def find_wordpress_post(client, wordpress_url, wp_auth, slug):
+    # Only asked for records a crashed run left in "Publishing": was the post created before the crash?
+    response = client.get(
+        wordpress_url, endpoint='wordpress.lookup', auth=wp_auth,
+        params={'slug': slug, 'status': 'publish,future,draft,pending,private', 'context': 'edit'},
+    )
+    response.raise_for_status()
+    for post in response.json():
+        if post.get('slug') == slug:
+            return post['id']
+    return None
+
+
+def publish_record(client, wordpress_url, wp_auth, record):
+    fields = record['fields']
+    title = fields.get('Title', '')
+    content = fields.get('Content', '')
+    slug = wordpress_slug(record)
+    if fields.get('Status') == 'Publishing':
+        wp_post_id = find_wordpress_post(client, wordpress_url, wp_auth, slug)
+        if wp_post_id is not None:
+            print(f"Already on WordPress: {title}, Post ID: {wp_post_id}")
+            return wp_post_id
+
+    wp_data = {
+        'title': title,
+        'content': content,
+        'slug': slug,
+        'status': 'publish'
+    }
+    wp_response = client.post(
+        wordpress_url, endpoint='wordpress.create', headers={'Content-Type': 'application/json'},
+        auth=wp_auth, json=wp_data,
+    )
+    wp_response.raise_for_status()
+    wp_post_id = wp_response.json().get('id')
+    print(f"Published to WordPress: {title}, Post ID: {wp_post_id}")
+    return wp_post_id
+
 
 def publish_scheduled_blogs():
     print("Cron job running: Checking for blogs to publish...")
 
     # Airtable configuration
-    
+
     airtable_api_key = config('AIRTABLE_API_KEY')
     airtable_base_id = config('AIRTABLE_BASE_ID')
     airtable_table_name = 'Blog Posts'
     airtable_url = f"https://api.airtable.com/v0/{airtable_base_id}/{airtable_table_name}"
 
     # WordPress configuration
-    wordpress_url = config('WORDPRESS_URL')  
+    wordpress_url = config('WORDPRESS_URL')
     wordpress_username = config('WORDPRESS_USERNAME')
     wordpress_password = config('WORDPRESS_PASSWORD')
+    wordpress_concurrency = config('WORDPRESS_CONCURRENCY', default=4, cast=int)
+    wp_auth = (wordpress_username, wordpress_password)
 
-    # Getting the current time in UTC
-    current_time = datetime.utcnow().replace(tzinfo=pytz.UTC)
-
-    # Fetching the records from Airtable
+    client = get_client()
+    limiter = get_rate_limiter('airtable', AIRTABLE_REQUESTS_PER_SECOND)
     headers = {
         'Authorization': f'Bearer {airtable_api_key}',
         'Content-Type': 'application/json'
     }
-    params = {
-        'filterByFormula': 'AND({Status} = "Scheduled", {Publish Date} <= NOW())',
-        'sort[0][field]': 'Publish Date',
-        'sort[0][direction]': 'asc'
-    }
+
+    # Refreshing the local mirror (only records changed since the last sync, and not on every run)
+    try:
+        fetched = sync_airtable(client, airtable_url, headers, limiter)
+        if fetched is not None:
+            print(f"Synced {fetched} changed records from Airtable.")
+    except Exception as e:
+        print(f"Error syncing records from Airtable: {str(e)}")
+
+    # "Publishing" records were claimed by a run that never finished, so they are picked up again.
+    # The mirror may be minutes behind on edits and a day behind on deletions, so the due records
+    # are read from Airtable again before anything is claimed.
+    due_ids = list(due_records().values_list('record_id', flat=True))
+    if not due_ids:
+        return
     try:
-        response = requests.get(airtable_url, headers=headers, params=params)
-        response.raise_for_status()
-        records = response.json().get('records', [])
-        print(f"Found {len(records)} scheduled blogs to publish.")
+        refresh_records(client, airtable_url, headers, limiter, due_ids)
     except Exception as e:
-        print(f"Error fetching records from Airtable: {str(e)}")
+        print(f"Error refreshing due records from Airtable, leaving them for the next run: {str(e)}")
         return
+    records = [record.as_record() for record in due_records().filter(record_id__in=due_ids)]
+    if not records:
+        return
+    print(f"Found {len(records)} scheduled blogs to publish.")
 
-    # Processing each record
-    for record in records:
-        record_id = record['id']
-        fields = record['fields']
-        title = fields.get('Title', '')
-        content = fields.get('Content', '')
+    # Claiming the records first, so if this run dies they are checked against WordPress before a retry
+    claims = [(record['id'], {'Status': 'Publishing'}) for record in records if record['fields'].get('Status') != 'Publishing']
+    claimed = set(update_records(client, airtable_url, headers, limiter, claims))
+    if len(claimed) < len(claims):
+        print(f"Could not claim {len(claims) - len(claimed)} records, leaving them for the next run.")
+    records = [record for record in records if record['fields'].get('Status') == 'Publishing' or record['id'] in claimed]
 
-        # Posting onto WordPress
-        wp_headers = {
-            'Content-Type': 'application/json',
-        }
-        wp_auth = (wordpress_username, wordpress_password)
-        wp_data = {
-            'title': title,
-            'content': content,
-            'status': 'publish'
-        }
-        try:
-            wp_response = requests.post(wordpress_url, headers=wp_headers, auth=wp_auth, json=wp_data)
-            wp_response.raise_for_status()
-            wp_post_id = wp_response.json().get('id')
-            print(f"Published to WordPress: {title}, Post ID: {wp_post_id}")
-        except Exception as e:
-            print(f"Error publishing to WordPress: {str(e)}")
-            continue
-
-        # Updating the Airtable record with WordPress Post ID and Status (draft/ scheduled and published)
-        update_data = {
-            'fields': {
-                'WordPress Post ID': str(wp_post_id),
-                'Status': 'Published'
-            }
-        }
-        try:
-            update_response = requests.patch(f"{airtable_url}/{record_id}", headers=headers, json=update_data)
-            update_response.raise_for_status()
-            print(f"Updated Airtable record {record_id}: Status set to Published, WordPress Post ID: {wp_post_id}")
-        except Exception as e:
-            print(f"Error updating Airtable record {record_id}: {str(e)}")
+    # Posting onto WordPress a few at a time, writing results back to Airtable every 10 posts
+    updates = []
+    saved = 0
+    with ThreadPoolExecutor(max_workers=wordpress_concurrency, thread_name_prefix='wp-publish') as pool:
+        futures = {pool.submit(publish_record, client, wordpress_url, wp_auth, record): record for record in records}
+        for future in as_completed(futures):
+            record_id = futures[future]['id']
+            try:
+                wp_post_id = future.result()
+                updates.append((record_id, {'WordPress Post ID': str(wp_post_id), 'Status': 'Published'}))
+            except Exception as e:
+                # Stays "Publishing": the POST may have gone through, so the next run looks it up first
+                print(f"Error publishing to WordPress: {str(e)}")
+                continue
+            if len(updates) == AIRTABLE_BATCH_SIZE:
+                saved += len(update_records(client, airtable_url, headers, limiter, updates))
+                updates = []
+    saved += len(update_records(client, airtable_url, headers, limiter, updates))
+    print(f"Published {saved} of {len(records)} scheduled blogs.")
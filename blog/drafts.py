@@ -0,0 +1,211 @@
+import re
+from datetime import timedelta
+from difflib import SequenceMatcher
+
+from django.conf import settings
+from django.db.models import Max, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .models import DraftRevision
+
+# Session keys holding the id of the newest DraftRevision of each generator
+GENERATE_DRAFTS = 'draft_head'
+BLOGCRAFT_DRAFTS = 'prompt_tier_draft_head'
+# Full drafts the session used to carry around; dropped on sight
+LEGACY_SESSION_KEYS = {GENERATE_DRAFTS: 'drafts', BLOGCRAFT_DRAFTS: 'prompt_tier_drafts'}
+
+# Every KEYFRAME_EVERY-th revision is stored whole, so rebuilding a draft never replays a long chain
+KEYFRAME_EVERY = 8
+
+TOKEN_RE = re.compile(r'\S+\s*|\s+')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text)
+
+
+def make_delta(parent, content):
+    # Word-level edit script: n copies n tokens from the parent, -n skips n, a string is inserted
+    old, new = tokenize(parent), tokenize(content)
+    delta = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, old, new, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            delta.append(i2 - i1)
+            continue
+        if i2 > i1:
+            delta.append(i1 - i2)
+        if j2 > j1:
+            delta.append(''.join(new[j1:j2]))
+    return delta
+
+
+def apply_delta(parent, delta):
+    old = tokenize(parent)
+    out = []
+    i = 0
+    for op in delta:
+        if isinstance(op, str):
+            out.append(op)
+        elif op >= 0:
+            out.extend(old[i:i + op])
+            i += op
+        else:
+            i -= op
+    return ''.join(out)
+
+
+class Draft:
+    def __init__(self, history, revision):
+        self.history = history
+        self.revision = revision
+
+    @property
+    def prompt(self):
+        return self.revision.label
+
+    @property
+    def content(self):
+        return self.history.content_of(self.revision)
+
+    def __getitem__(self, key):
+        # Views were written against {'prompt': ..., 'content': ...} dicts
+        if key not in ('prompt', 'content'):
+            raise KeyError(key)
+        return getattr(self, key)
+
+
+class DraftHistory:
+    """The drafts shown to the user, one per position. Nothing is read until first used."""
+
+    def __init__(self, head_id):
+        self.head_id = head_id
+        self._contents = {}
+
+    @cached_property
+    def revisions(self):
+        if not self.head_id:
+            return []
+        head = DraftRevision.objects.filter(pk=self.head_id).only('root_id').first()
+        if head is None:
+            return []
+        thread_id = head.root_id or head.pk
+        return list(
+            DraftRevision.objects.filter(Q(pk=thread_id) | Q(root_id=thread_id), pk__lte=self.head_id)
+            .defer('snapshot', 'delta').order_by('pk')
+        )
+
+    @cached_property
+    def drafts(self):
+        latest = {}
+        for revision in self.revisions:
+            latest[revision.position] = revision
+        return [Draft(self, latest[position]) for position in sorted(latest)]
+
+    @cached_property
+    def bodies(self):
+        # Snapshots and deltas for the whole history in one query; threads are short-lived
+        return {
+            pk: (parent_id, snapshot, delta)
+            for pk, parent_id, snapshot, delta in DraftRevision.objects.filter(
+                pk__in=[r.pk for r in self.revisions]
+            ).values_list('pk', 'parent_id', 'snapshot', 'delta')
+        }
+
+    def content_of(self, revision):
+        # Walk back to the nearest snapshot or already rebuilt draft, then replay the deltas forward
+        chain = []
+        pk = revision.pk
+        while pk not in self._contents:
+            parent_id, snapshot, delta = self.bodies[pk]
+            if snapshot is not None:
+                self._contents[pk] = snapshot
+                break
+            chain.append((pk, parent_id, delta))
+            pk = parent_id
+        for pk, parent_id, delta in reversed(chain):
+            self._contents[pk] = apply_delta(self._contents[parent_id], delta)
+        return self._contents[revision.pk]
+
+    def __iter__(self):
+        return iter(self.drafts)
+
+    def __len__(self):
+        return len(self.drafts)
+
+    def __bool__(self):
+        return bool(self.head_id) and len(self) > 0
+
+    def __getitem__(self, index):
+        return self.drafts[index]
+
+    def __repr__(self):
+        # The views print their drafts; don't load every article just for a log line
+        return f'<DraftHistory head={self.head_id}>'
+
+
+def load_drafts(session, key):
+    session.pop(LEGACY_SESSION_KEYS[key], None)
+    return DraftHistory(session.get(key))
+
+
+def push_draft(session, user, key, content, label='', replace=False):
+    """Stores a new draft after the current head; replace=True keeps its position (BlogCraft refines in place)."""
+    history = load_drafts(session, key)
+    parent = history.revisions[-1] if history else None
+    revision = DraftRevision(user=user, label=label)
+    if parent is None:
+        revision.snapshot = content
+    else:
+        revision.root_id = parent.thread_id
+        revision.parent = parent
+        revision.position = parent.position if replace else parent.position + 1
+        depth = len(history.revisions)
+        delta = make_delta(history.content_of(parent), content)
+        if depth % KEYFRAME_EVERY == 0 or len(str(delta)) >= len(content):
+            revision.snapshot = content
+        else:
+            revision.delta = delta
+    revision.save()
+    session[key] = revision.pk
+    return revision
+
+
+def clear_drafts(session, key):
+    # The history is only needed until it is published or restarted, so the rows go with it
+    session.pop(LEGACY_SESSION_KEYS[key], None)
+    head_id = session.get(key)
+    if head_id:
+        head = DraftRevision.objects.filter(pk=head_id).only('root_id').first()
+        if head is not None:
+            thread_id = head.root_id or head.pk
+            DraftRevision.objects.filter(Q(pk=thread_id) | Q(root_id=thread_id)).delete()
+    session[key] = None
+
+
+def draft_retention():
+    # A thread nobody added to for a whole session lifetime is abandoned; a session that still
+    # points at it just shows no drafts
+    return timedelta(seconds=settings.SESSION_COOKIE_AGE)
+
+
+def draft_threads():
+    return (
+        DraftRevision.objects.annotate(thread=Coalesce('root_id', 'id')).values('thread')
+        .annotate(last_used=Max('created_at')).order_by('last_used')
+    )
+
+
+def prune_drafts():
+    """Deletes the draft threads of sessions that were abandoned without publishing."""
+    cutoff = timezone.now() - draft_retention()
+    threads = draft_threads().filter(last_used__lt=cutoff).values('thread')
+    # Deleting a thread's first revision takes the rest with it (root is on_delete=CASCADE)
+    return DraftRevision.objects.filter(pk__in=threads).delete()[0]
+
+
+def prune_times():
+    # For the due scheduler: the moment the least recently used thread expires, in hourly batches
+    oldest = draft_threads().values_list('last_used', flat=True).first()
+    return [oldest + draft_retention() + timedelta(hours=1)] if oldest else []
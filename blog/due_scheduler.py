@@ -0,0 +1,133 @@
+import heapq
+import select
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import AirtableRecord, AirtableSyncState, ScheduledPost
+
+# Instead of waking every minute, the scheduler keeps the upcoming publish times in a min-heap,
+# sleeps until the earliest one and runs only the publisher it belongs to. Creating or changing a
+# schedule wakes it early: directly in this process, and through Postgres LISTEN/NOTIFY from others.
+NOTIFY_CHANNEL = 'blog_schedule'
+UPCOMING_PER_SOURCE = 100
+# Something that was already due when its publisher ran and is still there afterwards (e.g. a post
+# whose generation failed) is not retried sooner than this, so a stuck item cannot spin the loop.
+# Times that were still in the future are left alone.
+RETRY_DELAY = timedelta(seconds=60)
+
+schedule_changed = threading.Event()
+
+
+def notify_schedule_changed():
+    schedule_changed.set()
+    if connection.vendor == 'postgresql':
+        transaction.on_commit(send_notify)
+
+
+def send_notify():
+    with connection.cursor() as cursor:
+        cursor.execute(f"NOTIFY {NOTIFY_CHANNEL}")
+
+
+def scheduled_post_times():
+    claim_timeout = timedelta(seconds=getattr(settings, 'SCHEDULED_POSTS_CLAIM_TIMEOUT', 300))
+    posts = ScheduledPost.objects.filter(created_by__is_superuser=True)
+    times = list(posts.filter(claimed_at__isnull=True).order_by('scheduled_datetime')
+                 .values_list('scheduled_datetime', flat=True)[:UPCOMING_PER_SOURCE])
+    # A claimed post comes back when its claim times out
+    claimed_at = posts.filter(claimed_at__isnull=False).order_by('claimed_at').values_list('claimed_at', flat=True).first()
+    if claimed_at is not None:
+        times.append(claimed_at + claim_timeout)
+    return times
+
+
+def airtable_times():
+    times = list(AirtableRecord.objects.filter(status__in=['Scheduled', 'Publishing'], publish_date__isnull=False)
+                 .order_by('publish_date').values_list('publish_date', flat=True)[:UPCOMING_PER_SOURCE])
+    # The mirror itself has to be refreshed from Airtable now and then
+    synced_at = AirtableSyncState.objects.values_list('synced_at', flat=True).first()
+    interval = timedelta(seconds=getattr(settings, 'AIRTABLE_SYNC_INTERVAL', 60 * 5))
+    times.append(synced_at + interval if synced_at else timezone.now())
+    return times
+
+
+class DueTimeScheduler:
+
+    def __init__(self, jobs, stdout=None):
+        # jobs: name -> (function returning upcoming datetimes, function to run when one is due)
+        self.jobs = jobs
+        self.stdout = stdout
+        self.last_run = {}  # name -> (when it ran, earliest retry of what was due by then)
+        self.stopped = threading.Event()
+
+    def log(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def build_heap(self):
+        heap = []
+        for name, (upcoming, _) in self.jobs.items():
+            ran_at, retry_at = self.last_run.get(name, (None, None))
+            for when in upcoming():
+                if ran_at is not None and when <= ran_at:
+                    when = max(when, retry_at)
+                heapq.heappush(heap, (when, name))
+        return heap
+
+    def run_due(self, heap, now):
+        due = set()
+        while heap and heap[0][0] <= now:
+            due.add(heapq.heappop(heap)[1])
+        for name in sorted(due):
+            self.log(f"Running {name}")
+            try:
+                self.jobs[name][1]()
+            except Exception as e:
+                self.log(f"Error in {name}: {str(e)}")
+            self.last_run[name] = (now, timezone.now() + RETRY_DELAY)
+        return due
+
+    def tick(self):
+        """Runs whatever is due; returns the seconds to sleep before the next publish time (None if nothing is scheduled)."""
+        close_old_connections()
+        heap = self.build_heap()
+        if self.run_due(heap, timezone.now()):
+            heap = self.build_heap()
+        if not heap:
+            return None
+        return max((heap[0][0] - timezone.now()).total_seconds(), 0)
+
+    def run_forever(self):
+        if connection.vendor == 'postgresql':
+            threading.Thread(target=listen_for_changes, args=(self.stopped,), daemon=True).start()
+        while not self.stopped.is_set():
+            schedule_changed.clear()
+            timeout = self.tick()
+            if timeout is None or timeout > 0:
+                if timeout is not None:
+                    self.log(f"Next publish in {timeout:.1f}s")
+                schedule_changed.wait(timeout)
+
+    def stop(self):
+        self.stopped.set()
+        schedule_changed.set()
+
+
+def listen_for_changes(stopped):
+    # Own connection in autocommit mode; a notification from any web worker wakes the scheduler
+    listener = connection.get_new_connection(connection.get_connection_params())
+    listener.autocommit = True
+    try:
+        listener.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+        while not stopped.is_set():
+            if select.select([listener], [], [], 5)[0]:
+                listener.poll()
+                if listener.notifies:
+                    listener.notifies.clear()
+                    schedule_changed.set()
+    finally:
+        listener.close()
@@ -0,0 +1,174 @@
+import hashlib
+import time
+
+from django.contrib.auth.models import User
+from django.contrib.sitemaps import Sitemap
+from django.contrib.sitemaps.views import sitemap
+from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.db.models import F, Max
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.http import http_date, quote_etag
+
+from .caching import (
+    AUTHOR_PAGES_VERSION_KEY, FEEDS_VERSION_KEY, LIST_PAGES_VERSION_KEY, PAGE_CACHE_TIMEOUT,
+    SITEMAP_INDEX_VERSION_KEY, SITEMAP_SHARD_SIZE, SITEMAP_SHARD_VERSION_KEY, get_version, release_version,
+)
+from .models import LIST_DEFERRED_FIELDS, Post
+
+# RSS/Atom feeds and the sitemap, so readers and crawlers don't have to walk the paginated home
+# page. Each document is cached under the same versioned keys as the pages: publishing a post
+# only bumps its own scopes (the site feed, its author's feed, its sitemap shard and the index),
+# so everything else keeps being served from cache.
+FEED_ITEMS = 20
+FEED_KEY = 'blog:feed:{scope}:{version}:{feeds}:{release}:{host}'
+
+
+class LatestPostsFeed(Feed):
+    title = 'Blogify'
+    description = 'Latest posts on Blogify'
+
+    def link(self):
+        return reverse('blog-home')
+
+    def items(self):
+        return (Post.objects.select_related('author').defer(*LIST_DEFERRED_FIELDS)
+                .order_by('-date_posted', '-id')[:FEED_ITEMS])
+
+    def item_title(self, item):
+        return item.title
+
+    def item_description(self, item):
+        return item.excerpt_text
+
+    def item_pubdate(self, item):
+        return item.date_posted
+
+    def item_updateddate(self, item):
+        return item.updated_at
+
+    def item_author_name(self, item):
+        return item.author.username if item.author else None
+
+
+class LatestPostsAtomFeed(LatestPostsFeed):
+    feed_type = Atom1Feed
+    subtitle = LatestPostsFeed.description
+
+
+class AuthorPostsFeed(LatestPostsFeed):
+
+    def get_object(self, request, username):
+        return get_object_or_404(User, username=username)
+
+    def title(self, obj):
+        return f'Blogify - posts by {obj.username}'
+
+    def description(self, obj):
+        return f'Latest posts by {obj.username} on Blogify'
+
+    def link(self, obj):
+        return reverse('user-posts', args=[obj.username])
+
+    def items(self, obj):
+        return (Post.objects.filter(author=obj).select_related('author').defer(*LIST_DEFERRED_FIELDS)
+                .order_by('-date_posted', '-id')[:FEED_ITEMS])
+
+
+class AuthorPostsAtomFeed(AuthorPostsFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, obj):
+        return self.description(obj)
+
+
+class PostSitemap(Sitemap):
+    # A shard is a fixed range of post ids, so a new post only changes the last shard
+    limit = SITEMAP_SHARD_SIZE
+
+    def __init__(self, shard):
+        self.shard = shard
+
+    def items(self):
+        start = (self.shard - 1) * SITEMAP_SHARD_SIZE
+        return Post.objects.filter(pk__gt=start, pk__lte=start + SITEMAP_SHARD_SIZE).order_by('pk').only('id', 'updated_at')
+
+    def lastmod(self, post):
+        return post.updated_at
+
+
+def cached_document(request, scope, version_key, build):
+    key = FEED_KEY.format(
+        scope=scope,
+        version=get_version(version_key),
+        feeds=get_version(FEEDS_VERSION_KEY),
+        release=release_version(),
+        host=request.get_host(),
+    )
+    entry = cache.get(key)
+    if entry is None:
+        response = build()
+        if response.status_code != 200:
+            return response
+        if hasattr(response, 'render'):
+            response.render()
+        entry = {
+            'content': response.content,
+            'content_type': response['Content-Type'],
+            'built_at': int(time.time()),
+        }
+        cache.set(key, entry, PAGE_CACHE_TIMEOUT)
+
+    # Validated like the pages: the key names every version the document depends on, and
+    # Last-Modified is when this version was built. The newest item's date would stay put when a
+    # post is deleted, and readers would keep the deleted entry.
+    etag = quote_etag(hashlib.md5(key.encode()).hexdigest())
+    response = HttpResponse(entry['content'], content_type=entry['content_type'])
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(entry['built_at'])
+    return get_conditional_response(request, etag=etag, last_modified=entry['built_at'], response=response)
+
+
+FEEDS = {'rss': LatestPostsFeed(), 'atom': LatestPostsAtomFeed()}
+AUTHOR_FEEDS = {'rss': AuthorPostsFeed(), 'atom': AuthorPostsAtomFeed()}
+
+
+def posts_feed(request, feed_format):
+    return cached_document(
+        request, f'posts:{feed_format}', LIST_PAGES_VERSION_KEY, lambda: FEEDS[feed_format](request)
+    )
+
+
+def author_feed(request, username, feed_format):
+    return cached_document(
+        request, f'author:{username}:{feed_format}', AUTHOR_PAGES_VERSION_KEY.format(username=username),
+        lambda: AUTHOR_FEEDS[feed_format](request, username=username),
+    )
+
+
+def build_sitemap_index(request):
+    shards = (
+        Post.objects.annotate(shard=(F('id') - 1) / SITEMAP_SHARD_SIZE + 1)
+        .values('shard').annotate(last_mod=Max('updated_at')).order_by('shard')
+    )
+    sitemaps = [
+        {'location': request.build_absolute_uri(reverse('sitemap-posts', args=[row['shard']])), 'last_mod': row['last_mod']}
+        for row in shards
+    ]
+    return HttpResponse(render_to_string('sitemap_index.xml', {'sitemaps': sitemaps}), content_type='application/xml')
+
+
+def sitemap_index(request):
+    return cached_document(request, 'sitemap:index', SITEMAP_INDEX_VERSION_KEY, lambda: build_sitemap_index(request))
+
+
+def sitemap_shard(request, shard):
+    return cached_document(
+        request, f'sitemap:{shard}', SITEMAP_SHARD_VERSION_KEY.format(shard=shard),
+        lambda: sitemap(request, {'posts': PostSitemap(shard)}),
+    )
@@ -0,0 +1,60 @@
+from . import http_client
+
+LANGUAGETOOL_URL = "https://api.languagetool.org/v2/check"
+
+
+def check(text, language='en-US'):
+    response = http_client.get_client().post(
+        LANGUAGETOOL_URL, endpoint='languagetool.check', data={'text': text, 'language': language}
+    )
+    return response.json().get('matches', [])
+
+
+def utf16_to_index(text):
+    # LanguageTool counts offsets in UTF-16 code units, so every emoji before a match shifts it by one
+    positions = []
+    for index, char in enumerate(text):
+        positions.append(index)
+        if ord(char) > 0xFFFF:
+            positions.append(index)
+    positions.append(len(text))
+    return positions
+
+
+def apply_matches(text, matches):
+    """Applies the first suggestion of each match in one pass; returns (fixed_text, applied_count).
+
+    Offsets refer to the original text, so nothing is shifted as we go. Matches are sorted, and
+    one that overlaps a fix already made is skipped instead of corrupting the text around it.
+    """
+    has_astral = not text.isascii() and len(text.encode('utf-16-le')) // 2 != len(text)
+    to_index = utf16_to_index(text) if has_astral else None
+    edits = []
+    for match in matches:
+        if not match.get('replacements'):
+            continue
+        start, end = match['offset'], match['offset'] + match['length']
+        if to_index is not None:
+            start, end = to_index[min(start, len(to_index) - 1)], to_index[min(end, len(to_index) - 1)]
+        edits.append((start, end, match['replacements'][0]['value']))
+    edits.sort(key=lambda edit: (edit[0], edit[1]))
+
+    pieces = []
+    cursor = 0
+    for start, end, replacement in edits:
+        if start < cursor or end > len(text):
+            continue
+        pieces.append(text[cursor:start])
+        pieces.append(replacement)
+        cursor = end
+    pieces.append(text[cursor:])
+    applied = (len(pieces) - 1) // 2
+    return ''.join(pieces), applied
+
+
+def fix_grammar(text, language='en-US'):
+    """Checks text with LanguageTool and returns (fixed_text, applied_count). Network errors propagate."""
+    matches = check(text, language)
+    if not matches:
+        return text, 0
+    return apply_matches(text, matches)
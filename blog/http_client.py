@@ -0,0 +1,126 @@
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .caching import incr_counter
+from .metrics import record_service, service_for
+
+# One requests.Session for LanguageTool, Airtable and WordPress: connections stay open between
+# calls (one pool per host), every call gets a timeout, and transient failures are retried.
+DEFAULTS = {
+    'CONNECT_TIMEOUT': 3.05,
+    'READ_TIMEOUT': 30,
+    'RETRIES': 3,
+    'BACKOFF': 0.5,
+    'POOL_MAXSIZE': 10,
+}
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+HTTP_STATS_KEY = 'blog:http:{endpoint}:{counter}'
+HTTP_ENDPOINTS_KEY = 'blog:http:endpoints'
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class JitteredRetry(Retry):
+    # Spread retries out so every worker that hit the same 429 doesn't come back at the same moment
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) + backoff / 2 if backoff else 0
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        # A 429 means the request was turned away unprocessed, so even a POST is safe to send again
+        if status_code == 429 and self.total:
+            return True
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'OUTBOUND_HTTP', {})}
+
+
+class HttpClient:
+
+    def __init__(self, connect_timeout, read_timeout, retries, backoff, pool_maxsize):
+        self.timeout = (connect_timeout, read_timeout)
+        # Reads and 5xx are only retried for idempotent methods (PATCH included, it just sets fields);
+        # a POST is only retried when the connection failed before anything was sent.
+        retry = JitteredRetry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS | {'PATCH'},
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method, url, endpoint=None, **kwargs):
+        host = requests.utils.urlparse(url).netloc
+        endpoint = endpoint or f"{method.lower()}.{host}"
+        kwargs.setdefault('timeout', self.timeout)
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            record_latency(endpoint, time.perf_counter() - started, failed=True)
+            raise
+        finally:
+            record_service(service_for(host), time.perf_counter() - started)
+        record_latency(endpoint, time.perf_counter() - started, failed=response.status_code >= 500)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request('PATCH', url, **kwargs)
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            config = get_config()
+            _client = HttpClient(
+                connect_timeout=config['CONNECT_TIMEOUT'],
+                read_timeout=config['READ_TIMEOUT'],
+                retries=config['RETRIES'],
+                backoff=config['BACKOFF'],
+                pool_maxsize=config['POOL_MAXSIZE'],
+            )
+    return _client
+
+
+def record_latency(endpoint, seconds, failed=False):
+    endpoints = cache.get(HTTP_ENDPOINTS_KEY, [])
+    if endpoint not in endpoints:
+        cache.set(HTTP_ENDPOINTS_KEY, endpoints + [endpoint], None)
+    incr_counter(HTTP_STATS_KEY.format(endpoint=endpoint, counter='calls'))
+    incr_counter(HTTP_STATS_KEY.format(endpoint=endpoint, counter='total_ms'), int(seconds * 1000))
+    if failed:
+        incr_counter(HTTP_STATS_KEY.format(endpoint=endpoint, counter='errors'))
+
+
+def http_stats():
+    stats = {}
+    for endpoint in cache.get(HTTP_ENDPOINTS_KEY, []):
+        keys = {counter: HTTP_STATS_KEY.format(endpoint=endpoint, counter=counter)
+                for counter in ('calls', 'total_ms', 'errors')}
+        values = cache.get_many(list(keys.values()))
+        counters = {counter: values.get(key, 0) for counter, key in keys.items()}
+        counters['avg_ms'] = round(counters['total_ms'] / counters['calls'], 1) if counters['calls'] else 0.0
+        stats[endpoint] = counters
+    return stats
@@ -0,0 +1,127 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from django_project.background import run_in_background
+from . import llm
+from .drafts import BLOGCRAFT_DRAFTS, GENERATE_DRAFTS, clear_drafts, load_drafts, push_draft
+from .models import GenerationJob
+
+# Generation requests are handed to a small thread pool so the web worker that took the POST
+# goes straight back to serving pages; the page then polls the job and picks the draft up.
+PENDING_JOB_SESSION_KEY = 'generation_job'
+# The pool lives in the web worker, so a restart or crash loses whatever it was running; jobs
+# that stay queued or running past LLM_JOB_TIMEOUT are failed instead of being polled forever
+JOB_TIMEOUT_ERROR = 'Generation took too long, please try again'
+PRUNE_BATCH_DELAY = timedelta(hours=1)
+
+logger = logging.getLogger(__name__)
+
+
+def run_job(job_id):
+    claimed = GenerationJob.objects.filter(pk=job_id, status=GenerationJob.QUEUED).update(
+        status=GenerationJob.RUNNING, started_at=timezone.now()
+    )
+    if not claimed:
+        return
+    job = GenerationJob.objects.get(pk=job_id)
+    result, error = '', ''
+    try:
+        result = llm.generate(job.prompt)
+        status = GenerationJob.DONE
+    except Exception as e:
+        error = str(e)
+        status = GenerationJob.FAILED
+    # Unless it timed out in the meantime and the user was already told
+    GenerationJob.objects.filter(pk=job_id, status=GenerationJob.RUNNING).update(
+        result=result, error=error, status=status, finished_at=timezone.now()
+    )
+
+
+def expire_stale_jobs(**filters):
+    """Fails the jobs (matching filters) that have been queued or running longer than LLM_JOB_TIMEOUT."""
+    now = timezone.now()
+    deadline = now - timedelta(seconds=getattr(settings, 'LLM_JOB_TIMEOUT', 300))
+    return GenerationJob.objects.filter(**filters).filter(
+        Q(status=GenerationJob.QUEUED, created_at__lt=deadline)
+        | Q(status=GenerationJob.RUNNING, started_at__lt=deadline)
+    ).update(status=GenerationJob.FAILED, error=JOB_TIMEOUT_ERROR, finished_at=now)
+
+
+def job_retention():
+    return timedelta(seconds=getattr(settings, 'LLM_JOB_RETENTION', 60 * 60 * 24))
+
+
+def prune_jobs():
+    # A job is only needed until the page that started it picks the result up
+    return GenerationJob.objects.filter(created_at__lt=timezone.now() - job_retention()).delete()[0]
+
+
+def prune_times():
+    # For the due scheduler: an hour after the oldest job became old enough, so rows go in batches
+    oldest = GenerationJob.objects.aggregate(oldest=Min('created_at'))['oldest']
+    return [oldest + job_retention() + PRUNE_BATCH_DELAY] if oldest else []
+
+
+def enqueue_generation(request, flow, action, prompt, label='', step=0):
+    job = GenerationJob.objects.create(
+        user=request.user, flow=flow, action=action, prompt=prompt, label=label, step=step
+    )
+    request.session[PENDING_JOB_SESSION_KEY] = job.pk
+    request.session.modified = True
+    logger.debug("Queued %s %s job %s (step %s)", job.flow, job.action, job.pk, job.step)
+    run_in_background(run_job, job.pk)
+    return job
+
+
+def apply_generate_job(session, job):
+    if job.status == GenerationJob.DONE:
+        if job.action == 'generate':
+            clear_drafts(session, GENERATE_DRAFTS)
+        push_draft(session, job.user, GENERATE_DRAFTS, job.result, label=job.label)
+    else:
+        session['error'] = f"Error generating content: {job.error}"
+
+
+def apply_blogcraft_job(session, job):
+    if job.status == GenerationJob.DONE:
+        if job.action == 'generate':
+            clear_drafts(session, BLOGCRAFT_DRAFTS)
+            push_draft(session, job.user, BLOGCRAFT_DRAFTS, job.result.strip())
+            session['current_refine_step'] = 1
+        elif load_drafts(session, BLOGCRAFT_DRAFTS):
+            push_draft(session, job.user, BLOGCRAFT_DRAFTS, job.result.strip(), replace=True)
+            session['current_refine_step'] = job.step + 1
+    else:
+        verb = 'generating' if job.action == 'generate' else 'refining'
+        session['error'] = f"Error {verb} content: {job.error}"
+
+
+JOB_APPLIERS = {
+    'generate': apply_generate_job,
+    'blogcraft': apply_blogcraft_job,
+}
+
+
+def sync_generation_job(request):
+    """Folds a finished job into the session; returns the job while it is still running.
+
+    Views call this after handling their POST, so a job they just enqueued in eager mode
+    (BACKGROUND_TASKS_EAGER) has already finished and its draft shows on the same response.
+    """
+    job_id = request.session.get(PENDING_JOB_SESSION_KEY)
+    if not job_id:
+        return None
+    job = GenerationJob.objects.filter(pk=job_id, user=request.user).first()
+    if job is not None and job.is_pending:
+        if not expire_stale_jobs(pk=job.pk):
+            return job
+        job.refresh_from_db()
+    if job is not None:
+        JOB_APPLIERS[job.flow](request.session, job)
+    del request.session[PENDING_JOB_SESSION_KEY]
+    request.session.modified = True
+    return None
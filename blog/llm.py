@@ -0,0 +1,100 @@
+import hashlib
+import random
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import clients, llm_cache
+from .metrics import timed_service
+
+DEFAULT_MODEL = 'gemini-1.5-flash'
+_DONE = object()
+
+
+class GeminiBackend:
+    def generate(self, prompt, model_name=DEFAULT_MODEL, **params):
+        model = clients.get('gemini').GenerativeModel(model_name)
+        response = model.generate_content(prompt, generation_config=params or None)
+        return response.text
+
+    def stream(self, prompt, model_name=DEFAULT_MODEL, **params):
+        model = clients.get('gemini').GenerativeModel(model_name)
+        for chunk in model.generate_content(prompt, generation_config=params or None, stream=True):
+            yield chunk.text
+
+
+class FakeBackend:
+    # Offline stand-in for Gemini so the generators can be load-tested without keys or quota.
+    # Output is deterministic per prompt and LLM_FAKE_LATENCY simulates the model's response time.
+    words = (
+        'blogging ideas readers content strategy search keyword audience insight story draft '
+        'publish engage clarity example structure tone value practical guide future'
+    ).split()
+
+    def text_for(self, prompt):
+        seed = int(hashlib.sha256(prompt.encode()).hexdigest(), 16)
+        rng = random.Random(seed)
+        body = ' '.join(rng.choice(self.words) for _ in range(500))
+        return f"# Fake Draft {seed % 10000}\n\n{body}"
+
+    def generate(self, prompt, model_name=DEFAULT_MODEL, **params):
+        time.sleep(getattr(settings, 'LLM_FAKE_LATENCY', 0))
+        return self.text_for(prompt)
+
+    def stream(self, prompt, model_name=DEFAULT_MODEL, **params):
+        # Same total latency, spent as a short wait for the first token then a steady trickle
+        latency = getattr(settings, 'LLM_FAKE_LATENCY', 0)
+        words = self.text_for(prompt).split(' ')
+        chunks = [' '.join(words[i:i + 20]) for i in range(0, len(words), 20)]
+        time.sleep(latency * 0.1)
+        for i, chunk in enumerate(chunks):
+            yield chunk if i == len(chunks) - 1 else chunk + ' '
+            time.sleep(latency * 0.9 / len(chunks))
+
+
+BACKENDS = {
+    'gemini': GeminiBackend,
+    'fake': FakeBackend,
+}
+
+
+def backend_name():
+    return getattr(settings, 'LLM_BACKEND', 'gemini')
+
+
+def get_backend():
+    name = backend_name()
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown LLM_BACKEND '{name}', expected one of: {', '.join(BACKENDS)}")
+
+
+def generate(prompt, model_name=DEFAULT_MODEL, **params):
+    key, response = llm_cache.lookup(model_name, prompt, params)
+    if response is None:
+        # The fake backend's simulated latency is reported as its own service, not as Gemini
+        with timed_service(backend_name()):
+            response = get_backend().generate(prompt, model_name, **params)
+        llm_cache.store(key, model_name, response)
+    return response
+
+
+async def astream(prompt, model_name=DEFAULT_MODEL, **params):
+    key, response = await sync_to_async(llm_cache.lookup)(model_name, prompt, params)
+    if response is not None:
+        yield response
+        return
+    # The model client blocks, so each next() runs on a worker thread and the event loop
+    # (and with it the ASGI worker) stays free while a stream is in flight
+    iterator = get_backend().stream(prompt, model_name, **params)
+    parts = []
+    while True:
+        with timed_service(backend_name()):
+            chunk = await sync_to_async(next, thread_sensitive=False)(iterator, _DONE)
+        if chunk is _DONE:
+            break
+        parts.append(chunk)
+        yield chunk
+    await sync_to_async(llm_cache.store)(key, model_name, ''.join(parts))
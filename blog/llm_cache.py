@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .caching import hit_rate_stats, incr_counter
+from .models import LLMResponse
+
+# Identical prompts (retries, double clicks, re-scheduled topics) are answered from here instead
+# of paying for another model call. Entries are keyed by the hash of everything that shapes the
+# answer, expire after TTL seconds and the least recently used ones go once MAX_ENTRIES is hit.
+LLM_CACHE_STATS_KEY = 'blog:llm_cache:{counter}'
+DEFAULTS = {
+    'BACKEND': 'db',
+    'LOCATION': 'llm_cache',
+    'TTL': 60 * 60 * 24 * 7,
+    'MAX_ENTRIES': 5000,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'LLM_CACHE', {})}
+
+
+def cache_key(model_name, prompt, params, backend='gemini'):
+    # The backend is part of the key so load tests on the fake backend never answer real users
+    payload = json.dumps([backend, model_name, prompt, params], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class DatabaseResponseCache:
+    def __init__(self, ttl, max_entries, **kwargs):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def get(self, key):
+        now = timezone.now()
+        entry = LLMResponse.objects.filter(key=key).values_list('response', 'created_at').first()
+        if entry is None:
+            return None
+        response, created_at = entry
+        if created_at < now - timedelta(seconds=self.ttl):
+            LLMResponse.objects.filter(key=key).delete()
+            return None
+        LLMResponse.objects.filter(key=key).update(last_used_at=now, hits=F('hits') + 1)
+        return response
+
+    def set(self, key, model_name, response):
+        now = timezone.now()
+        LLMResponse.objects.update_or_create(
+            key=key,
+            defaults={'model_name': model_name, 'response': response, 'created_at': now, 'last_used_at': now},
+        )
+        self.evict()
+
+    def evict(self):
+        cutoff = LLMResponse.objects.order_by('-last_used_at').values_list('last_used_at', flat=True)[
+            self.max_entries:self.max_entries + 1
+        ].first()
+        if cutoff is not None:
+            LLMResponse.objects.filter(last_used_at__lte=cutoff).delete()
+        LLMResponse.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=self.ttl)).delete()
+
+
+class FileResponseCache:
+    # One JSON file per entry; the file's mtime doubles as the last-used time for LRU eviction
+    def __init__(self, ttl, max_entries, location, **kwargs):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.location = Path(location)
+        if not self.location.is_absolute():
+            self.location = Path(settings.BASE_DIR) / self.location
+
+    def path_for(self, key):
+        return self.location / f'{key}.json'
+
+    def get(self, key):
+        path = self.path_for(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry['created_at'] < time.time() - self.ttl:
+            path.unlink(missing_ok=True)
+            return None
+        os.utime(path)
+        return entry['response']
+
+    def set(self, key, model_name, response):
+        self.location.mkdir(parents=True, exist_ok=True)
+        path = self.path_for(key)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'model_name': model_name, 'response': response, 'created_at': time.time()}, f)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        entries = sorted(self.location.glob('*.json'), key=lambda p: p.stat().st_mtime, reverse=True)
+        expired_before = time.time() - self.ttl
+        for i, path in enumerate(entries):
+            if i >= self.max_entries or path.stat().st_mtime < expired_before:
+                path.unlink(missing_ok=True)
+
+
+class NoResponseCache:
+    def __init__(self, **kwargs):
+        pass
+
+    def get(self, key):
+        return None
+
+    def set(self, key, model_name, response):
+        pass
+
+
+BACKENDS = {
+    'db': DatabaseResponseCache,
+    'file': FileResponseCache,
+    'none': NoResponseCache,
+}
+
+
+def get_response_cache():
+    config = get_config()
+    return BACKENDS[config['BACKEND']](
+        ttl=config['TTL'], max_entries=config['MAX_ENTRIES'], location=config['LOCATION']
+    )
+
+
+def lookup(model_name, prompt, params):
+    key = cache_key(model_name, prompt, params, getattr(settings, 'LLM_BACKEND', 'gemini'))
+    response = get_response_cache().get(key)
+    incr_counter(LLM_CACHE_STATS_KEY.format(counter='misses' if response is None else 'hits'))
+    return key, response
+
+
+def store(key, model_name, response):
+    get_response_cache().set(key, model_name, response)
+
+
+def llm_cache_stats():
+    return hit_rate_stats(LLM_CACHE_STATS_KEY)
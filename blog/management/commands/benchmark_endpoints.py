@@ -0,0 +1,234 @@
+import json
+import random
+import statistics
+import time
+from datetime import timedelta
+
+import requests
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from blog import http_client
+from blog.models import Post, ScheduledPost
+from blog.rendering import render_post
+from blog.search import index_posts
+from users.models import Profile
+
+# Seeds a throwaway database, drives the main pages through Django's test client with Gemini,
+# LanguageTool, Airtable and WordPress stubbed out, and reports latency percentiles, queries per
+# request and throughput. Numbers are for one process serving requests back to back.
+BENCH_USER = 'bench_user_{}'
+BENCH_ADMIN = 'bench_admin'
+BENCH_PASSWORD = 'bench-password'
+SEED_BATCH_SIZE = 5000
+ENDPOINTS = ['blog-home', 'user-posts', 'post-detail', 'blog-search', 'blogcraft', 'auto-schedule']
+
+
+class StubAdapter(requests.adapters.BaseAdapter):
+    # Mounted on the shared http_client session: answers the outbound calls with canned JSON
+    def __init__(self, latency=0):
+        super().__init__()
+        self.latency = latency
+        self.calls = 0
+
+    def send(self, request, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        host = requests.utils.urlparse(request.url).netloc
+        if 'languagetool' in host:
+            body = {'matches': []}
+        elif 'airtable' in host:
+            body = {'id': f'recBench{self.calls}', 'fields': {'Status': 'Scheduled'}, 'records': []}
+        else:
+            body = {'id': self.calls}
+        response = requests.Response()
+        response.status_code = 200
+        response.headers['Content-Type'] = 'application/json'
+        response._content = json.dumps(body).encode()
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def seed(posts, users, stdout=None):
+    """Creates bench users (with profiles) and posts up to the requested counts; rerunning adds only what is missing."""
+    existing_users = User.objects.filter(username__startswith='bench_user_').count()
+    password = make_password(BENCH_PASSWORD)
+    # bulk_create skips the post_save signal that creates profiles, so they are made here too
+    for start in range(existing_users, users, SEED_BATCH_SIZE):
+        batch = User.objects.bulk_create([
+            User(username=BENCH_USER.format(i), email=f'bench{i}@example.com', password=password)
+            for i in range(start, min(start + SEED_BATCH_SIZE, users))
+        ])
+        Profile.objects.bulk_create([Profile(user=user) for user in batch])
+    if not User.objects.filter(username=BENCH_ADMIN).exists():
+        User.objects.create_superuser(BENCH_ADMIN, 'bench-admin@example.com', BENCH_PASSWORD)
+
+    author_ids = list(User.objects.filter(username__startswith='bench_user_').values_list('id', flat=True))
+    rng = random.Random(0)
+    now = timezone.now()
+    paragraph = 'Benchmark post body with a few sentences of filler text. ' * 30
+    rendered = Post(content=paragraph)
+    render_post(rendered)
+    for start in range(Post.objects.count(), posts, SEED_BATCH_SIZE):
+        batch = Post.objects.bulk_create([
+            Post(
+                title=f'Benchmark post {i}',
+                content=paragraph,
+                author_id=rng.choice(author_ids),
+                date_posted=now - timedelta(minutes=i),
+                is_draft=False,
+                content_html=rendered.content_html,
+                excerpt=rendered.excerpt,
+                content_hash=rendered.content_hash,
+                render_version=rendered.render_version,
+            )
+            for i in range(start, min(start + SEED_BATCH_SIZE, posts))
+        ])
+        index_posts(batch)
+        if stdout is not None:
+            stdout.write(f"Seeded {min(start + SEED_BATCH_SIZE, posts)} posts")
+
+
+def request_plan(endpoint, rng, post_ids, usernames):
+    """(method, url, data, who) for one request; who is None (anonymous), 'user' or 'admin'."""
+    if endpoint == 'blog-home':
+        return 'get', reverse('blog-home'), None, None
+    if endpoint == 'user-posts':
+        return 'get', reverse('user-posts', args=[rng.choice(usernames)]), None, None
+    if endpoint == 'post-detail':
+        return 'get', reverse('post-detail', args=[rng.choice(post_ids)]), None, None
+    if endpoint == 'blog-search':
+        return 'get', reverse('blog-search'), {'q': f'benchmark {rng.choice(post_ids)}'}, None
+    if endpoint == 'blogcraft':
+        topic = f'Topic {rng.randrange(10 ** 9)}'
+        data = {'action': 'generate', 'topic': topic, 'primary_keyword': 'django', 'prompt_1': f'Write about {topic}'}
+        return 'post', reverse('blogcraft'), data, 'user'
+    if endpoint == 'auto-schedule':
+        data = {
+            'topic': f'Scheduled {rng.randrange(10 ** 9)}',
+            'primary_keyword': 'django',
+            'additional_keywords': 'python, web',
+            'scheduled_datetime': (timezone.now() + timedelta(days=1)).strftime('%Y-%m-%dT%H:%M'),
+        }
+        return 'post', reverse('auto-schedule'), data, 'admin'
+    raise CommandError(f"Unknown endpoint '{endpoint}', expected one of: {', '.join(ENDPOINTS)}")
+
+
+def percentile(timings, p):
+    if len(timings) < 2:
+        return timings[0] if timings else 0.0
+    return statistics.quantiles(timings, n=100, method='inclusive')[p - 1]
+
+
+def measure(endpoint, count, rng, clients, post_ids, usernames, cold=False):
+    timings = []
+    queries = []
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(count):
+        method, url, data, who = request_plan(endpoint, rng, post_ids, usernames)
+        if cold:
+            cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            request_started = time.perf_counter()
+            response = getattr(clients[who], method)(url, data)
+            timings.append((time.perf_counter() - request_started) * 1000)
+        queries.append(len(ctx.captured_queries))
+        if response.status_code >= 400:
+            errors += 1
+    elapsed = time.perf_counter() - started
+    return {
+        'endpoint': endpoint,
+        'requests': count,
+        'errors': errors,
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'p99_ms': round(percentile(timings, 99), 2),
+        'queries_avg': round(sum(queries) / len(queries), 1),
+        'queries_max': max(queries),
+        'throughput_rps': round(count / elapsed, 1),
+    }
+
+
+def run_benchmark(endpoints, count, seed_value=0, cold=False, http_latency=0):
+    rng = random.Random(seed_value)
+    post_ids = list(Post.objects.values_list('id', flat=True)[:10000])
+    usernames = list(User.objects.filter(username__startswith='bench_user_').values_list('username', flat=True)[:1000])
+    clients = {None: Client(), 'user': Client(), 'admin': Client()}
+    clients['user'].force_login(User.objects.get(username=usernames[0]))
+    clients['admin'].force_login(User.objects.get(username=BENCH_ADMIN))
+
+    session = http_client.get_client().session
+    adapters = dict(session.adapters)
+    stub = StubAdapter(http_latency)
+    session.mount('https://', stub)
+    session.mount('http://', stub)
+    try:
+        # Background jobs run inline so their queries and the (fake) model time land on the request
+        with override_settings(LLM_BACKEND='fake', LLM_FAKE_LATENCY=0, BACKGROUND_TASKS_EAGER=True):
+            results = [measure(endpoint, count, rng, clients, post_ids, usernames, cold) for endpoint in endpoints]
+    finally:
+        session.adapters.clear()
+        session.adapters.update(adapters)
+        ScheduledPost.objects.filter(created_by__username=BENCH_ADMIN).delete()
+    return results
+
+
+class Command(BaseCommand):
+    help = 'Seeds a throwaway database and reports latency percentiles, queries and throughput for the blog endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--users', type=int, default=5000)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+        parser.add_argument('--endpoints', nargs='+', default=ENDPOINTS, choices=ENDPOINTS)
+        parser.add_argument('--cold', action='store_true', help='Clear the cache before every request')
+        parser.add_argument('--http-latency', type=float, default=0, help='Seconds each stubbed outbound call takes')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the seeded benchmark database for the next run')
+        parser.add_argument('--json', help='Also write the results to this file')
+        parser.add_argument('--max-p95', type=float, help='Fail if any endpoint has a p95 above this many ms')
+        parser.add_argument('--max-queries', type=int, help='Fail if any request runs more queries than this')
+
+    def handle(self, *args, **options):
+        # The same test database "manage.py test" uses, so the real one is never touched
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            seed(options['posts'], options['users'], self.stdout)
+            results = run_benchmark(
+                options['endpoints'], options['requests'], cold=options['cold'], http_latency=options['http_latency'],
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        self.stdout.write(
+            f"{'endpoint':<14} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'max q':>6} "
+            f"{'req/s':>8} {'errors':>7}"
+        )
+        for r in results:
+            self.stdout.write(
+                f"{r['endpoint']:<14} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+                f"{r['queries_avg']:>8.1f} {r['queries_max']:>6} {r['throughput_rps']:>8.1f} {r['errors']:>7}"
+            )
+        if options['json']:
+            with open(options['json'], 'w') as f:
+                json.dump({'posts': options['posts'], 'users': options['users'], 'results': results}, f, indent=2)
+
+        failures = [f"{r['endpoint']}: {r['errors']} errors" for r in results if r['errors']]
+        if options['max_p95'] is not None:
+            failures += [f"{r['endpoint']}: p95 {r['p95_ms']}ms" for r in results if r['p95_ms'] > options['max_p95']]
+        if options['max_queries'] is not None:
+            failures += [f"{r['endpoint']}: {r['queries_max']} queries" for r in results if r['queries_max'] > options['max_queries']]
+        if failures:
+            raise CommandError(f"Benchmark thresholds exceeded: {'; '.join(failures)}")
@@ -0,0 +1,71 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.grammar import apply_matches
+
+
+def apply_matches_by_slicing(text, matches):
+    # The loop the views used before blog/grammar.py, kept here as the baseline
+    fixed_text = text
+    offset_shift = 0
+    for match in matches:
+        start = match['offset'] + offset_shift
+        length = match['length']
+        replacement = match['replacements'][0]['value'] if match['replacements'] else fixed_text[start:start+length]
+        fixed_text = fixed_text[:start] + replacement + fixed_text[start+length:]
+        offset_shift += len(replacement) - length
+    return fixed_text
+
+
+def make_document(words, match_count, seed=0):
+    rng = random.Random(seed)
+    vocabulary = ['django', 'teh', 'blog', 'recieve', 'python', 'its', 'definately', 'post', 'a', 'the']
+    tokens = [rng.choice(vocabulary) for _ in range(words)]
+    text = ' '.join(tokens)
+    offsets = []
+    position = 0
+    for token in tokens:
+        offsets.append((position, len(token)))
+        position += len(token) + 1
+    matches = [
+        {'offset': offset, 'length': length, 'replacements': [{'value': 'FIXED'}]}
+        for offset, length in sorted(rng.sample(offsets, min(match_count, len(offsets))))
+    ]
+    return text, matches
+
+
+def best_of(repeat, func, *args):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+class Command(BaseCommand):
+    help = 'Times the single-pass grammar fix applier against the old slicing loop on large documents'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--words', type=int, nargs='+', default=[10000, 100000])
+        parser.add_argument('--matches', type=int, nargs='+', default=[1000, 5000])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'words':>8} {'matches':>8} {'slicing ms':>12} {'single pass ms':>15} {'speedup':>8}")
+        for words in options['words']:
+            for match_count in options['matches']:
+                text, matches = make_document(words, match_count)
+                expected = apply_matches_by_slicing(text, matches)
+                fixed, _ = apply_matches(text, matches)
+                if fixed != expected:
+                    self.stderr.write(self.style.ERROR(f"Outputs differ for {words} words / {match_count} matches"))
+                    continue
+                slicing = best_of(options['repeat'], apply_matches_by_slicing, text, matches)
+                single_pass = best_of(options['repeat'], apply_matches, text, matches)
+                self.stdout.write(
+                    f"{words:>8} {len(matches):>8} {slicing * 1000:>12.2f} {single_pass * 1000:>15.2f} "
+                    f"{slicing / single_pass:>7.1f}x"
+                )
@@ -0,0 +1,137 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Boots the app the way a fresh web worker does, in new interpreters so nothing is already
+# imported, and reports how long each stage takes, the resident memory afterwards and which of
+# the heavy client libraries got imported along the way. A worker should not load any of them.
+HEAVY_MODULES = ['google.generativeai', 'pyairtable', 'celery']
+SECRET_KEYS = ['GEMINI_API_KEY', 'AIRTABLE_API_KEY']
+STAGES = ['setup', 'urlconf', 'application']
+
+PROBE = """
+import json, os, resource, sys, time
+started = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', {settings_module!r})
+import django
+django.setup()
+setup_done = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+urlconf_done = time.perf_counter()
+from django.core.asgi import get_asgi_application
+get_asgi_application()
+application_done = time.perf_counter()
+print(json.dumps({{
+    'setup': setup_done - started,
+    'urlconf': urlconf_done - setup_done,
+    'application': application_done - urlconf_done,
+    'total': application_done - started,
+    'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'modules': len(sys.modules),
+    'heavy': [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+def probe_env(without_keys=False):
+    env = dict(os.environ)
+    if without_keys:
+        for key in SECRET_KEYS:
+            env.pop(key, None)
+    return env
+
+
+def boot_once(without_keys=False, importtime=False):
+    """Boots the app in a new interpreter; returns the probe's measurements (plus its -X importtime output)."""
+    code = PROBE.format(settings_module=os.environ.get('DJANGO_SETTINGS_MODULE', 'django_project.settings'), heavy=HEAVY_MODULES)
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', code]
+    result = subprocess.run(
+        command, cwd=settings.BASE_DIR, env=probe_env(without_keys), capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise CommandError(f"Worker failed to boot:\n{result.stderr.strip()}")
+    sample = json.loads(result.stdout.strip().splitlines()[-1])
+    if importtime:
+        sample['importtime'] = result.stderr
+    return sample
+
+
+def slowest_imports(importtime_output, top=10):
+    # Top-level packages only (the nested ones are indented), by cumulative microseconds
+    imports = []
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith(' ') or name.startswith('  '):
+            continue
+        imports.append((int(cumulative), name.strip()))
+    imports.sort(reverse=True)
+    return [{'module': name, 'ms': round(us / 1000, 1)} for us, name in imports[:top]]
+
+
+def run_benchmark(runs, without_keys=False):
+    samples = [boot_once(without_keys) for _ in range(runs)]
+    summary = {'runs': runs}
+    for field in STAGES + ['total', 'rss_mb']:
+        values = [sample[field] for sample in samples]
+        summary[field] = {'median': round(statistics.median(values), 4), 'max': round(max(values), 4)}
+    summary['modules'] = max(sample['modules'] for sample in samples)
+    summary['heavy'] = sorted({name for sample in samples for name in sample['heavy']})
+    return summary
+
+
+class Command(BaseCommand):
+    help = 'Boots fresh worker processes and reports startup time, resident memory and heavy imports'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--without-keys', action='store_true', help='Boot with the Gemini and Airtable keys unset')
+        parser.add_argument('--top', type=int, default=0, help='Also list the N slowest top-level imports')
+        parser.add_argument('--json', help='Also write the results to this file')
+        parser.add_argument('--max-seconds', type=float, help='Fail if the median boot takes longer than this')
+        parser.add_argument('--max-rss-mb', type=float, help='Fail if the median resident memory is above this')
+        parser.add_argument('--forbid-heavy', action='store_true', help='Fail if any heavy client library was imported')
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError('--runs must be at least 1')
+        summary = run_benchmark(options['runs'], options['without_keys'])
+
+        self.stdout.write(f"{'stage':<12} {'median':>10} {'max':>10}")
+        for field in STAGES + ['total']:
+            self.stdout.write(
+                f"{field:<12} {summary[field]['median'] * 1000:>8.1f}ms {summary[field]['max'] * 1000:>8.1f}ms"
+            )
+        self.stdout.write(f"{'rss':<12} {summary['rss_mb']['median']:>8.1f}MB {summary['rss_mb']['max']:>8.1f}MB")
+        self.stdout.write(f"Modules loaded: {summary['modules']}")
+        self.stdout.write(f"Heavy client libraries loaded: {', '.join(summary['heavy']) or 'none'}")
+
+        if options['top']:
+            summary['slowest_imports'] = slowest_imports(
+                boot_once(options['without_keys'], importtime=True)['importtime'], options['top']
+            )
+            self.stdout.write('Slowest imports:')
+            for row in summary['slowest_imports']:
+                self.stdout.write(f"  {row['ms']:>8.1f}ms  {row['module']}")
+
+        if options['json']:
+            with open(options['json'], 'w') as f:
+                json.dump(summary, f, indent=2)
+
+        failures = []
+        if options['max_seconds'] is not None and summary['total']['median'] > options['max_seconds']:
+            failures.append(f"boot took {summary['total']['median']}s")
+        if options['max_rss_mb'] is not None and summary['rss_mb']['median'] > options['max_rss_mb']:
+            failures.append(f"resident memory {summary['rss_mb']['median']}MB")
+        if options['forbid_heavy'] and summary['heavy']:
+            failures.append(f"imported {', '.join(summary['heavy'])}")
+        if failures:
+            raise CommandError(f"Startup thresholds exceeded: {'; '.join(failures)}")
@@ -0,0 +1,72 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from blog.airtable_sync import due_records
+from blog.models import Post, ScheduledPost
+
+
+def hot_queries():
+    now = timezone.now()
+    return [
+        ('post list', 'blog_post',
+         Post.objects.order_by('-date_posted', '-id')[:6]),
+        ('post list after cursor', 'blog_post',
+         Post.objects.filter(Q(date_posted__lt=now) | Q(pk__lt=1), date_posted__lte=now)
+         .order_by('-date_posted', '-id')[:6]),
+        ('author posts', 'blog_post',
+         Post.objects.filter(author_id=1).order_by('-date_posted', '-id')[:6]),
+        ('sidebar latest posts', 'blog_post',
+         Post.objects.order_by('-date_posted').values('id', 'title')[:5]),
+        ('post detail', 'blog_post',
+         Post.objects.filter(pk=1)),
+        ('due scheduled posts', 'blog_scheduledpost',
+         ScheduledPost.objects.filter(scheduled_datetime__lte=now, created_by__is_superuser=True)),
+        ('scheduled post publish lookup', 'blog_scheduledpost',
+         ScheduledPost.objects.filter(topic='topic', primary_keyword='keyword', additional_keywords='a, b')),
+        ('due airtable records', 'blog_airtablerecord',
+         due_records(now)),
+    ]
+
+
+def is_sequential_scan(plan, table):
+    if connection.vendor == 'postgresql':
+        return re.search(rf'Seq Scan on {table}\b', plan) is not None
+    if connection.vendor == 'sqlite':
+        # "SCAN blog_post USING INDEX ..." walks an index in order, which is fine for ORDER BY ... LIMIT
+        return any(
+            re.search(rf'\bSCAN {table}\b', line) and 'USING' not in line
+            for line in plan.splitlines()
+        )
+    raise CommandError(f"Don't know how to read {connection.vendor} query plans.")
+
+
+class Command(BaseCommand):
+    help = 'Runs EXPLAIN on the hot blog queries and fails if any of them falls back to a sequential scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every query plan')
+
+    def handle(self, *args, **options):
+        failures = []
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # Small dev tables make seq scans the cheapest plan; this asks whether an index exists at all
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            for name, table, queryset in hot_queries():
+                plan = queryset.explain()
+                if options['verbose_plans']:
+                    self.stdout.write(f"{name}:\n{plan}\n")
+                if is_sequential_scan(plan, table):
+                    failures.append(name)
+                    self.stdout.write(self.style.ERROR(f"SEQ SCAN  {name}"))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f"index     {name}"))
+
+        if failures:
+            raise CommandError(f"Sequential scans in: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS("All hot queries use an index."))
@@ -0,0 +1,70 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from blog.caching import purge_all_pages
+from blog.models import Post
+from blog.rendering import RENDERED_FIELDS, RENDERER_VERSION, content_hash, render_batch
+
+
+def stale_posts(rerender_all=False):
+    posts = Post.objects.all()
+    if not rerender_all:
+        posts = posts.filter(Q(render_version__lt=RENDERER_VERSION) | Q(content_hash=''))
+    return posts
+
+
+def batches(queryset, size):
+    # Keyset over the primary key, so each batch is an index range scan however far in we are
+    last_pk = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'content')[:size])
+        if not rows:
+            return
+        last_pk = rows[-1][0]
+        yield rows
+
+
+def save_rendered(results):
+    """Stores a batch of (pk, html, excerpt, hash); rows whose content changed since it was read are left alone."""
+    with transaction.atomic():
+        current = dict(Post.objects.select_for_update().filter(pk__in=[row[0] for row in results]).values_list('pk', 'content'))
+        now = timezone.now()
+        posts = [
+            Post(pk=pk, content_html=html, excerpt=excerpt, content_hash=digest, render_version=RENDERER_VERSION, updated_at=now)
+            for pk, html, excerpt, digest in results
+            if pk in current and content_hash(current[pk]) == digest
+        ]
+        # The pages change with the rendering, so their sitemap lastmod moves too
+        Post.objects.bulk_update(posts, RENDERED_FIELDS + ['updated_at'])
+    return len(posts)
+
+
+class Command(BaseCommand):
+    help = 'Renders the Markdown of posts that were never rendered or were rendered by an older renderer version'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Re-render every post')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=4, help='Processes rendering batches in parallel')
+
+    def handle(self, *args, **options):
+        queryset = stale_posts(options['all'])
+        saved = 0
+        # Markdown parsing is CPU-bound, so it runs in worker processes; this one only reads and writes
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            pending = []
+            for rows in batches(queryset, options['batch_size']):
+                pending.append(pool.submit(render_batch, rows))
+                if len(pending) >= options['workers'] * 2:
+                    saved += save_rendered(pending.pop(0).result())
+                    self.stdout.write(f"Rendered {saved} posts")
+            for future in pending:
+                saved += save_rendered(future.result())
+
+        if saved:
+            purge_all_pages()
+        self.stdout.write(self.style.SUCCESS(f"Rendered {saved} posts with renderer version {RENDERER_VERSION}."))
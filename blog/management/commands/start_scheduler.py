@@ -1,13 +1,45 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from django_apscheduler.jobstores import DjangoJobStore
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from blog.cron import publish_scheduled_blogs
+from blog.drafts import prune_drafts
+from blog.drafts import prune_times as draft_prune_times
+from blog.due_scheduler import DueTimeScheduler, airtable_times, scheduled_post_times
+from blog.jobs import prune_jobs, prune_times
+from blog.scheduled import process_due_posts
 
 class Command(BaseCommand):
-    help = 'Starts the APScheduler to run periodic tasks'
+    help = 'Starts the scheduler that publishes blogs when they are due'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode', choices=['due', 'cron'], default=getattr(settings, 'SCHEDULER_MODE', 'due'),
+            help="'due' sleeps until the next publish time, 'cron' checks every minute",
+        )
 
     def handle(self, *args, **options):
+        if options['mode'] == 'due':
+            self.run_due_scheduler()
+        else:
+            self.run_cron_scheduler()
+
+    def run_due_scheduler(self):
+        scheduler = DueTimeScheduler({
+            'airtable': (airtable_times, publish_scheduled_blogs),
+            'scheduled_posts': (scheduled_post_times, process_due_posts),
+            'prune_jobs': (prune_times, prune_jobs),
+            'prune_drafts': (draft_prune_times, prune_drafts),
+        }, stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS("Scheduler started successfully."))
+        try:
+            scheduler.run_forever()
+        except (KeyboardInterrupt, SystemExit):
+            scheduler.stop()
+            self.stdout.write(self.style.SUCCESS("Scheduler shut down successfully."))
+
+    def run_cron_scheduler(self):
         scheduler = BackgroundScheduler()
         scheduler.add_jobstore(DjangoJobStore(), "default")
 
@@ -19,6 +51,20 @@ class Command(BaseCommand):
             max_instances=1,
             replace_existing=True,
         )
+        scheduler.add_job(
+            prune_jobs,
+            trigger=CronTrigger(minute=0),  # Hourly
+            id="prune_jobs",
+            max_instances=1,
+            replace_existing=True,
+        )
+        scheduler.add_job(
+            prune_drafts,
+            trigger=CronTrigger(minute=30),  # Hourly
+            id="prune_drafts",
+            max_instances=1,
+            replace_existing=True,
+        )
 
         scheduler.start()
         self.stdout.write(self.style.SUCCESS("Scheduler started successfully."))
@@ -30,4 +76,4 @@ class Command(BaseCommand):
                 time.sleep(1)
         except (KeyboardInterrupt, SystemExit):
             scheduler.shutdown()
-            self.stdout.write(self.style.SUCCESS("Scheduler shut down successfully."))
\ No newline at end of file
+            self.stdout.write(self.style.SUCCESS("Scheduler shut down successfully."))
@@ -0,0 +1,289 @@
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.template.backends.django import DjangoTemplates
+
+from .caching import incr_counter
+
+# Per-request timings: wall time, database queries and time, outbound calls by service and template
+# rendering. Each response gets a Server-Timing header (for staff, or everyone with DEBUG on) and
+# the totals per view are kept in the cache, so every worker adds to the same /metrics/ output.
+METRICS_KEY = 'blog:metrics:{view}:{counter}'
+METRICS_VIEWS_KEY = 'blog:metrics:views'
+METRICS_SERVICES_KEY = 'blog:metrics:services'
+# Upper bounds (seconds) of the request duration histogram
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SERVICES = {
+    'api.languagetool.org': 'languagetool',
+    'api.airtable.com': 'airtable',
+}
+
+_current = ContextVar('request_metrics', default=None)
+_pending = {}
+_pending_lock = threading.Lock()
+_last_flush = [0.0]
+
+
+class RequestMetrics:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.wall = 0.0
+        self.db_queries = 0
+        self.db = 0.0
+        self.templates = 0.0
+        self.services = {}
+
+    def add_service(self, service, seconds):
+        self.services[service] = self.services.get(service, 0.0) + seconds
+
+    def server_timing(self):
+        entries = [
+            f'app;dur={self.wall * 1000:.1f}',
+            f'db;dur={self.db * 1000:.1f};desc="{self.db_queries} queries"',
+            f'tpl;dur={self.templates * 1000:.1f}',
+        ]
+        entries += [f'{service};dur={seconds * 1000:.1f}' for service, seconds in sorted(self.services.items())]
+        return ', '.join(entries)
+
+
+def service_for(host):
+    """Groups outbound calls per service: the known APIs by host, anything else is the WordPress site.
+    Gemini goes through its own SDK and is timed in blog.llm instead."""
+    return SERVICES.get(host, 'languagetool' if 'languagetool' in host else 'wordpress')
+
+
+def record_service(service, seconds):
+    # No-op outside a request, e.g. in the scheduler or a background job
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add_service(service, seconds)
+
+
+@contextmanager
+def timed_service(service):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_service(service, time.perf_counter() - started)
+
+
+@asynccontextmanager
+async def streamed_response(view):
+    # A streamed body is sent after PerformanceMiddleware is done with the request, so the services
+    # it waits on (the model, mostly) are added to the view's totals here once the stream ends
+    metrics = RequestMetrics()
+    previous = _current.get()
+    _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.set(previous)
+        queue(view, service_counters(metrics))
+        await sync_to_async(flush)()
+
+
+class TimedTemplate:
+    # Only the templates views render directly are timed; includes and extends render inside them
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics = _current.get()
+            if metrics is not None:
+                metrics.templates += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+def queue_counters(view, metrics):
+    counters = {
+        'requests': 1,
+        'wall_us': int(metrics.wall * 1_000_000),
+        'db_queries': metrics.db_queries,
+        'db_us': int(metrics.db * 1_000_000),
+        'template_us': int(metrics.templates * 1_000_000),
+    }
+    bucket = next((str(le) for le in DURATION_BUCKETS if metrics.wall <= le), '+Inf')
+    counters[f'bucket:{bucket}'] = 1
+    counters.update(service_counters(metrics))
+    queue(view, counters)
+
+
+def service_counters(metrics):
+    return {f'http_us:{service}': int(seconds * 1_000_000) for service, seconds in metrics.services.items()}
+
+
+def queue(view, counters):
+    with _pending_lock:
+        for counter, delta in counters.items():
+            key = (view, counter)
+            _pending[key] = _pending.get(key, 0) + delta
+
+
+def flush_due():
+    return bool(_pending) and time.monotonic() - _last_flush[0] >= getattr(settings, 'METRICS_FLUSH_INTERVAL', 1)
+
+
+def flush(force=False):
+    """Adds this worker's queued counters to the shared ones, at most once per METRICS_FLUSH_INTERVAL."""
+    with _pending_lock:
+        if not _pending or (not force and not flush_due()):
+            return
+        pending = dict(_pending)
+        _pending.clear()
+        _last_flush[0] = time.monotonic()
+
+    views = cache.get(METRICS_VIEWS_KEY, [])
+    new_views = sorted({view for view, _ in pending} - set(views))
+    if new_views:
+        cache.set(METRICS_VIEWS_KEY, views + new_views, None)
+    services = cache.get(METRICS_SERVICES_KEY, [])
+    new_services = sorted({c.split(':', 1)[1] for _, c in pending if c.startswith('http_us:')} - set(services))
+    if new_services:
+        cache.set(METRICS_SERVICES_KEY, services + new_services, None)
+    for (view, counter), delta in pending.items():
+        if delta:
+            incr_counter(METRICS_KEY.format(view=view, counter=counter), delta)
+
+
+async def user_is_staff(request):
+    # A sync view has loaded request.user by now; otherwise it is looked up without leaving the loop
+    user = getattr(request, '_cached_user', None)
+    if user is None and hasattr(request, 'auser'):
+        user = await request.auser()
+    return getattr(user, 'is_staff', False)
+
+
+class PerformanceMiddleware:
+    # Runs in whichever mode the stack around it does, so the ASGI app doesn't hop to a thread
+    # and back for every request, the streamed views included
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with self.measure() as metrics:
+            response = self.get_response(request)
+        self.record(request, metrics)
+        flush()
+        if settings.DEBUG or getattr(getattr(request, 'user', None), 'is_staff', False):
+            response['Server-Timing'] = metrics.server_timing()
+        return response
+
+    async def __acall__(self, request):
+        with self.measure() as metrics:
+            response = await self.get_response(request)
+        self.record(request, metrics)
+        if flush_due():
+            await sync_to_async(flush)()
+        if settings.DEBUG or await user_is_staff(request):
+            response['Server-Timing'] = metrics.server_timing()
+        return response
+
+    @contextmanager
+    def measure(self):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            yield metrics
+        finally:
+            _current.reset(token)
+        metrics.wall = time.perf_counter() - metrics.started
+
+    def record(self, request, metrics):
+        match = request.resolver_match
+        queue_counters(match.view_name if match else 'unmatched', metrics)
+
+
+def time_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.db_queries += 1
+            metrics.db += time.perf_counter() - started
+
+
+def add_query_timer(connection):
+    # Installed on every connection as it opens (see blog.signals) rather than per request: under
+    # ASGI a sync view's queries run on a connection of its own thread, not the middleware's, and
+    # the request's metrics only reach that thread through the context variable
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+def prometheus_text():
+    flush(force=True)
+    views = cache.get(METRICS_VIEWS_KEY, [])
+    services = cache.get(METRICS_SERVICES_KEY, [])
+    counters = ['requests', 'wall_us', 'db_queries', 'db_us', 'template_us']
+    counters += [f'bucket:{le}' for le in DURATION_BUCKETS] + ['bucket:+Inf']
+    counters += [f'http_us:{service}' for service in services]
+    keys = {(view, c): METRICS_KEY.format(view=view, counter=c) for view in views for c in counters}
+    values = cache.get_many(list(keys.values()))
+
+    def value(view, counter):
+        return values.get(keys[(view, counter)], 0)
+
+    lines = [
+        '# HELP blog_request_duration_seconds Time spent handling requests, by view.',
+        '# TYPE blog_request_duration_seconds histogram',
+    ]
+    for view in views:
+        cumulative = 0
+        for le in [str(le) for le in DURATION_BUCKETS] + ['+Inf']:
+            cumulative += value(view, f'bucket:{le}')
+            lines.append(f'blog_request_duration_seconds_bucket{{view="{view}",le="{le}"}} {cumulative}')
+        lines.append(f'blog_request_duration_seconds_sum{{view="{view}"}} {value(view, "wall_us") / 1e6}')
+        lines.append(f'blog_request_duration_seconds_count{{view="{view}"}} {value(view, "requests")}')
+
+    for name, counter, help_text in (
+        ('blog_db_queries_total', 'db_queries', 'Database queries run while handling requests.'),
+        ('blog_db_duration_seconds_total', 'db_us', 'Time spent in database queries.'),
+        ('blog_template_duration_seconds_total', 'template_us', 'Time spent rendering templates.'),
+    ):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for view in views:
+            total = value(view, counter)
+            lines.append(f'{name}{{view="{view}"}} {total / 1e6 if counter.endswith("_us") else total}')
+
+    lines += [
+        '# HELP blog_http_duration_seconds_total Time spent waiting on outbound services while handling requests.',
+        '# TYPE blog_http_duration_seconds_total counter',
+    ]
+    for view in views:
+        for service in services:
+            seconds = value(view, f'http_us:{service}') / 1e6
+            if seconds:
+                lines.append(f'blog_http_duration_seconds_total{{view="{view}",service="{service}"}} {seconds}')
+    return '\n'.join(lines) + '\n'
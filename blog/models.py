@@ -2,18 +2,60 @@ from django.db import models
 from django.utils import timezone
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.utils.html import linebreaks
+from django.utils.safestring import mark_safe
+
+from .rendering import RENDERED_FIELDS, make_excerpt, render_markdown, render_post
+
+# Columns the list pages never show; they read the excerpt instead
+LIST_DEFERRED_FIELDS = ['content', 'content_html']
 
 class Post(models.Model):
     title = models.CharField(max_length=100)
     content = models.TextField()
     date_posted = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)  # lastmod/updated of the post in the sitemap and feeds
     author = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     seo_keywords = models.CharField(max_length=200, blank=True, null=True)
     is_draft = models.BooleanField(default=True)
+    # content rendered from Markdown on save, see blog/rendering.py
+    content_html = models.TextField(blank=True, editable=False)
+    excerpt = models.TextField(blank=True, editable=False)  # what the list pages show instead of content
+    content_hash = models.CharField(max_length=64, blank=True, editable=False)
+    render_version = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Matches the keyset pagination order, see blog/pagination.py
+            models.Index(fields=['-date_posted', '-id'], name='post_date_posted_id_idx'),
+            # UserPostListView: one author's posts in the same order
+            models.Index(fields=['author', '-date_posted', '-id'], name='post_author_date_posted_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        rendered = render_post(self)
+        if kwargs.get('update_fields') is not None:
+            # auto_now is only written when it is one of the update_fields
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'updated_at', *(RENDERED_FIELDS if rendered else [])}
+        super().save(*args, **kwargs)
+
+    @property
+    def body_html(self):
+        # Rows that render_posts hasn't reached yet still show their text
+        if self.content_html:
+            return mark_safe(self.content_html)
+        return mark_safe(linebreaks(self.content, autoescape=True))
+
+    @property
+    def excerpt_text(self):
+        # Same fallback for the lists; content is deferred there, so this costs a query per unrendered row
+        if self.excerpt:
+            return self.excerpt
+        return make_excerpt(render_markdown(self.content))
+
     def get_absolute_url(self):
         return reverse('post-detail', kwargs={'pk': self.pk})
     
@@ -24,6 +66,115 @@ class ScheduledPost(models.Model):
     scheduled_datetime = models.DateTimeField()
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)  # set while a worker is generating it
+
+    class Meta:
+        indexes = [
+            # blog.tasks.process_scheduled_posts picks up everything due
+            models.Index(fields=['scheduled_datetime'], name='scheduledpost_due_idx'),
+            # GenerateBlogView publish clears the matching schedule; additional_keywords is left
+            # out to keep the key narrow, it is checked on the few rows this finds
+            models.Index(fields=['topic', 'primary_keyword'], name='scheduledpost_topic_kw_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} - {self.scheduled_datetime}"
+
+class GenerationJob(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    flow = models.CharField(max_length=20)  # 'generate' (GenerateBlogView) or 'blogcraft' (BlogCraftView)
+    action = models.CharField(max_length=20)
+    prompt = models.TextField()
+    label = models.TextField(blank=True)  # the user's prompt, shown next to the draft
+    step = models.PositiveSmallIntegerField(default=0)  # BlogCraft refine step the job belongs to
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    result = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def is_pending(self):
+        return self.status in (self.QUEUED, self.RUNNING)
+
+    def __str__(self):
+        return f"{self.flow}:{self.action} ({self.status})"
+
+
+class LLMResponse(models.Model):
+    # Database backend of the LLM response cache, see blog/llm_cache.py
+    key = models.CharField(max_length=64, unique=True)  # sha256 of (backend, model, prompt, params)
+    model_name = models.CharField(max_length=50)
+    response = models.TextField()
+    created_at = models.DateTimeField(default=timezone.now)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+    hits = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.model_name} {self.key[:12]}"
+
+
+class DraftRevision(models.Model):
+    # One step of a generator's draft history; the session only keeps the id of the newest one.
+    # Most revisions store a delta against their parent instead of the full article, see blog/drafts.py
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    root = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    parent = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    position = models.PositiveSmallIntegerField(default=0)  # index of the draft in the history shown to the user
+    label = models.TextField(blank=True)
+    snapshot = models.TextField(null=True, blank=True)
+    delta = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def thread_id(self):
+        return self.root_id or self.pk
+
+    def __str__(self):
+        return f"Draft {self.position} of {self.thread_id}"
+
+
+class AirtableRecord(models.Model):
+    # Local copy of the Airtable "Blog Posts" table, kept fresh by blog/airtable_sync.py.
+    # Only the fields the publisher needs are mirrored.
+    record_id = models.CharField(max_length=32, unique=True)
+    title = models.TextField(blank=True)
+    content = models.TextField(blank=True)
+    status = models.CharField(max_length=32, blank=True)
+    publish_date = models.DateTimeField(null=True, blank=True)
+    wordpress_post_id = models.CharField(max_length=32, blank=True)
+    synced_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # blog.cron: what is due to go to WordPress
+            models.Index(fields=['status', 'publish_date'], name='airtablerecord_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.title} ({self.status})"
+
+    def as_record(self):
+        # Same shape as an Airtable API record, which is what the publisher works with
+        return {'id': self.record_id, 'fields': {'Title': self.title, 'Content': self.content, 'Status': self.status}}
+
+
+class AirtableSyncState(models.Model):
+    table_name = models.CharField(max_length=100, unique=True)
+    synced_at = models.DateTimeField(null=True, blank=True)
+    full_synced_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
-        return f"{self.topic} - {self.scheduled_datetime}"
\ No newline at end of file
+        return f"{self.table_name} synced at {self.synced_at}"
@@ -0,0 +1,122 @@
+import base64
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import Http404
+from django.utils.functional import cached_property
+
+# Cursors point at the (date_posted, id) of a boundary row, so every page is one index range
+# scan of per_page + 1 rows no matter how deep it is. 'a' reads after the row, 'b' before it,
+# and 'l' is the last page.
+NEXT, PREVIOUS, LAST = 'a', 'b', 'l'
+
+
+def encode_cursor(direction, post=None):
+    raw = direction if post is None else f'{direction}|{post.date_posted.isoformat()}|{post.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        direction, *position = raw.split('|')
+        if direction == LAST and not position:
+            return direction, None, None
+        date_posted, pk = position
+        if direction not in (NEXT, PREVIOUS):
+            raise ValueError(direction)
+        return direction, datetime.fromisoformat(date_posted), int(pk)
+    except ValueError:
+        raise Http404('Invalid page cursor.')
+
+
+class KeysetPage:
+    is_keyset = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        return encode_cursor(NEXT, self.object_list[-1]) if self._has_next else None
+
+    @property
+    def previous_cursor(self):
+        return encode_cursor(PREVIOUS, self.object_list[0]) if self._has_previous else None
+
+    @property
+    def last_cursor(self):
+        return encode_cursor(LAST)
+
+
+class KeysetPaginator:
+    ordering = ('-date_posted', '-id')
+
+    def __init__(self, queryset, per_page, with_count=False):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.with_count = with_count
+
+    @cached_property
+    def count(self):
+        # COUNT(*) is the other linear cost of deep pages, so it only runs when asked for
+        return self.queryset.count() if self.with_count else None
+
+    def page(self, cursor=None):
+        limit = self.per_page + 1
+        direction, date_posted, pk = decode_cursor(cursor) if cursor else (None, None, None)
+
+        if direction == NEXT:
+            # The plain date_posted bound lets the database seek straight into the index
+            rows = list(self.queryset.filter(
+                Q(date_posted__lt=date_posted) | Q(pk__lt=pk), date_posted__lte=date_posted
+            ).order_by(*self.ordering)[:limit])
+            return KeysetPage(rows[:self.per_page], self, len(rows) > self.per_page, True)
+
+        if direction in (PREVIOUS, LAST):
+            queryset = self.queryset
+            if direction == PREVIOUS:
+                queryset = queryset.filter(
+                    Q(date_posted__gt=date_posted) | Q(pk__gt=pk), date_posted__gte=date_posted
+                )
+            rows = list(queryset.order_by('date_posted', 'id')[:limit])
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            return KeysetPage(rows, self, direction == PREVIOUS, has_previous)
+
+        rows = list(self.queryset.order_by(*self.ordering)[:limit])
+        return KeysetPage(rows[:self.per_page], self, len(rows) > self.per_page, False)
+
+
+class KeysetPaginationMixin:
+    cursor_kwarg = 'cursor'
+    keyset_count = False
+
+    def paginate_queryset(self, queryset, page_size):
+        if getattr(settings, 'BLOG_PAGINATION_MODE', 'keyset') != 'keyset':
+            return super().paginate_queryset(queryset, page_size)
+        paginator = KeysetPaginator(queryset, page_size, with_count=self.keyset_count)
+        page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        return (paginator, page, page.object_list, page.has_other_pages())
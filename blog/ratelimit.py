@@ -0,0 +1,30 @@
+import threading
+import time
+
+# Spaces calls to an outside API evenly. Limiters are shared per process, so every thread talking
+# to the same API waits in one line; separate worker processes each get their own budget.
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class RateLimiter:
+    def __init__(self, per_second):
+        self.interval = 1 / per_second
+        self.next_at = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def get_rate_limiter(name, per_second):
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None or limiter.interval != 1 / per_second:
+            limiter = _limiters[name] = RateLimiter(per_second)
+    return limiter
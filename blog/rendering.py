@@ -0,0 +1,69 @@
+import hashlib
+import re
+from html import unescape
+
+import markdown
+import nh3
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+# Post.content is Markdown (the generators always produce it). It is turned into sanitized HTML
+# once, when the post is saved, and pages only output the stored result. Bump RENDERER_VERSION
+# whenever the output below changes, then run "manage.py render_posts" to re-render old posts.
+RENDERER_VERSION = 2
+EXCERPT_WORDS = 30
+RENDERED_FIELDS = ['content_html', 'excerpt', 'content_hash', 'render_version']
+MARKDOWN_EXTENSIONS = ['extra', 'sane_lists']
+ALLOWED_TAGS = {
+    'a', 'abbr', 'blockquote', 'br', 'code', 'dd', 'del', 'div', 'dl', 'dt', 'em', 'h1', 'h2', 'h3',
+    'h4', 'h5', 'h6', 'hr', 'img', 'li', 'ol', 'p', 'pre', 'strong', 'sub', 'sup', 'table', 'tbody',
+    'td', 'th', 'thead', 'tr', 'ul',
+}
+ALLOWED_ATTRIBUTES = {
+    'a': {'href', 'title'},
+    'abbr': {'title'},
+    'img': {'src', 'alt', 'title'},
+    'td': {'align'},
+    'th': {'align'},
+}
+
+
+def content_hash(content):
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def render_markdown(content):
+    # Raw HTML in the Markdown goes through the same allow-list, so a prompt can't inject a script
+    html = markdown.markdown(content, extensions=MARKDOWN_EXTENSIONS, output_format='html')
+    return nh3.clean(html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES, link_rel='noopener noreferrer nofollow')
+
+
+def make_excerpt(html):
+    # Generated posts open with their title as a heading, which the lists already show
+    html = re.sub(r'^\s*<h1>.*?</h1>', '', html, count=1, flags=re.S)
+    text = ' '.join(unescape(strip_tags(html)).split())
+    return Truncator(text).words(EXCERPT_WORDS)
+
+
+def is_rendered(post):
+    return post.render_version == RENDERER_VERSION and post.content_hash == content_hash(post.content)
+
+
+def render_post(post):
+    """Fills in post.content_html and post.excerpt if the content or renderer changed; returns whether it did."""
+    if is_rendered(post):
+        return False
+    post.content_html = render_markdown(post.content)
+    post.excerpt = make_excerpt(post.content_html)
+    post.content_hash = content_hash(post.content)
+    post.render_version = RENDERER_VERSION
+    return True
+
+
+def render_batch(rows):
+    # Runs in render_posts' worker processes: plain data in and out, no database access
+    results = []
+    for pk, content in rows:
+        html = render_markdown(content)
+        results.append((pk, html, make_excerpt(html), content_hash(content)))
+    return results
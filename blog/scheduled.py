@@ -0,0 +1,118 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import llm
+from .caching import purge_created_posts
+from .models import Post, ScheduledPost
+from .ratelimit import get_rate_limiter
+from .rendering import render_post
+from .search import index_posts
+
+logger = logging.getLogger(__name__)
+
+# Workers claim a batch of due posts in a short transaction (skipping rows another worker has
+# locked), generate them in parallel outside it, then write the posts and deletes in bulk.
+
+
+def build_prompt(sp):
+    return (
+        f"Write a 500-word blog post on '{sp.topic}'. Ensure the article uses the primary keyword '{sp.primary_keyword}' "
+        f"5-10 times (1-2% density) for SEO. Include additional keywords '{sp.additional_keywords}' naturally."
+    )
+
+
+def extract_title(content, default):
+    for line in content.split('\n'):
+        if line.strip().startswith('#'):
+            return line.strip().replace('#', '').strip()
+    return default
+
+
+def claim_due_posts(limit):
+    now = timezone.now()
+    # Claims older than the timeout belong to a worker that died or failed; they are fair game again
+    stale = now - timedelta(seconds=getattr(settings, 'SCHEDULED_POSTS_CLAIM_TIMEOUT', 300))
+    with transaction.atomic():
+        claimed = list(
+            ScheduledPost.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(Q(claimed_at__isnull=True) | Q(claimed_at__lt=stale),
+                    scheduled_datetime__lte=now, created_by__is_superuser=True)
+            .order_by('scheduled_datetime')[:limit]
+        )
+        ScheduledPost.objects.filter(pk__in=[sp.pk for sp in claimed]).update(claimed_at=now)
+    return claimed
+
+
+def generate_content(sp, limiter):
+    logger.info(f"Processing scheduled post: {sp.topic}")
+    limiter.wait()
+    try:
+        content = llm.generate(build_prompt(sp))
+    except Exception as e:
+        # Left claimed, so it is retried once the claim times out rather than straight away
+        logger.error(f"Failed to generate content for {sp.topic}: {str(e)}")
+        return None
+    logger.info(f"Generated content for: {sp.topic}")
+    return content
+
+
+def _generate_in_worker(sp, limiter):
+    close_old_connections()
+    try:
+        return generate_content(sp, limiter)
+    finally:
+        close_old_connections()
+
+
+def save_generated_posts(claimed, contents):
+    posts = []
+    done = []
+    for sp, content in zip(claimed, contents):
+        if content is None:
+            continue
+        posts.append(Post(
+            title=extract_title(content, sp.topic)[:100],
+            content=content,
+            author_id=sp.created_by_id,
+            seo_keywords=f"{sp.primary_keyword}, {sp.additional_keywords}"[:200],
+            is_draft=False  # Published directly
+        ))
+        render_post(posts[-1])  # bulk_create doesn't call save(), which renders the Markdown
+        done.append(sp.pk)
+    with transaction.atomic():
+        Post.objects.bulk_create(posts)
+        index_posts(posts)  # bulk_create skips the post_save signal that indexes posts
+        ScheduledPost.objects.filter(pk__in=done).delete()
+    purge_created_posts(posts)
+    for post in posts:
+        logger.info(f"Published post: {post.title}")
+    return len(posts)
+
+
+def process_due_posts(concurrency=None, batch_size=None):
+    """Generates and publishes every due ScheduledPost; returns how many posts were published."""
+    concurrency = concurrency or getattr(settings, 'SCHEDULED_POSTS_CONCURRENCY', 4)
+    batch_size = batch_size or concurrency * 4
+    limiter = get_rate_limiter('llm', getattr(settings, 'LLM_REQUESTS_PER_MINUTE', 60) / 60)
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='scheduled-post') if concurrency > 1 else None
+    published = 0
+    try:
+        while True:
+            claimed = claim_due_posts(batch_size)
+            if not claimed:
+                break
+            if executor is not None:
+                contents = list(executor.map(lambda sp: _generate_in_worker(sp, limiter), claimed))
+            else:
+                contents = [generate_content(sp, limiter) for sp in claimed]
+            published += save_generated_posts(claimed, contents)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return published
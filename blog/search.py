@@ -0,0 +1,186 @@
+import re
+
+from django.db import connection
+
+from .models import LIST_DEFERRED_FIELDS, Post
+
+# Full-text search over post titles and content. The index lives next to blog_post in a table of
+# its own: a tsvector column with a GIN index on Postgres, an FTS5 virtual table on SQLite. It is
+# kept up to date per post from the Post signals, and in bulk wherever posts are bulk_created.
+# Neither table references blog_post, so `flush` can truncate posts without knowing about the index;
+# rows of deleted posts are removed by the post_delete signal and any orphans after each migrate/flush.
+SEARCH_TABLE = 'blog_post_search'
+SEARCH_CONFIG = 'english'
+INDEX_BATCH_SIZE = 1000
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query or '')
+
+
+class PostgresSearch:
+
+    def create_index(self, cursor):
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+            f"post_id bigint PRIMARY KEY, document tsvector NOT NULL)"
+        )
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_gin ON {SEARCH_TABLE} USING gin (document)")
+
+    def remove_orphans(self, cursor):
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} s WHERE NOT EXISTS (SELECT 1 FROM blog_post p WHERE p.id = s.post_id)")
+
+    def drop_index(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+    def index_posts(self, cursor, ids):
+        # Title words rank above content words
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (post_id, document) "
+            f"SELECT id, setweight(to_tsvector(%s, coalesce(title, '')), 'A') || "
+            f"setweight(to_tsvector(%s, coalesce(content, '')), 'B') FROM blog_post WHERE id = ANY(%s) "
+            f"ON CONFLICT (post_id) DO UPDATE SET document = EXCLUDED.document",
+            [SEARCH_CONFIG, SEARCH_CONFIG, list(ids)],
+        )
+
+    def remove_posts(self, cursor, ids):
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE post_id = ANY(%s)", [list(ids)])
+
+    def count(self, cursor, query):
+        cursor.execute(
+            f"SELECT count(*) FROM {SEARCH_TABLE} WHERE document @@ websearch_to_tsquery(%s, %s)",
+            [SEARCH_CONFIG, query],
+        )
+        return cursor.fetchone()[0]
+
+    def search(self, cursor, query, limit, offset):
+        cursor.execute(
+            f"SELECT post_id FROM {SEARCH_TABLE}, websearch_to_tsquery(%s, %s) q WHERE document @@ q "
+            f"ORDER BY ts_rank_cd(document, q) DESC, post_id DESC LIMIT %s OFFSET %s",
+            [SEARCH_CONFIG, query, limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class SqliteSearch:
+
+    def create_index(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+            f"USING fts5(title, content, tokenize='porter unicode61')"
+        )
+
+    def remove_orphans(self, cursor):
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid NOT IN (SELECT id FROM blog_post)")
+
+    def drop_index(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+    def index_posts(self, cursor, ids):
+        # The rowid is the post id; FTS5 has no upsert, so replace the rows
+        placeholders = ', '.join(['%s'] * len(ids))
+        self.remove_posts(cursor, ids)
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, title, content) "
+            f"SELECT id, title, content FROM blog_post WHERE id IN ({placeholders})",
+            list(ids),
+        )
+
+    def remove_posts(self, cursor, ids):
+        placeholders = ', '.join(['%s'] * len(ids))
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", list(ids))
+
+    def match(self, query):
+        # Every word must appear; quoting keeps FTS5 operators in the input from being parsed
+        return ' '.join(f'"{term}"' for term in search_terms(query))
+
+    def count(self, cursor, query):
+        cursor.execute(f"SELECT count(*) FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", [self.match(query)])
+        return cursor.fetchone()[0]
+
+    def search(self, cursor, query, limit, offset):
+        # bm25() is lower for better matches; title hits weigh ten times a content hit
+        cursor.execute(
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+            f"ORDER BY bm25({SEARCH_TABLE}, 10.0, 1.0), rowid DESC LIMIT %s OFFSET %s",
+            [self.match(query), limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    'postgresql': PostgresSearch,
+    'sqlite': SqliteSearch,
+}
+
+
+def get_backend():
+    try:
+        return BACKENDS[connection.vendor]()
+    except KeyError:
+        raise ValueError(f"Full-text search is not available on {connection.vendor}, expected one of: {', '.join(BACKENDS)}")
+
+
+def create_index():
+    backend = get_backend()
+    with connection.cursor() as cursor:
+        backend.create_index(cursor)
+        backend.remove_orphans(cursor)
+
+
+def index_posts(posts):
+    """(Re)indexes the given posts or post ids."""
+    ids = [getattr(post, 'pk', post) for post in posts]
+    if not ids:
+        return
+    backend = get_backend()
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), INDEX_BATCH_SIZE):
+            backend.index_posts(cursor, ids[start:start + INDEX_BATCH_SIZE])
+
+
+def remove_posts(ids):
+    with connection.cursor() as cursor:
+        get_backend().remove_posts(cursor, list(ids))
+
+
+def rebuild_index():
+    backend = get_backend()
+    with connection.cursor() as cursor:
+        backend.drop_index(cursor)
+        backend.create_index(cursor)
+    ids = list(Post.objects.order_by('id').values_list('id', flat=True))
+    index_posts(ids)
+    return len(ids)
+
+
+class SearchResults:
+    """Ranked posts matching a query, sliced lazily so the paginator only loads one page."""
+
+    def __init__(self, query):
+        self.query = query
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            if not search_terms(self.query):
+                self._count = 0
+            else:
+                with connection.cursor() as cursor:
+                    self._count = get_backend().count(cursor, self.query)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        stop = index.stop if index.stop is not None else self.count()
+        if stop <= start or not search_terms(self.query):
+            return []
+        with connection.cursor() as cursor:
+            ids = get_backend().search(cursor, self.query, stop - start, start)
+        posts = Post.objects.select_related('author__profile').defer(*LIST_DEFERRED_FIELDS).in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
@@ -0,0 +1,61 @@
+from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate, post_save, post_delete
+from django.dispatch import receiver
+from users.models import Profile
+from users.signals import profile_image_processed
+from .models import Post, ScheduledPost
+from .caching import purge_author_pages, purge_post_pages
+from .due_scheduler import notify_schedule_changed
+from . import metrics, search
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    purge_post_pages(instance, created=created)
+    search.index_posts([instance])
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    purge_post_pages(instance, deleted=True)
+    search.remove_posts([instance.pk])
+
+
+# Pages show each author's username and avatar; last_login and the like don't matter to them
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    if not created and (update_fields is None or 'username' in update_fields):
+        purge_author_pages(instance)
+
+
+@receiver(post_save, sender=Profile)
+def profile_saved(sender, instance, created, update_fields=None, **kwargs):
+    if not created and (update_fields is None or {'image', 'image_variants'} & set(update_fields)):
+        purge_author_pages(instance.user_id)
+
+
+# Pages rendered while the variants were missing show the default avatar
+@receiver(profile_image_processed)
+def profile_image_ready(sender, user_id, **kwargs):
+    purge_author_pages(user_id)
+
+
+# The search index is raw SQL rather than a model, so it is created after blog's tables. post_migrate
+# also follows every flush, which leaves index rows behind for the posts it truncated.
+@receiver(post_migrate)
+def create_search_index(sender, **kwargs):
+    if sender.name == 'blog':
+        search.create_index()
+
+
+# Deleting a schedule never makes anything due sooner, so only saves wake the scheduler
+@receiver(post_save, sender=ScheduledPost)
+def schedule_changed(sender, **kwargs):
+    notify_schedule_changed()
+
+
+# Queries count towards the request being timed, see blog/metrics.py
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    metrics.add_query_timer(connection)
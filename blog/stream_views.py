@@ -0,0 +1,88 @@
+import json
+
+from asgiref.sync import sync_to_async
+
+from django.http import HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
+
+from . import llm, metrics
+from .blogcraft_views import BLOGCRAFT_FIELDS, build_generate_prompt, build_refine_prompt
+from .drafts import BLOGCRAFT_DRAFTS, clear_drafts, load_drafts, push_draft
+from .jobs import PENDING_JOB_SESSION_KEY
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@require_POST
+async def blogcraft_stream(request):
+    """Streams a BlogCraft generate/refine as Server-Sent Events and stores the draft once it is complete."""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponseForbidden()
+
+    session = request.session
+    fields = {name: request.POST.get(name, '').strip() for name in BLOGCRAFT_FIELDS}
+    feedback = request.POST.get('feedback', '').strip()
+    action = request.POST.get('action')
+    for name, value in fields.items():
+        await session.aset(name, value)
+    await session.aset('error', '')
+
+    if await session.aget(PENDING_JOB_SESSION_KEY):
+        return JsonResponse({'error': "Your draft is still being generated. Please wait for it to finish."}, status=409)
+
+    drafts = await sync_to_async(lambda: list(load_drafts(session, BLOGCRAFT_DRAFTS)))()
+    current_refine_step = await session.aget('current_refine_step', 1)
+    if action == 'generate':
+        if not fields['topic'] or not fields['primary_keyword'] or not fields['prompt_1']:
+            return JsonResponse({'error': "Please provide a topic, primary keyword, and at least Prompt 1."}, status=400)
+        prompt = build_generate_prompt(fields['prompt_1'], fields['primary_keyword'], fields['additional_keywords'])
+    elif action == 'refine':
+        if not drafts:
+            return JsonResponse({'error': "No draft to refine. Please generate a draft first."}, status=400)
+        if current_refine_step > 5:
+            return JsonResponse({'error': "All prompts have been processed."}, status=400)
+        current_prompt = fields[f'prompt_{current_refine_step}']
+        if not current_prompt:
+            return JsonResponse({'error': f"Please provide feedback in Prompt {current_refine_step}."}, status=400)
+        prev_draft = await sync_to_async(lambda: drafts[-1].content)()
+        prompt = build_refine_prompt(
+            prev_draft, current_prompt, fields['primary_keyword'], fields['additional_keywords'], feedback
+        )
+    else:
+        return JsonResponse({'error': f"Action '{action}' cannot be streamed."}, status=400)
+
+    async def events():
+        parts = []
+        try:
+            async with metrics.streamed_response(request.resolver_match.view_name):
+                async for chunk in llm.astream(prompt):
+                    parts.append(chunk)
+                    yield sse('chunk', {'text': chunk})
+        except Exception as e:
+            verb = 'generating' if action == 'generate' else 'refining'
+            await session.aset('error', f"Error {verb} content: {str(e)}")
+            await session.asave()
+            yield sse('error', {'error': str(e)})
+            return
+
+        # The session middleware saved before the body started, so the finished draft is saved here
+        content = ''.join(parts).strip()
+        if action == 'generate':
+            await sync_to_async(clear_drafts)(session, BLOGCRAFT_DRAFTS)
+            await sync_to_async(push_draft)(session, user, BLOGCRAFT_DRAFTS, content)
+            await session.aset('current_refine_step', 1)
+            await session.aset('grammar_checked', False)
+            await session.aset('grammar_result', '')
+        else:
+            await sync_to_async(push_draft)(session, user, BLOGCRAFT_DRAFTS, content, replace=True)
+            await session.aset('current_refine_step', current_refine_step + 1)
+        await session.asave()
+        yield sse('done', {'current_refine_step': await session.aget('current_refine_step')})
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
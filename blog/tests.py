@@ -1,3 +1,1300 @@
-from django.test import TestCase
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import requests
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from PIL import Image
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+
+from . import clients, http_client, llm, metrics, rendering, views
+from .caching import LATEST_POSTS_COUNT, AnonymousPageCacheMixin, get_latest_posts, page_cache_stats, release_version
+from .airtable_sync import mirror_records
+from .cron import publish_scheduled_blogs
+from .due_scheduler import RETRY_DELAY, DueTimeScheduler, schedule_changed, scheduled_post_times
+from .drafts import (
+    BLOGCRAFT_DRAFTS, GENERATE_DRAFTS, KEYFRAME_EVERY, clear_drafts, load_drafts, prune_drafts, push_draft,
+)
+from .drafts import prune_times as draft_prune_times
+from .grammar import apply_matches
+from .http_client import HttpClient, http_stats
+from .jobs import JOB_TIMEOUT_ERROR, PENDING_JOB_SESSION_KEY, PRUNE_BATCH_DELAY, prune_jobs, prune_times, run_job
+from .llm_cache import cache_key, llm_cache_stats
+from .management.commands.benchmark_endpoints import ENDPOINTS, run_benchmark, seed
+from .management.commands.benchmark_startup import boot_once, slowest_imports
+from .management.commands import render_posts
+from .management.commands.benchmark_grammar import apply_matches_by_slicing, make_document
+from .models import (
+    AirtableRecord, AirtableSyncState, DraftRevision, GenerationJob, LLMResponse, Post, ScheduledPost,
+)
+from .scheduled import process_due_posts
+from .search import SEARCH_TABLE, SearchResults, create_index, rebuild_index
+from users.images import process_profile_image
+from users.models import Profile
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class BlogTestCase(TestCase):
+    # Profile.save() opens the avatar from disk, so every test needs a default.jpg in place
+
+    @classmethod
+    def setUpClass(cls):
+        os.makedirs(MEDIA_ROOT, exist_ok=True)
+        Image.new('RGB', (10, 10)).save(os.path.join(MEDIA_ROOT, 'default.jpg'))
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    @contextmanager
+    def assertMaxQueries(self, limit):
+        with CaptureQueriesContext(connection) as ctx:
+            yield ctx
+        executed = len(ctx.captured_queries)
+        self.assertLessEqual(
+            executed, limit,
+            f"{executed} queries executed, expected at most {limit}:\n"
+            + "\n".join(q['sql'] for q in ctx.captured_queries)
+        )
+
+    def create_posts(self, count, author=None):
+        posts = []
+        for i in range(count):
+            user = author or User.objects.create_user(username=f'author{Post.objects.count()}_{i}')
+            posts.append(Post.objects.create(title=f'Post {i}', content='Some content ' * 20, author=user))
+        return posts
+
+
+class ListViewQueryCountTests(BlogTestCase):
+    # page + sidebar (+ COUNT in offset mode), independent of how many authors are on the page
+    LIST_QUERY_LIMIT = 3
+
+    def test_post_list_view_queries_are_bounded(self):
+        self.create_posts(5)
+        with self.assertMaxQueries(self.LIST_QUERY_LIMIT):
+            response = self.client.get(reverse('blog-home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['posts']), 5)
+
+    def test_post_list_view_queries_do_not_grow_with_rows(self):
+        self.create_posts(1)
+        with CaptureQueriesContext(connection) as one_row:
+            self.client.get(reverse('blog-home'))
+        self.create_posts(4)
+        with CaptureQueriesContext(connection) as five_rows:
+            self.client.get(reverse('blog-home'))
+        self.assertEqual(len(one_row.captured_queries), len(five_rows.captured_queries))
+
+    def test_user_post_list_view_queries_are_bounded(self):
+        author = User.objects.create_user(username='writer')
+        self.create_posts(5, author=author)
+        # the extra query is the username lookup
+        with self.assertMaxQueries(self.LIST_QUERY_LIMIT + 1):
+            response = self.client.get(reverse('user-posts', args=['writer']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['posts']), 5)
+
+    def test_home_queries_are_bounded(self):
+        self.create_posts(10)
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        # posts + sidebar
+        with self.assertMaxQueries(2):
+            response = views.home(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context_data['posts']), 5)
+
+
+class SidebarCacheTests(BlogTestCase):
+
+    def test_sidebar_is_free_once_cached(self):
+        self.create_posts(3)
+        get_latest_posts()
+        with self.assertNumQueries(0):
+            latest_posts = get_latest_posts()
+        self.assertEqual(len(latest_posts), 3)
+
+    def test_sidebar_is_refreshed_after_publish(self):
+        self.create_posts(2)
+        get_latest_posts()
+        post = self.create_posts(1)[0]
+        self.assertEqual(get_latest_posts()[0]['id'], post.id)
+
+    def test_sidebar_is_refreshed_after_delete(self):
+        post = self.create_posts(2)[-1]
+        get_latest_posts()
+        post.delete()
+        self.assertNotIn(post.id, [p['id'] for p in get_latest_posts()])
+
+    def test_sidebar_is_refreshed_after_title_change(self):
+        post = self.create_posts(1)[0]
+        get_latest_posts()
+        post.title = 'Renamed'
+        post.save()
+        self.assertEqual(get_latest_posts()[0]['title'], 'Renamed')
+
+
+class PageCacheTests(BlogTestCase):
+
+    def test_anonymous_detail_page_is_served_from_cache(self):
+        post = self.create_posts(1)[0]
+        url = reverse('post-detail', args=[post.pk])
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, post.title)
+
+    def test_detail_page_is_purged_on_update(self):
+        post = self.create_posts(1)[0]
+        url = reverse('post-detail', args=[post.pk])
+        self.client.get(url)
+        post.content = 'Fresh content'
+        post.save()
+        self.assertContains(self.client.get(url), 'Fresh content')
+
+    def test_list_page_is_purged_on_delete(self):
+        posts = self.create_posts(2)
+        self.client.get(reverse('blog-home'))
+        posts[0].delete()
+        self.assertNotContains(self.client.get(reverse('blog-home')), f'/post/{posts[0].pk}/')
+
+    def test_other_posts_stay_cached_on_update(self):
+        posts = self.create_posts(LATEST_POSTS_COUNT + 1)
+        oldest = posts[0]
+        url = reverse('post-detail', args=[posts[-1].pk])
+        self.client.get(reverse('blog-home'))
+        self.client.get(url)
+        oldest.content = 'Edited'
+        oldest.save()
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+    def test_authenticated_readers_bypass_cache(self):
+        post = self.create_posts(1)[0]
+        self.client.force_login(post.author)
+        url = reverse('post-detail', args=[post.pk])
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(page_cache_stats()['hits'], 0)
+
+    def test_hits_and_misses_are_counted(self):
+        post = self.create_posts(1)[0]
+        url = reverse('post-detail', args=[post.pk])
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(page_cache_stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    def test_views_without_a_cache_scope_fail_when_defined(self):
+        with self.assertRaisesMessage(TypeError, 'must set page_cache_scope'):
+            class UnscopedView(AnonymousPageCacheMixin, views.DetailView):
+                model = Post
+
+
+class KeysetPaginationTests(BlogTestCase):
+
+    def walk(self, url, cursor=None):
+        response = self.client.get(url, {'cursor': cursor} if cursor else {})
+        return response.context['page_obj']
+
+    def test_pages_follow_date_then_id_order(self):
+        posts = self.create_posts(12)
+        expected = [p.pk for p in reversed(posts)]
+        seen = []
+        page = self.walk(reverse('blog-home'))
+        seen += [p.pk for p in page]
+        while page.has_next():
+            page = self.walk(reverse('blog-home'), page.next_cursor)
+            seen += [p.pk for p in page]
+        self.assertEqual(seen, expected)
+
+    def test_previous_and_last_cursors(self):
+        posts = self.create_posts(12)
+        first = self.walk(reverse('blog-home'))
+        second = self.walk(reverse('blog-home'), first.next_cursor)
+        back = self.walk(reverse('blog-home'), second.previous_cursor)
+        self.assertEqual([p.pk for p in back], [p.pk for p in first])
+        self.assertFalse(back.has_previous())
+        last = self.walk(reverse('blog-home'), first.last_cursor)
+        self.assertEqual([p.pk for p in last], [p.pk for p in reversed(posts[:5])])
+        self.assertFalse(last.has_next())
+        self.assertTrue(last.has_previous())
+
+    def test_list_page_skips_count_query(self):
+        self.create_posts(6)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('blog-home'))
+        self.assertFalse(any('COUNT(' in q['sql'] for q in ctx.captured_queries))
+
+    def test_bad_cursor_is_not_found(self):
+        self.assertEqual(self.client.get(reverse('blog-home'), {'cursor': 'bm9wZQ'}).status_code, 404)
+
+    @override_settings(BLOG_PAGINATION_MODE='offset')
+    def test_offset_mode_still_available(self):
+        self.create_posts(6)
+        response = self.client.get(reverse('blog-home'), {'page': 2})
+        self.assertEqual(response.context['page_obj'].number, 2)
+
+
+@override_settings(LLM_BACKEND='fake', LLM_FAKE_LATENCY=0)
+class GenerationJobTests(BlogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='writer', password='pass')
+        self.client.force_login(self.user)
+
+    def generate(self, url, **data):
+        payload = {'topic': 'Django', 'primary_keyword': 'django', 'additional_keywords': 'python',
+                   'prompt_1': 'Write about Django', 'action': 'generate'}
+        payload.update(data)
+        return self.client.post(url, payload)
+
+    def test_post_returns_before_generation_finishes(self):
+        response = self.generate(reverse('blog-generate'))
+        job = GenerationJob.objects.get()
+        self.assertEqual(job.status, GenerationJob.QUEUED)
+        self.assertEqual(response.context['pending_job'], job)
+        self.assertEqual(len(response.context['drafts']), 0)
+
+    @override_settings(BACKGROUND_TASKS_EAGER=True)
+    def test_generate_view_picks_up_finished_draft(self):
+        response = self.generate(reverse('blog-generate'))
+        self.assertIsNone(response.context['pending_job'])
+        self.assertEqual(len(response.context['drafts']), 1)
+        self.assertTrue(response.context['drafts'][0]['content'].startswith('# Fake Draft'))
+        response = self.client.post(reverse('blog-generate'), {
+            'action': 'refine_2', 'prompt_1': 'Write about Django', 'prompt_2': 'Shorter please'})
+        self.assertEqual([d['prompt'] for d in response.context['drafts']], ['Write about Django', 'Shorter please'])
+
+    @override_settings(BACKGROUND_TASKS_EAGER=True)
+    def test_blogcraft_view_picks_up_finished_draft(self):
+        self.generate(reverse('blogcraft'))
+        response = self.client.post(reverse('blogcraft'), {
+            'topic': 'Django', 'primary_keyword': 'django', 'prompt_1': 'Write about Django', 'action': 'refine'})
+        self.assertEqual(response.context['current_refine_step'], 2)
+        self.assertEqual(len(response.context['drafts']), 1)
+
+    def test_job_status_is_polled_and_applied_on_next_visit(self):
+        self.generate(reverse('blogcraft'))
+        job = GenerationJob.objects.get()
+        self.assertEqual(self.client.get(reverse('generation-job', args=[job.pk])).json()['status'], 'queued')
+        run_job(job.pk)
+        self.assertEqual(self.client.get(reverse('generation-job', args=[job.pk])).json()['status'], 'done')
+        response = self.client.get(reverse('blogcraft'))
+        self.assertIsNone(response.context['pending_job'])
+        self.assertEqual(len(response.context['drafts']), 1)
+
+    def test_job_lost_with_its_worker_fails_after_the_timeout(self):
+        self.generate(reverse('blog-generate'))
+        job = GenerationJob.objects.get()
+        GenerationJob.objects.filter(pk=job.pk).update(
+            status=GenerationJob.RUNNING, started_at=timezone.now() - timedelta(minutes=10))
+        with self.settings(LLM_JOB_TIMEOUT=300):
+            self.assertEqual(self.client.get(reverse('generation-job', args=[job.pk])).json()['status'], 'failed')
+            response = self.client.get(reverse('blog-generate'))
+        self.assertIsNone(response.context['pending_job'])
+        self.assertNotIn(PENDING_JOB_SESSION_KEY, self.client.session)
+        self.assertIn(JOB_TIMEOUT_ERROR, response.context['error'])
+        # A late finish doesn't overwrite the reported failure
+        run_job(job.pk)
+        self.assertEqual(GenerationJob.objects.get(pk=job.pk).status, GenerationJob.FAILED)
+
+    def test_old_jobs_are_pruned(self):
+        old, new = [GenerationJob.objects.create(user=self.user, flow='generate', action='generate', prompt='p')
+                    for _ in range(2)]
+        created_at = timezone.now() - timedelta(days=2)
+        GenerationJob.objects.filter(pk=old.pk).update(created_at=created_at)
+        with self.settings(LLM_JOB_RETENTION=60 * 60 * 24):
+            self.assertEqual(prune_times(), [created_at + timedelta(days=1) + PRUNE_BATCH_DELAY])
+            self.assertEqual(prune_jobs(), 1)
+        self.assertEqual(list(GenerationJob.objects.all()), [new])
+
+    def test_jobs_are_private(self):
+        self.generate(reverse('blogcraft'))
+        job = GenerationJob.objects.get()
+        self.client.force_login(User.objects.create_user(username='someone-else'))
+        self.assertEqual(self.client.get(reverse('generation-job', args=[job.pk])).status_code, 404)
+
+
+class DraftRevisionTests(BlogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='writer')
+        self.session = {}
+
+    def test_deltas_rebuild_every_draft(self):
+        texts = [f"Django is a web framework. Paragraph {i} changes here. " * 30 for i in range(KEYFRAME_EVERY + 3)]
+        for i, text in enumerate(texts):
+            push_draft(self.session, self.user, GENERATE_DRAFTS, text, label=f'Prompt {i}')
+        self.assertEqual(list(self.session), [GENERATE_DRAFTS])
+        self.assertIsInstance(self.session[GENERATE_DRAFTS], int)
+        with self.assertMaxQueries(3):
+            drafts = load_drafts(self.session, GENERATE_DRAFTS)
+            self.assertEqual([d['content'] for d in drafts], texts)
+        self.assertEqual(DraftRevision.objects.filter(snapshot__isnull=True).count(), len(texts) - 2)
+
+    def test_replace_keeps_one_visible_draft(self):
+        push_draft(self.session, self.user, BLOGCRAFT_DRAFTS, 'first version of the draft')
+        push_draft(self.session, self.user, BLOGCRAFT_DRAFTS, 'second version of the draft', replace=True)
+        drafts = load_drafts(self.session, BLOGCRAFT_DRAFTS)
+        self.assertEqual([d.content for d in drafts], ['second version of the draft'])
+
+    def test_clear_removes_the_history(self):
+        push_draft(self.session, self.user, GENERATE_DRAFTS, 'a draft')
+        push_draft(self.session, self.user, GENERATE_DRAFTS, 'a better draft')
+        clear_drafts(self.session, GENERATE_DRAFTS)
+        self.assertFalse(load_drafts(self.session, GENERATE_DRAFTS))
+        self.assertFalse(DraftRevision.objects.exists())
+
+
+    def test_abandoned_threads_are_pruned(self):
+        push_draft(self.session, self.user, GENERATE_DRAFTS, 'an old draft')
+        push_draft(self.session, self.user, GENERATE_DRAFTS, 'an old draft, refined')
+        old = self.session[GENERATE_DRAFTS]
+        live = {}
+        push_draft(live, self.user, GENERATE_DRAFTS, 'a draft started long ago')
+        push_draft(live, self.user, GENERATE_DRAFTS, 'a draft still being worked on')
+        long_ago = timezone.now() - timedelta(days=30)
+        DraftRevision.objects.exclude(pk=live[GENERATE_DRAFTS]).update(created_at=long_ago)
+        with self.settings(SESSION_COOKIE_AGE=60 * 60 * 24 * 14):
+            self.assertEqual(draft_prune_times(), [long_ago + timedelta(days=14, hours=1)])
+            self.assertEqual(prune_drafts(), 2)
+        self.assertFalse(load_drafts(self.session, GENERATE_DRAFTS))
+        self.assertFalse(DraftRevision.objects.filter(pk=old).exists())
+        self.assertEqual(len(load_drafts(live, GENERATE_DRAFTS)), 2)
+
+
+def grammar_match(offset, length, *replacements):
+    return {'offset': offset, 'length': length, 'replacements': [{'value': r} for r in replacements]}
+
+
+class GrammarTests(SimpleTestCase):
+
+    def test_matches_are_applied_against_original_offsets(self):
+        text = 'I recieve teh post'
+        fixed, applied = apply_matches(text, [grammar_match(10, 3, 'the'), grammar_match(2, 7, 'receive')])
+        self.assertEqual((fixed, applied), ('I receive the post', 2))
+
+    def test_overlapping_and_empty_matches_are_skipped(self):
+        text = 'a bad sentance here'
+        matches = [grammar_match(2, 12, 'bad sentence'), grammar_match(6, 8, 'sentence'), grammar_match(0, 1)]
+        self.assertEqual(apply_matches(text, matches), ('a bad sentence here', 1))
+
+    def test_offsets_count_utf16_units(self):
+        text = '\U0001F600 teh end'
+        self.assertEqual(apply_matches(text, [grammar_match(3, 3, 'the')]), ('\U0001F600 the end', 1))
+
+    def test_large_document_matches_the_slicing_loop(self):
+        text, matches = make_document(5000, 800)
+        self.assertEqual(apply_matches(text, matches)[0], apply_matches_by_slicing(text, matches))
+
+
+@override_settings(LLM_BACKEND='fake', LLM_FAKE_LATENCY=0)
+class StreamingGenerationTests(BlogTestCase):
+
+    async def stream(self, **data):
+        response = await self.async_client.post(reverse('blogcraft-stream'), data)
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        return response, body
+
+    async def test_generate_streams_chunks_then_stores_draft(self):
+        user = await User.objects.acreate(username='streamer')
+        await self.async_client.aforce_login(user)
+        response, body = await self.stream(
+            topic='Django', primary_keyword='django', prompt_1='Write about Django', action='generate')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertGreater(body.count('event: chunk'), 1)
+        self.assertIn('event: done', body)
+        # The model time is counted for the view even though the middleware finished before the stream
+        text = await sync_to_async(metrics.prometheus_text)()
+        self.assertIn('blog_http_duration_seconds_total{view="blogcraft-stream",service="fake"}', text)
+
+        page = await self.async_client.get(reverse('blogcraft'))
+        self.assertTrue(page.context['drafts'][0]['content'].startswith('# Fake Draft'))
+
+        await self.stream(topic='Django', primary_keyword='django', prompt_1='Write about Django', action='refine')
+        page = await self.async_client.get(reverse('blogcraft'))
+        self.assertEqual(page.context['current_refine_step'], 2)
+
+    async def test_invalid_request_is_rejected_before_streaming(self):
+        user = await User.objects.acreate(username='streamer')
+        await self.async_client.aforce_login(user)
+        response = await self.async_client.post(reverse('blogcraft-stream'), {'action': 'generate'})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_anonymous_is_forbidden(self):
+        response = await self.async_client.post(reverse('blogcraft-stream'), {'action': 'generate'})
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(LLM_BACKEND='fake', LLM_FAKE_LATENCY=0)
+class LLMResponseCacheTests(BlogTestCase):
+
+    def generate_counting_calls(self, *prompts):
+        with mock.patch.object(llm.FakeBackend, 'generate', autospec=True,
+                               side_effect=lambda self, prompt, *a, **kw: f'answer to {prompt}') as backend:
+            results = [llm.generate(prompt) for prompt in prompts]
+        return results, backend.call_count
+
+    def test_repeated_prompt_skips_the_model(self):
+        results, calls = self.generate_counting_calls('same prompt', 'same prompt', 'other prompt')
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(calls, 2)
+        self.assertEqual(llm_cache_stats(), {'hits': 1, 'misses': 2, 'hit_rate': 0.3333})
+
+    def test_params_are_part_of_the_key(self):
+        self.assertNotEqual(cache_key('m', 'p', {}), cache_key('m', 'p', {'temperature': 0.2}))
+        self.assertNotEqual(cache_key('m', 'p', {}), cache_key('other-model', 'p', {}))
+
+    def test_fake_answers_are_not_served_to_gemini(self):
+        self.generate_counting_calls('prompt')
+        with override_settings(LLM_BACKEND='gemini'), \
+                mock.patch.object(llm.GeminiBackend, 'generate', return_value='real answer') as backend:
+            self.assertEqual(llm.generate('prompt'), 'real answer')
+        self.assertEqual(backend.call_count, 1)
+
+    def test_expired_entries_are_regenerated(self):
+        self.generate_counting_calls('prompt')
+        LLMResponse.objects.update(created_at=timezone.now() - timedelta(days=30))
+        _, calls = self.generate_counting_calls('prompt')
+        self.assertEqual(calls, 1)
+
+    @override_settings(LLM_CACHE={'BACKEND': 'db', 'MAX_ENTRIES': 2})
+    def test_least_recently_used_entry_is_evicted(self):
+        self.generate_counting_calls('first')
+        self.generate_counting_calls('second')
+        LLMResponse.objects.filter(model_name=llm.DEFAULT_MODEL).update(last_used_at=F('created_at'))
+        self.generate_counting_calls('first')
+        self.generate_counting_calls('third')
+        _, calls = self.generate_counting_calls('first', 'second')
+        self.assertEqual(calls, 1)
+
+    def test_file_backend(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        with self.settings(LLM_CACHE={'BACKEND': 'file', 'LOCATION': location}):
+            _, calls = self.generate_counting_calls('prompt', 'prompt')
+        self.assertEqual(calls, 1)
+        self.assertEqual(len(os.listdir(location)), 1)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    statuses = []
+    ports = []
+
+    def do_GET(self):
+        self.ports.append(self.client_address[1])
+        status = self.statuses.pop(0) if self.statuses else 200
+        self.send_response(status)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+class HttpClientTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f'http://127.0.0.1:{cls.server.server_address[1]}/'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        StubHandler.statuses = []
+        StubHandler.ports = []
+        self.client = HttpClient(connect_timeout=1, read_timeout=1, retries=2, backoff=0, pool_maxsize=2)
+
+    def test_connections_are_reused(self):
+        for _ in range(3):
+            self.assertEqual(self.client.get(self.url, endpoint='stub').status_code, 200)
+        self.assertEqual(len(set(StubHandler.ports)), 1)
+
+    def test_server_errors_are_retried(self):
+        StubHandler.statuses = [503, 502]
+        self.assertEqual(self.client.get(self.url, endpoint='stub').status_code, 200)
+        self.assertEqual(len(StubHandler.ports), 3)
+
+    def test_latency_is_counted_per_endpoint(self):
+        self.client.get(self.url, endpoint='stub')
+        self.client.get(self.url)
+        stats = http_stats()
+        self.assertEqual(stats['stub']['calls'], 1)
+        self.assertEqual(stats[f'get.127.0.0.1:{self.server.server_address[1]}']['calls'], 1)
+
+
+class FakeResponse:
+    def __init__(self, data, status_code=200):
+        self.data = data
+        self.status_code = status_code
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f'{self.status_code} error')
+
+
+class FakePublishingClient:
+    def __init__(self, records, existing_posts=None, failing_titles=()):
+        self.records = records
+        self.existing_posts = existing_posts or {}
+        self.failing_titles = failing_titles
+        self.created = []
+        self.patches = []
+        self.lists = []
+        self.refreshes = []
+        self.lock = threading.Lock()
+
+    def get(self, url, endpoint=None, params=None, **kwargs):
+        if endpoint == 'airtable.list' and 'offset' not in params:
+            self.lists.append(params)
+        if endpoint == 'wordpress.lookup':
+            return FakeResponse([{'id': pk, 'slug': slug}
+                                 for slug, pk in self.existing_posts.items() if slug == params['slug']])
+        records = self.records
+        if endpoint == 'airtable.refresh':
+            self.refreshes.append(params)
+            ids = set(re.findall(r"RECORD_ID\(\) = '(\w+)'", params['filterByFormula']))
+            records = [record for record in records if record['id'] in ids]
+        start = int(params.get('offset', 0))
+        end = start + params['pageSize']
+        page = {'records': records[start:end]}
+        if end < len(records):
+            page['offset'] = str(end)
+        return FakeResponse(page)
+
+    def post(self, url, json=None, **kwargs):
+        if json['title'] in self.failing_titles:
+            return FakeResponse({}, status_code=500)
+        with self.lock:
+            self.created.append(json['title'])
+            self.existing_posts[json['slug']] = 1000 + len(self.created)
+            return FakeResponse({'id': 1000 + len(self.created)})
+
+    def patch(self, url, json=None, **kwargs):
+        # Airtable rejects the whole batch if any of its records was deleted
+        existing = {record['id'] for record in self.records}
+        if any(record['id'] not in existing for record in json['records']):
+            return FakeResponse({'error': {'type': 'ROW_DOES_NOT_EXIST'}}, status_code=404)
+        self.patches.append(json['records'])
+        return FakeResponse({'records': json['records']})
+
+
+@mock.patch.dict(os.environ, {'AIRTABLE_API_KEY': 'key', 'AIRTABLE_BASE_ID': 'base',
+                              'WORDPRESS_URL': 'https://wp.example.com/wp-json/wp/v2/posts',
+                              'WORDPRESS_USERNAME': 'u', 'WORDPRESS_PASSWORD': 'p'})
+@mock.patch('blog.cron.AIRTABLE_REQUESTS_PER_SECOND', 1000)
+class PublishScheduledBlogsTests(BlogTestCase):
+
+    def record(self, record_id, title, status='Scheduled', publish_date='2025-01-01T09:00:00.000Z'):
+        return {'id': record_id, 'fields': {'Title': title, 'Content': 'Body', 'Status': status, 'Publish Date': publish_date}}
+
+    def run_cron(self, client):
+        with mock.patch('blog.cron.get_client', return_value=client), mock.patch('builtins.print'):
+            publish_scheduled_blogs()
+
+    def final_fields(self, client):
+        fields = {}
+        for batch in client.patches:
+            for record in batch:
+                fields.setdefault(record['id'], {}).update(record['fields'])
+        return fields
+
+    def test_all_pages_are_published_with_batched_updates(self):
+        records = [self.record(f'rec{i}', f'Post {i}') for i in range(250)]
+        client = FakePublishingClient(records)
+        self.run_cron(client)
+        self.assertEqual(len(client.created), 250)
+        self.assertTrue(all(len(batch) <= 10 for batch in client.patches))
+        self.assertEqual(len(client.patches), 50)  # 25 claims + 25 results
+        self.assertTrue(all(f['Status'] == 'Published' for f in self.final_fields(client).values()))
+
+    def test_interrupted_run_does_not_publish_twice(self):
+        records = [self.record('rec1', 'Half done', 'Publishing'), self.record('rec2', 'Broken')]
+        client = FakePublishingClient(records, existing_posts={'half-done-rec1': 7}, failing_titles={'Broken'})
+        self.run_cron(client)
+        self.assertEqual(client.created, [])
+        fields = self.final_fields(client)
+        self.assertEqual(fields['rec1'], {'WordPress Post ID': '7', 'Status': 'Published'})
+        self.assertEqual(fields['rec2'], {'Status': 'Publishing'})
+
+    def test_recovery_matches_the_record_not_the_title(self):
+        client = FakePublishingClient([self.record('recA', 'Same title'), self.record('recB', 'Привет')])
+        self.run_cron(client)
+        self.assertEqual(sorted(client.existing_posts), ['recb', 'same-title-reca'])
+        # Another record with the same title, and one with a title that slugifies to '', both
+        # claimed by a run that crashed before creating their posts
+        AirtableSyncState.objects.update(synced_at=timezone.now() - timedelta(hours=1))
+        client.records = [self.record('recC', 'Same title', 'Publishing'), self.record('recD', 'Пока', 'Publishing')]
+        self.run_cron(client)
+        self.assertEqual(client.created, ['Same title', 'Привет', 'Same title', 'Пока'])
+        fields = self.final_fields(client)
+        self.assertEqual(fields['recC']['WordPress Post ID'], '1003')
+        self.assertEqual(fields['recD']['WordPress Post ID'], '1004')
+
+    def test_idle_runs_read_the_mirror_only(self):
+        client = FakePublishingClient([self.record('rec1', 'Published already', 'Published'),
+                                       self.record('rec2', 'Later', publish_date='2999-01-01T09:00:00.000Z')])
+        self.run_cron(client)
+        self.run_cron(client)
+        self.assertEqual(len(client.lists), 1)
+        self.assertEqual(client.created, [])
+        self.assertEqual(AirtableRecord.objects.count(), 2)
+
+    def test_incremental_sync_asks_for_changed_records_only(self):
+        client = FakePublishingClient([self.record('rec1', 'First')])
+        self.run_cron(client)
+        self.assertEqual(AirtableRecord.objects.get(record_id='rec1').status, 'Published')
+        AirtableSyncState.objects.update(synced_at=timezone.now() - timedelta(hours=1))
+        client.records = [self.record('rec2', 'Second')]
+        self.run_cron(client)
+        self.assertIn('LAST_MODIFIED_TIME()', client.lists[-1]['filterByFormula'])
+        self.assertEqual(client.created, ['First', 'Second'])
+        self.assertTrue(AirtableRecord.objects.filter(record_id='rec1').exists())
+
+    def stale_mirror(self, records):
+        # A mirror synced just now, so the run publishes from it without asking Airtable for changes
+        AirtableSyncState.objects.create(table_name='Blog Posts', synced_at=timezone.now(), full_synced_at=timezone.now())
+        mirror_records(records)
+
+    def test_due_records_are_checked_against_airtable_before_they_are_claimed(self):
+        client = FakePublishingClient([self.record('rec1', 'Valid'), self.record('rec2', 'Pulled', 'Draft')])
+        self.stale_mirror([self.record('rec1', 'Valid'), self.record('rec2', 'Pulled')])
+        self.run_cron(client)
+        self.assertEqual(client.lists, [])
+        self.assertEqual(client.created, ['Valid'])
+        self.assertNotIn('rec2', self.final_fields(client))
+        self.assertEqual(AirtableRecord.objects.get(record_id='rec2').status, 'Draft')
+
+    def test_records_deleted_since_the_last_full_sync_leave_the_mirror(self):
+        client = FakePublishingClient([self.record('rec2', 'Valid')])
+        self.stale_mirror([self.record('rec1', 'Deleted'), self.record('rec2', 'Valid')])
+        self.run_cron(client)
+        self.assertEqual(client.created, ['Valid'])
+        self.assertEqual(list(AirtableRecord.objects.values_list('record_id', flat=True)), ['rec2'])
+
+    def test_deleted_record_does_not_hold_back_the_others(self):
+        client = FakePublishingClient([self.record('rec2', 'Valid')])
+        self.stale_mirror([self.record('rec1', 'Deleted'), self.record('rec2', 'Valid')])
+        # Deleted in Airtable between the refresh and the claim, so the claim batch fails
+        with mock.patch('blog.cron.refresh_records'):
+            self.run_cron(client)
+        self.assertEqual(client.created, ['Valid'])
+        self.assertEqual(self.final_fields(client), {'rec2': {'Status': 'Published', 'WordPress Post ID': '1001'}})
+        self.assertFalse(AirtableRecord.objects.filter(record_id='rec1').exists())
+
+
+@override_settings(LLM_BACKEND='fake', LLM_FAKE_LATENCY=0, LLM_REQUESTS_PER_MINUTE=60000,
+                   LLM_CACHE={'BACKEND': 'none'})
+class ScheduledPostTests(BlogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser(username='admin', password='pass')
+        self.due = timezone.now() - timedelta(minutes=1)
+
+    def schedule(self, count, created_by=None, when=None, **kwargs):
+        return [ScheduledPost.objects.create(
+            topic=f'Topic {i}', primary_keyword='django', additional_keywords='python',
+            scheduled_datetime=when or self.due, created_by=created_by or self.admin, **kwargs
+        ) for i in range(count)]
+
+    def test_due_posts_are_published_in_bulk(self):
+        self.schedule(6)
+        later = self.schedule(1, when=timezone.now() + timedelta(days=1))
+        not_admin = self.schedule(1, created_by=User.objects.create_user(username='writer'))
+        get_latest_posts()
+        # 14 with the search index write, which is one batch however many posts there are
+        with self.assertMaxQueries(14):
+            self.assertEqual(process_due_posts(concurrency=1, batch_size=10), 6)
+        self.assertEqual(Post.objects.filter(is_draft=False, author=self.admin).count(), 6)
+        self.assertEqual(SearchResults('fake draft').count(), 6)
+        self.assertEqual(set(ScheduledPost.objects.all()), set(later + not_admin))
+        self.assertEqual(len(get_latest_posts()), LATEST_POSTS_COUNT)
+
+    def test_claimed_posts_are_left_to_their_worker(self):
+        self.schedule(2, claimed_at=timezone.now())
+        stale = self.schedule(1, claimed_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(process_due_posts(concurrency=1), 1)
+        self.assertEqual(ScheduledPost.objects.count(), 2)
+        self.assertFalse(ScheduledPost.objects.filter(pk=stale[0].pk).exists())
+
+    def test_failed_generation_stays_claimed(self):
+        self.schedule(2)
+        with mock.patch.object(llm, 'generate', side_effect=[RuntimeError('quota'), '# Title\n\nBody']):
+            self.assertEqual(process_due_posts(concurrency=1), 1)
+        failed = ScheduledPost.objects.get()
+        self.assertIsNotNone(failed.claimed_at)
+
+    def test_concurrent_mode(self):
+        self.schedule(9)
+        self.assertEqual(process_due_posts(concurrency=3, batch_size=4), 9)
+        self.assertEqual(Post.objects.count(), 9)
+
+
+class DueTimeSchedulerTests(BlogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser(username='admin', password='pass')
+        self.runs = []
+
+    def schedule(self, when, **kwargs):
+        return ScheduledPost.objects.create(topic='Topic', primary_keyword='django', additional_keywords='python',
+                                            scheduled_datetime=when, created_by=self.admin, **kwargs)
+
+    def scheduler(self):
+        def publish():
+            self.runs.append(timezone.now())
+            ScheduledPost.objects.filter(scheduled_datetime__lte=timezone.now()).delete()
+        return DueTimeScheduler({'scheduled_posts': (scheduled_post_times, publish)})
+
+    def test_sleeps_until_the_next_publish_time(self):
+        self.schedule(timezone.now() - timedelta(seconds=1))
+        self.schedule(timezone.now() + timedelta(hours=3))
+        timeout = self.scheduler().tick()
+        self.assertEqual(len(self.runs), 1)
+        self.assertAlmostEqual(timeout, 3 * 60 * 60, delta=5)
+
+    def test_nothing_scheduled_sleeps_until_woken(self):
+        self.assertIsNone(self.scheduler().tick())
+        self.assertEqual(self.runs, [])
+
+    def test_stuck_post_is_not_retried_straight_away(self):
+        scheduler = DueTimeScheduler({'scheduled_posts': (scheduled_post_times, lambda: self.runs.append(1))})
+        self.schedule(timezone.now() - timedelta(seconds=1))
+        timeout = scheduler.tick()
+        self.assertEqual(self.runs, [1])
+        self.assertAlmostEqual(timeout, RETRY_DELAY.total_seconds(), delta=5)
+
+    def test_next_post_a_few_seconds_later_is_not_delayed(self):
+        self.schedule(timezone.now() - timedelta(seconds=1))
+        self.schedule(timezone.now() + timedelta(seconds=3))
+        self.assertLess(self.scheduler().tick(), 4)
+        self.assertEqual(len(self.runs), 1)
+
+    def test_only_the_stuck_post_waits_for_a_retry(self):
+        self.schedule(timezone.now() - timedelta(seconds=1))
+        self.schedule(timezone.now() + timedelta(seconds=3))
+        scheduler = DueTimeScheduler({'scheduled_posts': (scheduled_post_times, lambda: self.runs.append(1))})
+        self.assertLess(scheduler.tick(), 4)
+        retry_at = max(when for when, _ in scheduler.build_heap())
+        self.assertAlmostEqual((retry_at - timezone.now()).total_seconds(), RETRY_DELAY.total_seconds(), delta=5)
+
+    def test_claimed_post_is_due_when_its_claim_expires(self):
+        claimed_at = timezone.now()
+        self.schedule(timezone.now() - timedelta(minutes=1), claimed_at=claimed_at)
+        with self.settings(SCHEDULED_POSTS_CLAIM_TIMEOUT=600):
+            self.assertEqual(scheduled_post_times(), [claimed_at + timedelta(seconds=600)])
+
+    def test_new_schedule_wakes_the_scheduler(self):
+        schedule_changed.clear()
+        self.schedule(timezone.now() + timedelta(days=1))
+        self.assertTrue(schedule_changed.is_set())
+
+
+class EndpointBenchmarkTests(BlogTestCase):
+
+    def test_seeds_and_reports_every_endpoint(self):
+        seed(posts=30, users=5)
+        seed(posts=30, users=5)
+        self.assertEqual(Post.objects.count(), 30)
+        self.assertEqual(User.objects.filter(username__startswith='bench_user_').count(), 5)
+
+        with mock.patch('builtins.print'):
+            results = run_benchmark(ENDPOINTS, 3)
+        self.assertEqual([r['endpoint'] for r in results], ENDPOINTS)
+        for r in results:
+            self.assertEqual(r['errors'], 0, r['endpoint'])
+            self.assertLessEqual(r['p50_ms'], r['p95_ms'])
+            self.assertLessEqual(r['p95_ms'], r['p99_ms'])
+        # The HTTP stub and the scheduled posts it made are gone again afterwards
+        self.assertNotIn('StubAdapter', repr(http_client.get_client().session.adapters))
+        self.assertFalse(ScheduledPost.objects.exists())
+
+
+class PerformanceMetricsTests(BlogTestCase):
+
+    def setUp(self):
+        # Counters queued by earlier tests' requests would otherwise land in this test's cache
+        metrics.flush(force=True)
+        super().setUp()
+        self.create_posts(3)
+        self.staff = User.objects.create_user(username='staff', password='pass', is_staff=True)
+
+    def test_staff_get_server_timing_header(self):
+        self.client.force_login(self.staff)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('blog-home'))
+        timing = response['Server-Timing']
+        self.assertIn('app;dur=', timing)
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+        self.assertIn('tpl;dur=', timing)
+
+    async def test_asgi_requests_stay_async_and_count_the_view_queries(self):
+        async def view(request):
+            return HttpResponse()
+
+        self.assertTrue(iscoroutinefunction(metrics.PerformanceMiddleware(view)))
+        await self.async_client.aforce_login(await User.objects.aget(username='staff'))
+        response = await self.async_client.get(reverse('blog-home'))
+        self.assertIn('app;dur=', response['Server-Timing'])
+        self.assertNotIn('desc="0 queries"', response['Server-Timing'])
+
+    def test_anonymous_responses_have_no_timings(self):
+        response = self.client.get(reverse('blog-home'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_outbound_calls_are_timed_per_service(self):
+        client = HttpClient(connect_timeout=1, read_timeout=1, retries=0, backoff=0, pool_maxsize=1)
+
+        def view(request):
+            with mock.patch.object(client.session, 'request', return_value=FakeResponse({})):
+                client.get('https://api.airtable.com/v0/base/table')
+                client.post('https://wp.example.com/wp-json/wp/v2/posts')
+            return HttpResponse()
+
+        with self.settings(DEBUG=True):
+            response = metrics.PerformanceMiddleware(view)(RequestFactory().get('/'))
+        self.assertIn('airtable;dur=', response['Server-Timing'])
+        self.assertIn('wordpress;dur=', response['Server-Timing'])
+        self.assertIn('blog_http_duration_seconds_total{view="unmatched",service="airtable"}', metrics.prometheus_text())
+
+    def test_metrics_endpoint_reports_per_view_totals(self):
+        self.client.get(reverse('blog-home'))
+        self.client.get(reverse('blog-home'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+        with self.settings(METRICS_TOKEN='secret'):
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('blog_request_duration_seconds_count{view="blog-home"} 2', body)
+        self.assertIn('blog_request_duration_seconds_bucket{view="blog-home",le="+Inf"} 2', body)
+        self.assertIn('blog_db_queries_total{view="blog-home"}', body)
+        self.assertIn('blog_template_duration_seconds_total{view="blog-home"}', body)
+
+
+class SearchTests(BlogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(username='writer')
+        self.django_post = Post.objects.create(title='Django caching', content='Views and querysets.', author=self.author)
+        self.body_post = Post.objects.create(title='Weekly notes', content='A little about django templates.', author=self.author)
+        Post.objects.create(title='Gardening', content='Tomatoes and beans.', author=self.author)
+
+    def search(self, query):
+        return self.client.get(reverse('blog-search'), {'q': query})
+
+    def test_title_matches_rank_first(self):
+        response = self.search('django')
+        self.assertEqual(list(response.context['posts']), [self.django_post, self.body_post])
+        self.assertEqual(response.context['paginator'].count, 2)
+
+    def test_every_word_must_match_and_stems_are_found(self):
+        self.assertEqual(list(self.search('django template').context['posts']), [self.body_post])
+        self.assertEqual(list(self.search('tomato').context['posts'])[0].title, 'Gardening')
+
+    def test_index_follows_edits_and_deletes(self):
+        self.django_post.title = 'Flask caching'
+        self.django_post.save()
+        self.assertEqual(list(self.search('django').context['posts']), [self.body_post])
+        self.assertEqual(list(self.search('flask').context['posts']), [self.django_post])
+        self.body_post.delete()
+        self.assertEqual(list(self.search('django').context['posts']), [])
+
+    def test_search_syntax_in_the_query_is_not_interpreted(self):
+        for query in ['"', 'NOT django', 'django*', 'title:', '', '   ']:
+            self.assertEqual(self.search(query).status_code, 200, query)
+
+    def test_page_of_results_costs_few_queries(self):
+        self.create_posts(12, author=self.author)
+        with self.assertMaxQueries(4):
+            response = self.search('content')
+        self.assertEqual(len(response.context['posts']), 5)
+        self.assertEqual(response.context['paginator'].count, 12)
+
+    def test_rebuild_indexes_bulk_created_posts(self):
+        Post.objects.bulk_create([Post(title='Bulk post', content='Imported elsewhere', author=self.author)])
+        self.assertEqual(SearchResults('imported').count(), 0)
+        rebuild_index()
+        self.assertEqual(SearchResults('imported').count(), 1)
+
+    def test_rows_of_posts_deleted_behind_the_orm_are_pruned_on_migrate(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM blog_post WHERE id = %s", [self.django_post.pk])
+        self.assertEqual(SearchResults('caching').count(), 1)
+        create_index()
+        self.assertEqual(SearchResults('caching').count(), 0)
+        self.assertEqual(SearchResults('django').count(), 1)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs the Postgres tsvector index')
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, BACKGROUND_TASKS_EAGER=True)
+class PostgresSearchIndexTests(TransactionTestCase):
+    # Commits for real, so the post_delete cleanup and the teardown flush (TRUNCATE) both run against the index
+
+    @classmethod
+    def setUpClass(cls):
+        os.makedirs(MEDIA_ROOT, exist_ok=True)
+        Image.new('RGB', (10, 10)).save(os.path.join(MEDIA_ROOT, 'default.jpg'))
+        super().setUpClass()
+
+    def index_rows(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT post_id FROM {SEARCH_TABLE} ORDER BY post_id")
+            return [row[0] for row in cursor.fetchall()]
+
+    def test_deleted_posts_leave_the_index(self):
+        author = User.objects.create_user(username='writer')
+        kept = Post.objects.create(title='Django caching', content='Views.', author=author)
+        dropped = Post.objects.create(title='Django search', content='Indexes.', author=author)
+        self.assertEqual(self.index_rows(), [kept.pk, dropped.pk])
+        dropped.delete()
+        self.assertEqual(self.index_rows(), [kept.pk])
+        self.assertEqual(SearchResults('django')[0:10], [kept])
+        author.delete()
+        self.assertEqual(self.index_rows(), [])
+
+    def test_flush_truncates_posts_and_prunes_the_index(self):
+        author = User.objects.create_user(username='writer')
+        Post.objects.create(title='Django caching', content='Views.', author=author)
+        call_command('flush', interactive=False, verbosity=0)
+        self.assertFalse(Post.objects.exists())
+        self.assertEqual(self.index_rows(), [])
+
+
+class MarkdownRenderingTests(BlogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(username='writer')
+
+    def test_content_is_rendered_and_sanitized_on_save(self):
+        post = Post.objects.create(
+            title='Tips', author=self.author,
+            content='# Tips\n\nSome **bold** advice.\n\n<script>alert(1)</script>\n\n[link](javascript:alert(1))',
+        )
+        self.assertIn('<h1>Tips</h1>', post.content_html)
+        self.assertIn('<strong>bold</strong>', post.content_html)
+        self.assertNotIn('<script', post.content_html)
+        self.assertNotIn('javascript:', post.content_html)
+        self.assertEqual(post.render_version, rendering.RENDERER_VERSION)
+
+        response = self.client.get(reverse('post-detail', args=[post.pk]))
+        self.assertContains(response, '<strong>bold</strong>', html=True)
+
+    def test_unrendered_rows_show_their_text_escaped(self):
+        post = Post.objects.create(title='Old', author=self.author, content='x')
+        Post.objects.filter(pk=post.pk).update(content='1 < 2\n\n<b>not bold</b>', content_html='')
+        response = self.client.get(reverse('post-detail', args=[post.pk]))
+        self.assertContains(response, '<p>1 &lt; 2</p>', html=True)
+        self.assertContains(response, '&lt;b&gt;not bold&lt;/b&gt;')
+        self.assertNotContains(response, '&lt;p&gt;')
+
+    def test_only_changed_content_is_rendered_again(self):
+        post = Post.objects.create(title='Tips', content='*one*', author=self.author)
+        with mock.patch('blog.rendering.render_markdown', wraps=rendering.render_markdown) as render:
+            post.title = 'New title'
+            post.save()
+            render.assert_not_called()
+            post.content = '*two*'
+            post.save(update_fields=['content'])
+            render.assert_called_once()
+        post.refresh_from_db()
+        self.assertEqual(post.content_html, '<p><em>two</em></p>')
+
+    def test_render_posts_backfills_stale_posts(self):
+        old, current = Post.objects.bulk_create([
+            Post(title='Old', content='**old**', author=self.author),
+            Post(title='Current', content='**current**', author=self.author),
+        ])
+        rendering.render_post(current)
+        current.save()
+        # Not rendered yet: pages fall back to the plain text
+        self.assertEqual(Post.objects.get(pk=old.pk).body_html, '<p>**old**</p>')
+
+        with mock.patch('blog.management.commands.render_posts.save_rendered',
+                        wraps=render_posts.save_rendered) as save_rendered:
+            call_command('render_posts', workers=1, stdout=StringIO())
+        self.assertEqual([row[0] for row in save_rendered.call_args.args[0]], [old.pk])
+        self.assertEqual(Post.objects.get(pk=old.pk).content_html, '<p><strong>old</strong></p>')
+
+    def test_rows_edited_while_rendering_are_left_alone(self):
+        post = Post.objects.create(title='Tips', content='first', author=self.author)
+        rows = rendering.render_batch([(post.pk, 'stale text')])
+        self.assertEqual(render_posts.save_rendered(rows), 0)
+        self.assertEqual(Post.objects.get(pk=post.pk).content_html, '<p>first</p>')
+
+
+class ExcerptTests(BlogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(username='writer')
+
+    def test_excerpt_is_plain_text_without_the_title_heading(self):
+        post = Post.objects.create(
+            title='Tips', author=self.author,
+            content='# Tips\n\nSome **bold** & useful advice. ' + 'word ' * 100,
+        )
+        self.assertTrue(post.excerpt.startswith('Some bold & useful advice.'))
+        self.assertEqual(len(post.excerpt.split()), rendering.EXCERPT_WORDS)
+
+    def test_list_pages_never_load_the_article_body(self):
+        self.create_posts(6, author=self.author)
+        for url in [reverse('blog-home'), reverse('user-posts', args=['writer']), reverse('blog-search') + '?q=post']:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertContains(response, 'Some content Some content')
+            post_queries = [q['sql'] for q in queries if 'FROM "blog_post"' in q['sql']]
+            self.assertTrue(post_queries, url)
+            for sql in post_queries:
+                self.assertNotIn('"blog_post"."content"', sql)
+                self.assertNotIn('"blog_post"."content_html"', sql)
+
+    def test_unrendered_rows_fall_back_to_their_content(self):
+        post = Post.objects.create(title='Old', author=self.author, content='x')
+        Post.objects.filter(pk=post.pk).update(content='# Old\n\nLegacy **text** here.', excerpt='', content_html='')
+        for url in [reverse('blog-home'), reverse('user-posts', args=['writer']), reverse('blog-search') + '?q=old',
+                    reverse('posts-rss')]:
+            self.assertContains(self.client.get(url), 'Legacy text here.', msg_prefix=url)
+
+
+class FeedTests(BlogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.ann = User.objects.create_user(username='ann')
+        self.bob = User.objects.create_user(username='bob')
+        self.create_posts(2, author=self.ann)
+        self.create_posts(1, author=self.bob)
+
+    def test_feeds_list_posts_and_are_served_from_cache(self):
+        for name, item in [('posts-rss', '<item>'), ('posts-atom', '<entry>')]:
+            response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content.decode().count(item), 3)
+            self.assertIn('Last-Modified', response)
+            with self.assertNumQueries(0):
+                cached = self.client.get(reverse(name))
+            self.assertEqual(cached.content, response.content)
+
+    def test_unchanged_feed_answers_not_modified(self):
+        last_modified = self.client.get(reverse('posts-rss'))['Last-Modified']
+        response = self.client.get(reverse('posts-rss'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_deleted_post_is_not_revalidated_away(self):
+        response = self.client.get(reverse('posts-rss'))
+        Post.objects.filter(author=self.bob).delete()
+        with mock.patch('blog.feeds.time.time', return_value=time.time() + 5):
+            rebuilt = self.client.get(reverse('posts-rss'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(rebuilt.status_code, 200)
+        self.assertEqual(rebuilt.content.decode().count('<item>'), 2)
+        self.assertEqual(self.client.get(reverse('posts-rss'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        self.assertEqual(self.client.get(reverse('posts-rss'), HTTP_IF_NONE_MATCH=rebuilt['ETag']).status_code, 304)
+
+    def test_publishing_only_regenerates_the_affected_feeds(self):
+        ann_feed = reverse('user-posts-rss', args=['ann'])
+        bob_feed = reverse('user-posts-rss', args=['bob'])
+        self.client.get(ann_feed)
+        self.client.get(bob_feed)
+        Post.objects.create(title='Fresh from ann', content='New', author=self.ann)
+        with self.assertNumQueries(0):
+            self.assertNotContains(self.client.get(bob_feed), 'Fresh from ann')
+        self.assertContains(self.client.get(ann_feed), 'Fresh from ann')
+        self.assertContains(self.client.get(reverse('posts-rss')), 'Fresh from ann')
+
+    def test_unknown_author_feed_is_not_found(self):
+        self.assertEqual(self.client.get(reverse('user-posts-atom', args=['nobody'])).status_code, 404)
+
+
+@mock.patch('blog.caching.SITEMAP_SHARD_SIZE', 2)
+@mock.patch('blog.feeds.SITEMAP_SHARD_SIZE', 2)
+class SitemapTests(BlogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.posts = self.create_posts(5, author=User.objects.create_user(username='writer'))
+
+    def shard_of(self, post):
+        return (post.pk - 1) // 2 + 1
+
+    def test_index_lists_one_shard_per_id_range(self):
+        response = self.client.get(reverse('sitemap'))
+        shards = sorted({self.shard_of(post) for post in self.posts})
+        for shard in shards:
+            self.assertContains(response, reverse('sitemap-posts', args=[shard]))
+        self.assertEqual(response.content.decode().count('<sitemap>'), len(shards))
+
+        first = self.client.get(reverse('sitemap-posts', args=[shards[0]]))
+        in_first = [post for post in self.posts if self.shard_of(post) == shards[0]]
+        self.assertEqual(first.content.decode().count('<url>'), len(in_first))
+        self.assertContains(first, in_first[0].get_absolute_url())
+
+    def test_new_post_leaves_older_shards_cached(self):
+        first_shard = self.shard_of(self.posts[0])
+        self.client.get(reverse('sitemap-posts', args=[first_shard]))
+        new = Post.objects.create(title='New', content='New', author=self.posts[0].author)
+        self.assertNotEqual(self.shard_of(new), first_shard)
+        with self.assertNumQueries(0):
+            self.client.get(reverse('sitemap-posts', args=[first_shard]))
+        self.assertContains(self.client.get(reverse('sitemap')), reverse('sitemap-posts', args=[self.shard_of(new)]))
+
+
+class ConditionalGetTests(BlogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(username='writer')
+        self.post = self.create_posts(1, author=self.author)[0]
+        self.url = reverse('post-detail', args=[self.post.pk])
+
+    def test_detail_revalidates_with_etag_without_queries(self):
+        response = self.client.get(self.url)
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(0):
+            revalidated = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated['ETag'], response['ETag'])
+
+        self.post.title = 'Edited'
+        self.post.save(update_fields=['title'])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_if_modified_since_alone_sees_changes_outside_the_post(self):
+        last_modified = self.client.get(self.url)['Last-Modified']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        # A new post changes the sidebar of this page but not its updated_at
+        with mock.patch('blog.caching.time.time', return_value=time.time() + 5):
+            self.create_posts(1)
+            response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+
+    def test_lists_use_etags_that_change_with_new_posts(self):
+        response = self.client.get(reverse('blog-home'))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('blog-home'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.create_posts(1, author=self.author)
+        self.assertEqual(self.client.get(reverse('blog-home'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_author_rename_or_new_avatar_changes_the_etag(self):
+        etag = self.client.get(reverse('blog-home'))['ETag']
+        self.author.last_login = timezone.now()
+        self.author.save(update_fields=['last_login'])
+        self.assertEqual(self.client.get(reverse('blog-home'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.author.username = 'renamed'
+        self.author.save()
+        response = self.client.get(reverse('blog-home'), HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, reverse('user-posts', args=['renamed']))
+
+        etag = response['ETag']
+        profile = Profile.objects.get(user=self.author)
+        profile.image_variants = {'65': {'jpg': 'profile_pics/new.jpg', 'webp': 'profile_pics/new.webp'}}
+        profile.save(update_fields=['image_variants'])
+        self.assertEqual(self.client.get(reverse('blog-home'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_changes_once_the_avatar_variants_exist(self):
+        profile = Profile.objects.get(user=self.author)
+        upload = BytesIO()
+        Image.new('RGB', (400, 300), 'red').save(upload, 'PNG')
+        with self.captureOnCommitCallbacks(execute=False):
+            profile.image = SimpleUploadedFile('new.png', upload.getvalue(), content_type='image/png')
+            profile.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, 'default.jpg')
+        process_profile_image(profile.pk)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '_65.webp')
+
+    def test_new_release_changes_the_etag(self):
+        self.addCleanup(release_version.cache_clear)
+        etag = self.client.get(self.url)['ETag']
+        with self.settings(RELEASE_VERSION='next'):
+            release_version.cache_clear()
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_signed_in_pages_are_not_validated(self):
+        self.client.force_login(self.author)
+        self.assertNotIn('ETag', self.client.get(self.url))
+
+    def test_updated_at_moves_on_every_write_path(self):
+        before = self.post.updated_at
+        Post.objects.filter(pk=self.post.pk).update(render_version=0)
+        call_command('render_posts', workers=1, stdout=StringIO())
+        rendered = Post.objects.get(pk=self.post.pk).updated_at
+        self.assertGreater(rendered, before)
+        self.post.refresh_from_db()
+        self.post.title = 'Edited'
+        self.post.save(update_fields=['title'])
+        self.assertGreater(Post.objects.get(pk=self.post.pk).updated_at, rendered)
+        self.assertIsNotNone(Post.objects.bulk_create([Post(title='Bulk', content='x', author=self.author)])[0].updated_at)
+
+
+class LazyClientTests(SimpleTestCase):
+
+    def tearDown(self):
+        clients.reset()
+
+    def test_clients_are_built_once_on_first_use(self):
+        built = []
+        clients.provider('counting')(lambda: built.append(1) or object())
+        self.addCleanup(clients._providers.pop, 'counting')
+        self.assertFalse(clients.is_loaded('counting'))
+        first = clients.get('counting')
+        self.assertIs(clients.get('counting'), first)
+        self.assertEqual(built, [1])
+        clients.reset('counting')
+        self.assertIsNot(clients.get('counting'), first)
+        with self.assertRaises(ValueError):
+            clients.get('nope')
+
+    def test_worker_boots_without_keys_or_client_libraries(self):
+        sample = boot_once(without_keys=True, importtime=True)
+        self.assertEqual(sample['heavy'], [])
+        self.assertGreater(sample['rss_mb'], 0)
+        self.assertIn('django', [row['module'] for row in slowest_imports(sample['importtime'], top=50)])
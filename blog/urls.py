@@ -2,11 +2,20 @@ from django.urls import path
 from .views import PostListView, PostDetailView, PostCreateView, PostUpdateView, PostDeleteView, UserPostListView
 from . import views
 from .blogcraft_views import BlogCraftView  # updating the import
+from . import stream_views
+from . import feeds
 
 urlpatterns = [
     path('', PostListView.as_view(), name='blog-home'),
     path('user/<str:username>', UserPostListView.as_view(), name='user-posts'),
+    path('user/<str:username>/rss/', feeds.author_feed, {'feed_format': 'rss'}, name='user-posts-rss'),
+    path('user/<str:username>/atom/', feeds.author_feed, {'feed_format': 'atom'}, name='user-posts-atom'),
+    path('feed/rss/', feeds.posts_feed, {'feed_format': 'rss'}, name='posts-rss'),
+    path('feed/atom/', feeds.posts_feed, {'feed_format': 'atom'}, name='posts-atom'),
+    path('sitemap.xml', feeds.sitemap_index, name='sitemap'),
+    path('sitemap-posts-<int:shard>.xml', feeds.sitemap_shard, name='sitemap-posts'),
     path('post/<int:pk>/', PostDetailView.as_view(), name='post-detail'),
+    path('search/', views.PostSearchView.as_view(), name='blog-search'),
     path('post/new/', PostCreateView.as_view(), name='post-create'),
     path('post/<int:pk>/update/', PostUpdateView.as_view(), name='post-update'),
     path('post/<int:pk>/delete/', PostDeleteView.as_view(), name='post-delete'),
@@ -14,5 +23,9 @@ urlpatterns = [
     path('generate/', views.GenerateBlogView.as_view(), name='blog-generate'),
     path('auto-schedule/', views.auto_schedule, name='auto-schedule'),
     path('auto-schedule/delete/<int:pk>/', views.delete_scheduled_post, name='delete-scheduled-post'),
+    path('generate/jobs/<int:pk>/', views.generation_job_status, name='generation-job'),
+    path('cache/stats/', views.cache_stats, name='cache-stats'),
+    path('metrics/', views.metrics, name='metrics'),
     path('blogcraft/', BlogCraftView.as_view(), name='blogcraft'),  #Updated name and path
+    path('blogcraft/stream/', stream_views.blogcraft_stream, name='blogcraft-stream'),
 ]
@@ -1,54 +1,79 @@
 from django.shortcuts import render, get_object_or_404, redirect
-import requests 
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.models import User
-from .models import Post, ScheduledPost
+from .models import LIST_DEFERRED_FIELDS, Post, ScheduledPost
+from .caching import (
+    AnonymousPageCacheMixin, get_latest_posts, page_cache_stats,
+    LIST_PAGES_VERSION_KEY, AUTHOR_PAGES_VERSION_KEY, POST_PAGES_VERSION_KEY,
+)
+from .pagination import KeysetPaginationMixin
+from .search import SearchResults
+from . import clients
+from .airtable_sync import mirror_records
+from .grammar import fix_grammar
+from .drafts import GENERATE_DRAFTS, clear_drafts, load_drafts, push_draft
+from .jobs import enqueue_generation, expire_stale_jobs, sync_generation_job
+from .http_client import http_stats
+from .llm_cache import llm_cache_stats
+from .metrics import prometheus_text
+from .models import GenerationJob
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
 from django import forms 
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, View
-import google.generativeai as genai
-from decouple import config
-from pyairtable import Table
 from datetime import datetime
 
-# Loading Airtable configuration
-AIRTABLE_API_KEY = config('AIRTABLE_API_KEY')
-AIRTABLE_BASE_ID = "appxq6U5GJiWQ2CF5"
-AIRTABLE_TABLE_NAME = "Blog Posts"
-
-# Connecting to Airtable
-airtable = Table(AIRTABLE_API_KEY, AIRTABLE_BASE_ID, AIRTABLE_TABLE_NAME)
-
 def home(request):
-    context = {
-        'posts': Post.objects.all()
-    }
-    return render(request, 'blog/home.html', context)
+    # Kept for old links; it used to render every post on one page
+    return PostListView.as_view()(request)
 
-class PostListView(ListView):
+class PostListView(AnonymousPageCacheMixin, KeysetPaginationMixin, ListView):
     model = Post
     template_name = 'blog/home.html'
     context_object_name = 'posts'
     ordering = ['-date_posted']
     paginate_by = 5
-    
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['latest_posts'] = Post.objects.all().order_by('-date_posted')[:5]
-        return context
+    page_cache_scope = 'list'
+    page_cache_version_key = LIST_PAGES_VERSION_KEY
 
-class UserPostListView(ListView):
+    def get_queryset(self):
+        # Loading authors and their profiles in the same query, home.html needs both for every row;
+        # the article body stays behind, lists only show the stored excerpt
+        return super().get_queryset().select_related('author__profile').defer(*LIST_DEFERRED_FIELDS)
+
+class UserPostListView(AnonymousPageCacheMixin, KeysetPaginationMixin, ListView):
     model = Post
     template_name = 'blog/user_posts.html'
     context_object_name = 'posts'
     paginate_by = 5
+    keyset_count = True  # shown in the page heading, cheap since it is scoped to one author
+    page_cache_scope = 'author:{username}'
+    page_cache_version_key = AUTHOR_PAGES_VERSION_KEY
     
     def get_queryset(self):
         user = get_object_or_404(User, username=self.kwargs.get('username'))
-        return Post.objects.filter(author=user).order_by('-date_posted')
+        return (Post.objects.filter(author=user).select_related('author__profile')
+                .defer(*LIST_DEFERRED_FIELDS).order_by('-date_posted'))
     
-class PostDetailView(DetailView):
+class PostSearchView(ListView):
+    template_name = 'blog/search.html'
+    context_object_name = 'posts'
+    paginate_by = 5
+
+    def get_queryset(self):
+        # Ranked by the full-text index (blog/search.py), never a LIKE scan over content
+        return SearchResults(self.request.GET.get('q', '').strip())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.object_list.query
+        return context
+
+class PostDetailView(AnonymousPageCacheMixin, DetailView):
     model = Post
-    
+    page_cache_scope = 'post:{pk}'
+    page_cache_version_key = POST_PAGES_VERSION_KEY
+
 class PostCreateView(LoginRequiredMixin, CreateView):
     model = Post
     fields = ['title', 'content']
@@ -84,12 +109,12 @@ class PostDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
 def about(request):
     return render(request, 'blog/about.html', {'title': 'About'})
 
-genai.configure(api_key=config('GEMINI_API_KEY'))
 class GenerateBlogView(LoginRequiredMixin, View):
     template_name = 'blog/generate.html'
 
     def get(self, request):
-        drafts = request.session.get('drafts', [])
+        pending_job = sync_generation_job(request)
+        drafts = load_drafts(request.session, GENERATE_DRAFTS)
         topic = request.GET.get('topic', request.session.get('topic', ''))
         primary_keyword = request.GET.get('primary_keyword', request.session.get('primary_keyword', ''))
         additional_keywords = request.GET.get('additional_keywords', request.session.get('additional_keywords', ''))
@@ -102,6 +127,8 @@ class GenerateBlogView(LoginRequiredMixin, View):
             'prompt_3': request.session.get('prompt_3', ''),
             'prompt_4': request.session.get('prompt_4', ''),
             'drafts': drafts,
+            'pending_job': pending_job,
+            'error': request.session.pop('error', ''),
         })
     def post(self, request):
         topic = request.POST.get('topic')
@@ -112,25 +139,36 @@ class GenerateBlogView(LoginRequiredMixin, View):
         prompt_3 = request.POST.get('prompt_3')
         prompt_4 = request.POST.get('prompt_4')
         action = request.POST.get('action')
-        drafts = request.session.get('drafts', [])
+        pending_job = sync_generation_job(request)
+        drafts = load_drafts(request.session, GENERATE_DRAFTS)
         print(f"Action: {action}, Drafts before: {drafts}")
 
+        if pending_job is not None:
+            return render(request, self.template_name, {
+                'topic': topic,
+                'primary_keyword': primary_keyword,
+                'additional_keywords': additional_keywords,
+                'prompt_1': prompt_1,
+                'prompt_2': prompt_2,
+                'prompt_3': prompt_3,
+                'prompt_4': prompt_4,
+                'drafts': drafts,
+                'pending_job': pending_job,
+                'error': 'Your draft is still being generated. Please wait for it to finish.'
+            })
+
         if action == 'generate':
             drafts = []
             prompt = (
                 f"{prompt_1} Ensure the article is 500 words and uses the primary keyword '{primary_keyword}' "
                 f"5-10 times (1-2% density) for SEO. Include additional keywords '{additional_keywords}' naturally."
             )
-            model = genai.GenerativeModel('gemini-1.5-flash')
-            response = model.generate_content(prompt)
-            draft_1 = response.text
-            drafts.append({'prompt': prompt_1, 'content': draft_1})
-            request.session['drafts'] = drafts
+            clear_drafts(request.session, GENERATE_DRAFTS)
             request.session['topic'] = topic
             request.session['primary_keyword'] = primary_keyword
             request.session['additional_keywords'] = additional_keywords
             request.session['prompt_1'] = prompt_1
-            request.session.modified = True
+            enqueue_generation(request, 'generate', action, prompt, label=prompt_1)
 
         elif action == 'refine_2':
             if not drafts:
@@ -154,13 +192,8 @@ class GenerateBlogView(LoginRequiredMixin, View):
                 })
             prev_draft = drafts[-1]['content']
             prompt = f"Refine this 500-word article: '{prev_draft}' based on feedback: '{prompt_2}'. Maintain keyword density and length."
-            model = genai.GenerativeModel('gemini-1.5-flash')
-            response = model.generate_content(prompt)
-            draft_2 = response.text
-            drafts.append({'prompt': prompt_2, 'content': draft_2})
-            request.session['drafts'] = drafts
             request.session['prompt_2'] = prompt_2
-            request.session.modified = True
+            enqueue_generation(request, 'generate', action, prompt, label=prompt_2)
 
         elif action == 'refine_3':
             if not drafts or len(drafts) < 2:
@@ -187,13 +220,8 @@ class GenerateBlogView(LoginRequiredMixin, View):
                 })
             prev_draft = drafts[-1]['content']
             prompt = f"Refine this 500-word article: '{prev_draft}' based on feedback: '{prompt_3}'. Maintain keyword density and length."
-            model = genai.GenerativeModel('gemini-1.5-flash')
-            response = model.generate_content(prompt)
-            draft_3 = response.text
-            drafts.append({'prompt': prompt_3, 'content': draft_3})
-            request.session['drafts'] = drafts
             request.session['prompt_3'] = prompt_3
-            request.session.modified = True
+            enqueue_generation(request, 'generate', action, prompt, label=prompt_3)
 
         elif action == 'refine_4':
             if not drafts or len(drafts) < 3:
@@ -220,13 +248,8 @@ class GenerateBlogView(LoginRequiredMixin, View):
                 }) 
             prev_draft = drafts[-1]['content']
             prompt = f"Refine this 500-word article: '{prev_draft}' based on feedback: '{prompt_4}'. Maintain the same keyword density and word length untill explicitly mentioned by the user."
-            model = genai.GenerativeModel('gemini-1.5-flash')
-            response = model.generate_content(prompt)
-            draft_4 = response.text
-            drafts.append({'prompt': prompt_4, 'content': draft_4})
-            request.session['drafts'] = drafts
             request.session['prompt_4'] = prompt_4
-            request.session.modified = True
+            enqueue_generation(request, 'generate', action, prompt, label=prompt_4)
               
         elif action == 'check_grammar':
             if not drafts or len(drafts) < 4:
@@ -257,33 +280,17 @@ class GenerateBlogView(LoginRequiredMixin, View):
                     'error': 'Grammar already checked for this draft.'
                 })
             final_draft = drafts[-1]['content']
-            url = "https://api.languagetool.org/v2/check"
-            data = {
-                'text': final_draft,
-                'language': 'en-US'
-            }
             try:
-                response = requests.post(url, data=data)
-                result = response.json()
-                matches = result.get('matches', [])
-                if matches:
-                    fixed_text = final_draft
-                    offset_shift = 0
-                    for match in matches:
-                        start = match['offset'] + offset_shift
-                        length = match['length']
-                        replacement = match['replacements'][0]['value'] if match['replacements'] else fixed_text[start:start+length]
-                        fixed_text = fixed_text[:start] + replacement + fixed_text[start+length:]
-                        offset_shift += len(replacement) - length
-                    drafts.append({'prompt': 'AI Grammar Zap', 'content': fixed_text})
-                    grammar_result = f"Applied {len(matches)} grammar fixes."
+                fixed_text, fixes = fix_grammar(final_draft)
+                if fixes:
+                    push_draft(request.session, request.user, GENERATE_DRAFTS, fixed_text, label='AI Grammar Zap')
+                    grammar_result = f"Applied {fixes} grammar fixes."
                 else:
-                    drafts.append({'prompt': 'AI Grammar Zap', 'content': final_draft})
+                    push_draft(request.session, request.user, GENERATE_DRAFTS, final_draft, label='AI Grammar Zap')
                     grammar_result = "No grammar issues found."
             except Exception as e:
                 grammar_result = f"Grammar check failed: {str(e)}"
-                drafts.append({'prompt': 'AI Grammar Zap', 'content': final_draft})
-            request.session['drafts'] = drafts 
+                push_draft(request.session, request.user, GENERATE_DRAFTS, final_draft, label='AI Grammar Zap')
             request.session['grammar_checked'] = True
             request.session['grammar_result'] = grammar_result
             request.session.modified = True
@@ -323,7 +330,7 @@ class GenerateBlogView(LoginRequiredMixin, View):
                 primary_keyword=primary_keyword,
                 additional_keywords=additional_keywords
             ).delete()
-            request.session['drafts'] = []
+            clear_drafts(request.session, GENERATE_DRAFTS)
             request.session['topic'] = ''
             request.session['primary_keyword'] = ''
             request.session['additional_keywords'] = ''
@@ -374,9 +381,9 @@ class GenerateBlogView(LoginRequiredMixin, View):
 
             try:
                 # Saving the record to Airtable
-                airtable.create(record)
+                mirror_records([clients.get('airtable').create(record)])
                 # Clearing session data
-                request.session['drafts'] = []
+                clear_drafts(request.session, GENERATE_DRAFTS)
                 request.session['topic'] = ''
                 request.session['primary_keyword'] = ''
                 request.session['additional_keywords'] = ''
@@ -466,9 +473,9 @@ class GenerateBlogView(LoginRequiredMixin, View):
 
             try:
                 # Saving the record onto Airtable
-                airtable.create(record)
+                mirror_records([clients.get('airtable').create(record)])
                 # Clearing the session data 
-                request.session['drafts'] = []
+                clear_drafts(request.session, GENERATE_DRAFTS)
                 request.session['topic'] = ''
                 request.session['primary_keyword'] = ''
                 request.session['additional_keywords'] = ''
@@ -493,6 +500,8 @@ class GenerateBlogView(LoginRequiredMixin, View):
                     'error': f"Error saving to Airtable: {str(e)}"
                 })
 
+        pending_job = sync_generation_job(request)
+        drafts = load_drafts(request.session, GENERATE_DRAFTS)
         print(f"Drafts after: {drafts}")
         return render(request, self.template_name, {
             'topic': topic,
@@ -505,14 +514,17 @@ class GenerateBlogView(LoginRequiredMixin, View):
             'drafts': drafts,
             'grammar_checked': request.session.get('grammar_checked', False),
             'grammar_result': request.session.get('grammar_result', ''),
+            'pending_job': pending_job,
+            'error': request.session.pop('error', ''),
         })
 
 def sidebar_context(request):
     return {
-        'latest_posts': Post.objects.all().order_by('-date_posted')[:5]
+        'latest_posts': get_latest_posts()
     }
 
 from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import login_required
 
 class ScheduledPostForm(forms.ModelForm):
     class Meta:
@@ -549,3 +561,21 @@ def delete_scheduled_post(request, pk):
         return redirect('blog-home')
     ScheduledPost.objects.filter(id=pk, created_by=request.user).delete()
     return redirect('auto-schedule')
+
+@staff_member_required(login_url='login')
+def cache_stats(request):
+    return JsonResponse({'page_cache': page_cache_stats(), 'llm_cache': llm_cache_stats(), 'http': http_stats()})
+
+def metrics(request):
+    # Prometheus scrapes with the METRICS_TOKEN bearer token; staff can look at it in the browser
+    token = settings.METRICS_TOKEN
+    if not (request.user.is_staff or (token and request.headers.get('Authorization') == f'Bearer {token}')):
+        return HttpResponseForbidden()
+    return HttpResponse(prometheus_text(), content_type='text/plain; version=0.0.4')
+
+@login_required
+def generation_job_status(request, pk):
+    job = get_object_or_404(GenerationJob, pk=pk, user=request.user)
+    if job.is_pending and expire_stale_jobs(pk=job.pk):
+        job.refresh_from_db()
+    return JsonResponse({'status': job.status, 'error': job.error})
@@ -0,0 +1,37 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+# One small thread pool per web worker, shared by the apps for work that shouldn't hold up the
+# response: LLM generation (blog.jobs) and avatar resizing (users.images).
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'LLM_JOB_WORKERS', 4),
+                thread_name_prefix='background-job',
+            )
+    return _executor
+
+
+def _run_in_worker(func, *args):
+    close_old_connections()
+    try:
+        func(*args)
+    finally:
+        close_old_connections()
+
+
+def run_in_background(func, *args):
+    """Runs func(*args) on the worker pool once the current transaction commits."""
+    if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+        func(*args)
+    else:
+        transaction.on_commit(lambda: get_executor().submit(_run_in_worker, func, *args))
@@ -40,12 +40,14 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.sitemaps',
     'django_apscheduler',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Add whitenoise middleware for static files
+    'blog.metrics.PerformanceMiddleware',  # Server-Timing headers and /metrics/, see blog/metrics.py
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -58,7 +60,7 @@ ROOT_URLCONF = 'django_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'blog.metrics.TimedDjangoTemplates',  # DjangoTemplates that reports render time
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -81,10 +83,79 @@ WSGI_APPLICATION = 'django_project.wsgi.application'
 DATABASES = {
     'default': dj_database_url.config(
         default='sqlite:///' + str(BASE_DIR / 'db.sqlite3'),  # Fallback to SQLite for local development
-        conn_max_age=600  # Keep database connections alive for 600 seconds
+        # The app is served over ASGI (see Procfile), where sync code runs in a new thread per request,
+        # so persistent connections would pile up instead of being reused. Close them after each request.
+        conn_max_age=0
     )
 }
 
+# Cache
+# The sidebar and page caches are invalidated from Post signals, so every worker has to share one
+# cache in production (REDIS_URL). The local-memory fallback is per process and only fine for runserver.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Pagination for the post lists: 'keyset' (cursor based, constant cost per page) or 'offset' (numbered pages)
+BLOG_PAGINATION_MODE = os.getenv('BLOG_PAGINATION_MODE', 'keyset')
+
+# LLM generation
+# 'gemini' calls the real API, 'fake' is an offline stand-in for load testing (see blog/llm.py)
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'gemini')
+LLM_FAKE_LATENCY = float(os.getenv('LLM_FAKE_LATENCY', '2'))
+# Threads per web worker that run generation jobs off the request path (see blog/jobs.py)
+LLM_JOB_WORKERS = int(os.getenv('LLM_JOB_WORKERS', '4'))
+# Seconds a job may stay queued or running before it counts as failed (its worker probably
+# restarted), and how long finished jobs are kept before the scheduler deletes them
+LLM_JOB_TIMEOUT = int(os.getenv('LLM_JOB_TIMEOUT', '300'))
+LLM_JOB_RETENTION = int(os.getenv('LLM_JOB_RETENTION', str(60 * 60 * 24)))
+# Gemini quota shared by the threads of one process
+LLM_REQUESTS_PER_MINUTE = int(os.getenv('LLM_REQUESTS_PER_MINUTE', '60'))
+# blog.tasks.process_scheduled_posts: parallel generations per worker, and how long a claimed
+# post waits before another worker may retry it
+SCHEDULED_POSTS_CONCURRENCY = int(os.getenv('SCHEDULED_POSTS_CONCURRENCY', '4'))
+SCHEDULED_POSTS_CLAIM_TIMEOUT = int(os.getenv('SCHEDULED_POSTS_CLAIM_TIMEOUT', '300'))
+# Responses are cached by a hash of (backend, model, prompt, params); BACKEND is 'db', 'file' or 'none'
+LLM_CACHE = {
+    'BACKEND': os.getenv('LLM_CACHE_BACKEND', 'db'),
+    'LOCATION': BASE_DIR / 'llm_cache',  # used by the file backend
+    'TTL': int(os.getenv('LLM_CACHE_TTL', str(60 * 60 * 24 * 7))),
+    'MAX_ENTRIES': int(os.getenv('LLM_CACHE_MAX_ENTRIES', '5000')),
+}
+# Shared client for LanguageTool, Airtable and WordPress calls (blog/http_client.py)
+OUTBOUND_HTTP = {
+    'CONNECT_TIMEOUT': float(os.getenv('HTTP_CONNECT_TIMEOUT', '3.05')),
+    'READ_TIMEOUT': float(os.getenv('HTTP_READ_TIMEOUT', '30')),
+    'RETRIES': int(os.getenv('HTTP_RETRIES', '3')),
+    'BACKOFF': float(os.getenv('HTTP_BACKOFF', '0.5')),
+    'POOL_MAXSIZE': int(os.getenv('HTTP_POOL_MAXSIZE', '10')),
+}
+# blog.cron reads due posts from a local mirror of Airtable; how often to fetch changed records,
+# and how often to rebuild it completely so deleted records drop out
+AIRTABLE_SYNC_INTERVAL = int(os.getenv('AIRTABLE_SYNC_INTERVAL', '300'))
+AIRTABLE_FULL_SYNC_INTERVAL = int(os.getenv('AIRTABLE_FULL_SYNC_INTERVAL', str(60 * 60 * 24)))
+# manage.py start_scheduler: 'due' sleeps until the next publish time, 'cron' polls every minute
+SCHEDULER_MODE = os.getenv('SCHEDULER_MODE', 'due')
+# Run background work inline instead, handy for tests and debugging
+BACKGROUND_TASKS_EAGER = os.getenv('BACKGROUND_TASKS_EAGER', 'False') == 'True'
+# Goes into every page and feed cache key and ETag (blog/caching.py). Set it per deploy, e.g. to
+# the git commit; without it a hash of the templates is used
+RELEASE_VERSION = os.getenv('RELEASE_VERSION', os.getenv('HEROKU_SLUG_COMMIT', ''))
+# Request metrics (blog/metrics.py): how often each worker adds its counters to the shared cache,
+# and the bearer token Prometheus scrapes /metrics/ with (staff can always see it)
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '1'))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 AUTH_PASSWORD_VALIDATORS = [
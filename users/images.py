@@ -0,0 +1,57 @@
+import hashlib
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .models import Profile
+from .signals import profile_image_processed
+
+# Avatars are shown at 65px in post lists and 125px on the profile page; each size is also
+# rendered at 2x. Variants are named after the content hash of the upload, so an unchanged
+# image is never re-encoded and identical uploads (like default.jpg) share their files.
+AVATAR_SIZES = (65, 130, 250)
+VARIANT_FORMATS = {'jpg': ('JPEG', {'quality': 85, 'optimize': True}), 'webp': ('WEBP', {'quality': 80, 'method': 6})}
+VARIANT_PATH = 'profile_pics/variants/{digest}_{size}.{ext}'
+
+
+def image_digest(field):
+    sha = hashlib.sha256()
+    with field.storage.open(field.name, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def render_variants(field, digest):
+    variants = {}
+    with field.storage.open(field.name, 'rb') as f:
+        img = ImageOps.exif_transpose(Image.open(f))
+        img = img.convert('RGB')
+    for size in AVATAR_SIZES:
+        variants[str(size)] = {}
+        thumb = None
+        for ext, (image_format, options) in VARIANT_FORMATS.items():
+            name = VARIANT_PATH.format(digest=digest[:16], size=size, ext=ext)
+            if not default_storage.exists(name):
+                thumb = thumb or ImageOps.fit(img, (size, size), Image.LANCZOS)
+                buffer = BytesIO()
+                thumb.save(buffer, image_format, **options)
+                default_storage.save(name, ContentFile(buffer.getvalue()))
+            variants[str(size)][ext] = name
+    return variants
+
+
+def process_profile_image(profile_id):
+    profile = Profile.objects.filter(pk=profile_id).first()
+    if profile is None or not profile.image or profile.has_default_image():
+        return
+    digest = image_digest(profile.image)
+    if digest == profile.image_hash and profile.image_variants:
+        return
+    variants = render_variants(profile.image, digest)
+    # update() rather than save(), so this doesn't queue itself again
+    updated = Profile.objects.filter(pk=profile_id, image=profile.image.name).update(image_hash=digest, image_variants=variants)
+    if updated:
+        profile_image_processed.send(sender=Profile, user_id=profile.user_id)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from users.images import process_profile_image
+from users.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Builds the avatar variants for profiles that do not have them yet (or all of them with --all)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Re-check every profile; unchanged images are skipped by hash')
+
+    def handle(self, *args, **options):
+        profiles = Profile.objects.exclude(image=Profile._meta.get_field('image').default)
+        if not options['all']:
+            profiles = profiles.filter(image_hash='')
+        count = 0
+        for profile_id in profiles.values_list('pk', flat=True).iterator():
+            try:
+                process_profile_image(profile_id)
+                count += 1
+            except Exception as e:
+                self.stderr.write(f"Profile {profile_id}: {str(e)}")
+        self.stdout.write(self.style.SUCCESS(f"Processed {count} profiles."))
@@ -1,20 +1,74 @@
+import copy
+
 from django.db import models
+from django.db.models.fields.files import FieldFile
 from django.contrib.auth.models import User
-from PIL import Image
+from django_project.background import run_in_background
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     image = models.ImageField(default='default.jpg', upload_to='profile_pics')
-    
+    # Filled in by users.images in the background: sha256 of the image and its resized variants
+    image_hash = models.CharField(max_length=64, blank=True)
+    image_variants = models.JSONField(default=dict, blank=True)
+
     def __str__(self):
         return f'{self.user.username} Profile'
-    
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_loaded_values()
+        return instance
+
+    def _remember_loaded_values(self):
+        self._loaded_values = {}
+        for f in self._meta.concrete_fields:
+            if f.attname in self.__dict__:
+                value = self.__dict__[f.attname]
+                # Files compare by name; copying the FieldFile would drag the whole instance along
+                self._loaded_values[f.attname] = value.name if isinstance(value, FieldFile) else copy.deepcopy(value)
+
+    def changed_fields(self):
+        loaded = getattr(self, '_loaded_values', {})
+        return [
+            f.name for f in self._meta.concrete_fields
+            if not f.primary_key and f.attname in loaded and f.value_from_object(self) != loaded[f.attname]
+        ]
+
     def save(self, *args, **kwargs):
+        # Only write what changed; a save with no changes (e.g. from the User post_save signal) is a no-op
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            changed = self.changed_fields()
+            if not changed:
+                return
+            kwargs['update_fields'] = changed
+        update_fields = kwargs.get('update_fields')
+        image_changed = self._state.adding or 'image' in update_fields
+        if image_changed:
+            self.image_hash = ''
+            self.image_variants = {}
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'image_hash', 'image_variants'}
         super().save(*args, **kwargs)  # Passing args and kwargs to parent class
-        
-        img = Image.open(self.image.path)
-        
-        if img.height > 300 or img.width > 300:
-            output_size = (300,300)
-            img.thumbnail(output_size)
-            img.save(self.image.path)
\ No newline at end of file
+        self._remember_loaded_values()
+
+        if image_changed and not self.has_default_image():
+            # Resizing happens off the request; see users/images.py
+            from .images import process_profile_image
+            run_in_background(process_profile_image, self.pk)
+
+    def has_default_image(self):
+        # default.jpg ships with the site and is served as it is, it's never resized
+        return self.image.name == self.image.field.default
+
+    def avatar(self, size):
+        """(jpeg_url, webp_url) for the smallest variant at least size px wide, or the default image while none exist."""
+        storage = self.image.storage
+        if not self.image_variants:
+            # Never the original upload: it is full size until (or if ever) the worker has resized it
+            return storage.url(self.image.field.default), None
+        sizes = sorted(self.image_variants, key=int)
+        variant_size = next((s for s in sizes if int(s) >= size), sizes[-1])
+        variant = self.image_variants[variant_size]
+        return storage.url(variant['jpg']), storage.url(variant['webp'])
@@ -1,9 +1,15 @@
 from django.db.models.signals import post_save
+from django.dispatch import Signal
 from django.contrib.auth.models import User
 from django.dispatch import receiver
 from .models import Profile
 
 
+# Sent by users.images with the profile's user_id once its avatar variants are written. They are
+# written with update(), so post_save doesn't fire for them.
+profile_image_processed = Signal()
+
+
 #decorators initialized with '@' 
 
 @receiver(post_save, sender=User)
@@ -13,7 +19,11 @@ def create_profile(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=User)
-def save_profile(sender, instance, **kwargs):
+def save_profile(sender, instance, created, **kwargs):
+    # Only a profile already loaded on this user can hold unsaved changes; fetching one here would
+    # cost a query on every login. Profile.save() itself skips the write when nothing changed.
+    if created or not User.profile.is_cached(instance):
+        return
     instance.profile.save()
 
 
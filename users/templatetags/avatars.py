@@ -0,0 +1,22 @@
+from django import template
+
+register = template.Library()
+
+
+@register.inclusion_tag('users/avatar.html')
+def avatar(user, size, css_class=''):
+    """<picture> with WebP and JPEG variants at 1x and 2x, e.g. {% avatar post.author 65 "rounded-circle article-img" %}"""
+    profile = getattr(user, 'profile', None)
+    if profile is None:
+        return {'jpeg': None}
+    jpeg, webp = profile.avatar(size)
+    jpeg_2x, webp_2x = profile.avatar(size * 2)
+    return {
+        'alt': user.username,
+        'css_class': css_class,
+        'size': size,
+        'jpeg': jpeg,
+        'jpeg_2x': jpeg_2x if jpeg_2x != jpeg else None,
+        'webp': webp,
+        'webp_2x': webp_2x if webp_2x != webp else None,
+    }
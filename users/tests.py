@@ -1,3 +1,125 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image
+from django.contrib.auth.models import User
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from . import images
+from .images import AVATAR_SIZES, process_profile_image
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def png_upload(name='avatar.png', size=(800, 600), color='red'):
+    path = os.path.join(MEDIA_ROOT, name)
+    Image.new('RGB', size, color).save(path)
+    with open(path, 'rb') as f:
+        return SimpleUploadedFile(name, f.read(), content_type='image/png')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, BACKGROUND_TASKS_EAGER=True)
+class UsersTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        os.makedirs(MEDIA_ROOT, exist_ok=True)
+        Image.new('RGB', (10, 10)).save(os.path.join(MEDIA_ROOT, 'default.jpg'))
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+class ProfileImageTests(UsersTestCase):
+
+    def test_upload_gets_every_size_in_jpeg_and_webp(self):
+        user = User.objects.create_user(username='ann')
+        user.profile.image = png_upload()
+        user.profile.save()
+        user.profile.refresh_from_db()
+        self.assertEqual(len(user.profile.image_hash), 64)
+        self.assertEqual(sorted(user.profile.image_variants, key=int), [str(size) for size in AVATAR_SIZES])
+        small = user.profile.image_variants['65']
+        with Image.open(os.path.join(MEDIA_ROOT, small['webp'])) as img:
+            self.assertEqual((img.format, img.size), ('WEBP', (65, 65)))
+        with Image.open(os.path.join(MEDIA_ROOT, small['jpg'])) as img:
+            self.assertEqual((img.format, img.size), ('JPEG', (65, 65)))
+
+    def test_unchanged_image_is_not_processed_again(self):
+        user = User.objects.create_user(username='ann')
+        user.profile.image = png_upload()
+        user.profile.save()
+        with mock.patch.object(images, 'render_variants', wraps=images.render_variants) as render:
+            process_profile_image(user.profile.pk)
+        render.assert_not_called()
+
+    def test_default_image_is_never_processed(self):
+        os.remove(os.path.join(MEDIA_ROOT, 'default.jpg'))
+        self.addCleanup(lambda: Image.new('RGB', (10, 10)).save(os.path.join(MEDIA_ROOT, 'default.jpg')))
+        with mock.patch.object(images, 'image_digest') as digest:
+            user = User.objects.create_user(username='ann')
+            process_profile_image(user.profile.pk)
+        digest.assert_not_called()
+        self.assertEqual(user.profile.avatar(65), ('/media/default.jpg', None))
+
+    def test_avatar_tag_serves_small_variants(self):
+        user = User.objects.create_user(username='ann')
+        user.profile.image = png_upload()
+        user.profile.save()
+        user = User.objects.select_related('profile').get(pk=user.pk)
+        html = Template('{% load avatars %}{% avatar user 65 "article-img" %}').render(Context({'user': user}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn('_65.jpg"', html)
+        self.assertIn('_130.webp 2x', html)
+        self.assertNotIn('avatar.png', html)
+
+    def test_unprocessed_upload_shows_the_default_image_not_the_original(self):
+        user = User.objects.create_user(username='ann')
+        with self.settings(BACKGROUND_TASKS_EAGER=False), self.captureOnCommitCallbacks(execute=False):
+            user.profile.image = png_upload()
+            user.profile.save()
+        self.assertEqual(user.profile.image_variants, {})
+        self.assertEqual(user.profile.avatar(65), ('/media/default.jpg', None))
+
+
+class ProfileSaveTests(UsersTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='ann', password='pass')
+
+    def test_login_costs_no_image_io_and_few_queries(self):
+        # Authenticating, the session rotation and the last_login update; nothing for the profile
+        with mock.patch.object(Image, 'open') as image_open, \
+                mock.patch.object(FileSystemStorage, 'open') as storage_open, \
+                self.assertNumQueries(16), CaptureQueriesContext(connection) as queries:
+            self.assertTrue(self.client.login(username='ann', password='pass'))
+        image_open.assert_not_called()
+        storage_open.assert_not_called()
+        self.assertFalse([q['sql'] for q in queries if 'users_profile' in q['sql']])
+
+    def test_saving_an_unchanged_profile_is_free(self):
+        profile = User.objects.select_related('profile').get(pk=self.user.pk).profile
+        with self.assertNumQueries(0):
+            profile.save()
+
+    def test_only_changed_fields_are_written(self):
+        user = User.objects.select_related('profile').get(pk=self.user.pk)
+        user.profile.image = png_upload()
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+        update = next(q['sql'] for q in queries if q['sql'].startswith('UPDATE "users_profile"'))
+        self.assertIn('"image"', update)
+        self.assertNotIn('"user_id"', update)
+        user.profile.refresh_from_db()
+        self.assertTrue(user.profile.image.name.startswith('profile_pics/'))
+        self.assertEqual(len(user.profile.image_hash), 64)